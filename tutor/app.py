@@ -1,46 +1,201 @@
-from flask import Flask, render_template, send_from_directory, send_file, request, jsonify, session
+from flask import Flask, Blueprint, current_app, render_template, send_file, request, jsonify, \
+    session, Response, stream_with_context, make_response
+import datetime
+import json
+import logging
 import os
+import re
+import sqlite3
+import threading
 import uuid
+from werkzeug.local import LocalProxy
 from werkzeug.utils import secure_filename
-from database.database import Database
+from database.database import Database, ScheduleConflict
+from database.profiler import QueryProfiler
 from services.auth_service import AuthService
-# Инициализация БД
-db = Database('database/tutoring.db')
-auth_service = AuthService(db)
-
-# Создаем таблицы при запуске
-db.create_tables()
-db.update_schema()
-# Гарантируем наличие пользователя tutor
-db.ensure_tutor_user()
-
-app = Flask(__name__)
-app.secret_key = 'tutoring-secret-key-2024'
-@app.route('/timetable.js')
-def serve_timetable_js():
-    return send_file('timetable.js', mimetype='application/javascript')
+from services.session_store import SqliteSessionInterface
+from services.data_versions import DataVersions
+from services.events import EventBus, EventLog
+from services.schedule_index import ScheduleIntervalIndex, DAY_MINUTES, DAY_ORDS, LESSON_MINUTES, parse_time, \
+    format_time
+from services.static_assets import StaticAssets
+from services.compression import ResponseCompressor
+from services.logging_setup import configure_logging, SAMPLED
+from services.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, RequestMetrics
+from llm.llm_client import configure_cache, configure_http, get_cache, load_material, stream_test_from_text
+from llm.generation_cache import GenerationCache
+from llm.generation_jobs import GenerationJobQueue, JobQueueFull
+from llm.test_format import QuestionStreamSplitter
+from config import Config, DEV_SECRET_KEY
+
+try:
+    import fcntl
+except ImportError:  # Windows: сервер работает одним процессом, блокировка не нужна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# События, которые получают ученики (только материалы своего репетитора)
+STUDENT_EVENTS = ('material_uploaded', 'material_updated', 'material_deleted')
+
+# Статические файлы: хэши и gzip-варианты считаются один раз при запуске
+STATIC_FILES = ('App.js', 'index.js', 'Cabinet.js', 'cabinet-index.js', 'timetable.js', 'styles.css', 'me.jpg')
+
+bp = Blueprint('tutor', __name__)
+
+
+def _service(name):
+    """Сервис приложения, созданный в create_app()"""
+    return LocalProxy(lambda: current_app.extensions['tutor'][name])
+
+
+event_bus = _service('event_bus')
+db = _service('db')
+auth_service = _service('auth_service')
+job_queue = _service('job_queue')
+data_versions = _service('data_versions')
+schedule_index = _service('schedule_index')
+static_assets = _service('static_assets')
+stream_slots = _service('stream_slots')
+
+
+def _bootstrap(database, queue):
+    """
+    Подготовка базы при запуске: миграции и восстановление прерванных заданий.
+    Процессы сервера выполняют ее по очереди под файловой блокировкой, поэтому
+    миграции применяет первый процесс, а остальным остается проверка версии.
+    """
+    if fcntl is None:
+        database.migrate()
+        queue.recover()
+        return
+
+    with open(f"{database.db_path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            database.migrate()
+            queue.recover()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_app(config=None):
+    """Создание приложения: сервисы по настройкам config (по умолчанию — из переменных окружения)"""
+    config = config or Config.from_env()
+    if not config.secret_key and not (config.debug or config.testing):
+        # С общеизвестным ключом любой может подписать cookie с чужим id сессии
+        raise RuntimeError("Не задан TUTOR_SECRET_KEY: без него приложение запускается только в режимах debug и testing")
+    # Логи пишутся через очередь фоновым потоком; частые сообщения — выборочно
+    configure_logging(config.log_level, sample_every=config.log_sample_every)
+
+    # Шина изменений для ленты /api/events
+    services = {'event_bus': EventBus()}
+    # Профилировщик SQL по запросу; EXPLAIN QUERY PLAN — только в режиме отладки
+    profiler = QueryProfiler(config.sql_slow_ms, explain=config.debug) if config.sql_profile else None
+    services['db'] = Database(config.db_path, busy_timeout_ms=config.busy_timeout_ms,
+                              event_bus=services['event_bus'], profiler=profiler)
+    services['auth_service'] = AuthService(services['db'])
+    # Кэш сгенерированных тестов: LRU в памяти + таблица llm_test_cache
+    configure_cache(GenerationCache(services['db']))
+    configure_http(pool_size=config.http_pool_size, url=config.lm_studio_url)
+    # Очередь фоновой генерации тестов
+    services['job_queue'] = GenerationJobQueue(services['db'], max_workers=config.generation_workers,
+                                               max_pending=config.generation_max_pending)
+    # Потоковая генерация идет в потоке запроса; одновременно — не больше, чем фоновых потоков
+    services['stream_slots'] = threading.BoundedSemaphore(config.generation_workers)
+
+    _bootstrap(services['db'], services['job_queue'])
+
+    # Публикации других процессов сервера приходят в ленту через журнал events
+    services['event_log'] = EventLog(services['db'], services['event_bus'], poll_interval=config.event_poll_interval)
+    services['event_log'].start()
+
+    # Версии данных репетиторов для ETag опрашиваемых API (таблица data_versions, общая для процессов)
+    services['data_versions'] = DataVersions(services['db'])
+    # Индекс занятий по дням недели для проверки пересечений и поиска свободного времени
+    services['schedule_index'] = ScheduleIntervalIndex(services['db'], services['data_versions'])
+
+    app = Flask(__name__)
+    app.secret_key = config.secret_key or DEV_SECRET_KEY
+    app.debug = config.debug
+    app.testing = config.testing
+    app.config['UPLOAD_FOLDER'] = config.upload_folder
+    # Данные сессии хранятся в SQLite, в cookie — только подписанный id
+    app.session_interface = SqliteSessionInterface(services['db'], cache_ttl=config.session_cache_ttl)
+    app.session_interface.start_sweeper()
+
+    assets = services['static_assets'] = StaticAssets(os.path.dirname(os.path.abspath(__file__)), STATIC_FILES)
+    # В шаблонах: {{ asset_url('styles.css') }} -> /assets/styles.<хэш>.css
+    app.jinja_env.globals['asset_url'] = lambda name: assets.url(name, check_mtime=app.debug)
+
+    # Сжатие HTML и JSON ответов (уровень, порог и типы — COMPRESS_* в app.config)
+    app.config['COMPRESS_LEVEL'] = config.compress_level
+    app.config['COMPRESS_MIN_SIZE'] = config.compress_min_size
+    services['compressor'] = ResponseCompressor(app)
+    # Метрики запросов и SQL для /metrics
+    services['request_metrics'] = RequestMetrics(app, services['db'])
+
+    app.extensions['tutor'] = services
+    app.register_blueprint(bp)
+    return app
+
+
+@bp.teardown_app_request
+def release_db_connection(exception=None):
+    """Возврат соединения потока в пул после запроса"""
+    db.release_connection()
+
+
+def _session_tutor_id():
+    """Репетитор, к данным которого относится текущий пользователь"""
+    if session['role'] == 'tutor':
+        return session['user_id']
+    if 'tutor_id' not in session:
+        # Сессии, созданные до появления tutor_id
+        with db.connection() as connection:
+            row = connection.execute("SELECT created_by FROM users WHERE id = ?", (session['user_id'],)).fetchone()
+        session['tutor_id'] = row['created_by'] if row else None
+    return session['tutor_id']
+
+
+def _conditional_response(tutor_id, scope, build):
+    """
+    Ответ с ETag по версии данных репетитора. Если версия клиента актуальна,
+    возвращается 304 после одного чтения версии; иначе ответ строит build().
+    """
+    # Версия читается до построения ответа: изменение во время запроса даст новый ETag в следующий раз
+    etag = data_versions.etag(tutor_id, scope)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200 or response.cache_control.no_store:
+            return response
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def api_login():
     """API endpoint для входа в систему"""
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
 
-    print(f"🔐 Попытка входа: username='{username}', password='{password}'")
-    print(f"🔐 Типы данных: username={type(username)}, password={type(password)}")
-
     success, message, user = auth_service.login(username, password)
 
     if success:
+        # Новый id сессии: id, полученный до входа, не дает доступа к кабинету
+        current_app.session_interface.regenerate(session)
         session['user_id'] = user.id
         session['username'] = user.username
         session['role'] = user.role
         session['first_name'] = user.first_name
         session['last_name'] = user.last_name
+        session['tutor_id'] = user.id if user.role == 'tutor' else user.created_by
 
-        print(f"✅ Успешный вход: {user.role} {user.first_name} (ID: {user.id})")
+        logger.debug("Вход: %s %s (ID: %s)", user.role, user.username, user.id)
         return jsonify({
             'success': True,
             'message': message,
@@ -56,14 +211,15 @@ def api_login():
             'redirect_url': '/tutor-cabinet' if user.role == 'tutor' else '/student-cabinet'
         })
     else:
-        print(f"❌ Ошибка входа: {message}")
+        # Без выборки: каждая неудачная попытка нужна для разбора подбора паролей
+        logger.warning("Неудачный вход %r: %s", username, message)
         return jsonify({
             'success': False,
             'message': message
         }), 401
 
 
-@app.route('/api/logout', methods=['POST'])
+@bp.route('/api/logout', methods=['POST'])
 def api_logout():
     """API endpoint для выхода из системы"""
     session.clear()
@@ -74,7 +230,7 @@ def api_logout():
     })
 
 
-@app.route('/api/check-auth')
+@bp.route('/api/check-auth')
 def check_auth():
     """Проверка статуса аутентификации"""
     if 'user_id' in session:
@@ -91,7 +247,7 @@ def check_auth():
     else:
         return jsonify({'authenticated': False})
 
-@app.route('/api/schedule', methods=['GET'])
+@bp.route('/api/schedule', methods=['GET'])
 def get_schedule():
     """Получение расписания для текущего пользователя"""
     if 'user_id' not in session:
@@ -108,7 +264,42 @@ def get_schedule():
     return jsonify({'schedule': schedule})
 
 
-@app.route('/api/tutor/schedule', methods=['POST'])
+# Самое длинное окно дат, которое разворачивает /api/schedule/occurrences
+MAX_OCCURRENCE_DAYS = 62
+
+
+@bp.route('/api/schedule/occurrences', methods=['GET'])
+def get_schedule_occurrences():
+    """
+    Занятия на конкретные даты: ?from=YYYY-MM-DD&to=YYYY-MM-DD (по умолчанию неделя от from).
+    Каждое занятие содержит date и completed — проведено ли оно.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+
+    try:
+        date_from = (datetime.date.fromisoformat(request.args['from']) if request.args.get('from')
+                     else datetime.date.today())
+        date_to = (datetime.date.fromisoformat(request.args['to']) if request.args.get('to')
+                   else date_from + datetime.timedelta(days=6))
+    except ValueError:
+        return jsonify({'error': 'from и to должны быть в формате YYYY-MM-DD'}), 400
+    if date_to < date_from or (date_to - date_from).days >= MAX_OCCURRENCE_DAYS:
+        return jsonify({'error': f'Окно дат должно быть от 1 до {MAX_OCCURRENCE_DAYS} дней'}), 400
+
+    if session['role'] == 'tutor':
+        occurrences = db.get_schedule_occurrences(date_from, date_to, tutor_id=session['user_id'])
+    else:
+        occurrences = db.get_schedule_occurrences(date_from, date_to, student_id=session['user_id'])
+
+    return jsonify({
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'occurrences': occurrences
+    })
+
+
+@bp.route('/api/tutor/schedule', methods=['POST'])
 def create_schedule():
     """Создание расписания (только для репетитора)"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -125,8 +316,86 @@ def create_schedule():
     return jsonify({'success': True, 'message': 'Расписание создано'})
 
 
+# Сколько вариантов времени проверяется за один запрос
+MAX_SCHEDULE_CANDIDATES = 200
+
+
+@bp.route('/api/tutor/schedule/free-slots', methods=['GET'])
+def api_schedule_free_slots():
+    """
+    Свободное время репетитора: ?day_of_week=monday&from=09:00&to=21:00&duration=60.
+    Без day_of_week ищет по всем дням недели.
+    """
+    if 'user_id' not in session or session['role'] != 'tutor':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    day = request.args.get('day_of_week')
+    if day and day.lower() not in DAY_ORDS:
+        return jsonify({'error': 'Некорректный день недели'}), 400
+    try:
+        window_start = parse_time(request.args.get('from', '09:00'))
+        window_end = parse_time(request.args.get('to', '21:00'), end=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    duration = request.args.get('duration', 60, type=int)
+    if duration <= 0 or window_end <= window_start:
+        return jsonify({'error': 'Некорректный интервал поиска'}), 400
+
+    days = [day.lower()] if day else list(DAY_ORDS)
+    slots = []
+    for day_name in days:
+        for start, end in schedule_index.free_slots(session['user_id'], DAY_ORDS[day_name],
+                                                    window_start, window_end, duration):
+            slots.append({'day_of_week': day_name, 'start_time': format_time(start), 'end_time': format_time(end)})
+
+    return jsonify({'success': True, 'slots': slots})
+
+
+@bp.route('/api/tutor/schedule/check', methods=['POST'])
+def api_schedule_check():
+    """
+    Проверка вариантов времени на пересечения, например при одобрении переносов:
+    {"candidates": [{"day_of_week", "start_time", "end_time", "exclude_schedule_id"}]}.
+    exclude_schedule_id — переносимый слот, который не мешает сам себе.
+    """
+    if 'user_id' not in session or session['role'] != 'tutor':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+
+    candidates = (request.get_json(silent=True) or {}).get('candidates')
+    if not isinstance(candidates, list) or not candidates:
+        return jsonify({'error': 'Передайте непустой список candidates'}), 400
+    if len(candidates) > MAX_SCHEDULE_CANDIDATES:
+        return jsonify({'error': f'Не больше {MAX_SCHEDULE_CANDIDATES} вариантов за запрос'}), 413
+
+    results = []
+    for index, candidate in enumerate(candidates):
+        try:
+            day_ord = DAY_ORDS[str(candidate['day_of_week']).lower()]
+            start = parse_time(candidate['start_time'])
+            end = (parse_time(candidate['end_time'], end=True) if candidate.get('end_time')
+                   else start + LESSON_MINUTES)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            results.append({'index': index, 'ok': False, 'error': 'Некорректный день или время'})
+            continue
+        if end <= start or end > DAY_MINUTES:
+            results.append({'index': index, 'ok': False,
+                            'error': 'Конец занятия должен быть позже начала и не позже 24:00'})
+            continue
+        exclude_id = candidate.get('exclude_schedule_id')
+        if exclude_id is not None:
+            try:
+                exclude_id = int(exclude_id)
+            except (TypeError, ValueError):
+                results.append({'index': index, 'ok': False, 'error': 'Некорректный exclude_schedule_id'})
+                continue
+        conflicts = schedule_index.conflicts(session['user_id'], day_ord, start, end, exclude_id)
+        results.append({'index': index, 'ok': not conflicts, 'conflicts': conflicts})
+
+    return jsonify({'success': True, 'results': results})
+
+
 # Отладочные Routes
-@app.route('/debug/templates')
+@bp.route('/debug/templates')
 def debug_templates():
     """Проверка доступности template файлов"""
     import os
@@ -157,7 +426,7 @@ def debug_templates():
 
     return jsonify(result)
 
-@app.route('/debug/students')
+@bp.route('/debug/students')
 def debug_students():
     """Отладочная страница для проверки учеников"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -171,7 +440,7 @@ def debug_students():
     })
 
 
-@app.route('/api/tutor/delete-student/<int:student_id>', methods=['DELETE'])
+@bp.route('/api/tutor/delete-student/<int:student_id>', methods=['DELETE'])
 def api_delete_student(student_id):
     """API для удаления ученика"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -206,16 +475,18 @@ def api_delete_student(student_id):
 
         connection.commit()
         connection.close()
+        event_bus.publish(session['user_id'], 'student_deactivated', {'student_id': student_id})
+        event_bus.publish(session['user_id'], 'schedule_changed', {'student_id': student_id})
 
-        print(f"✅ Ученик ID {student_id} удален")
+        logger.info("Ученик ID %s удален", student_id)
         return jsonify({'success': True, 'message': 'Ученик успешно удален'})
 
     except Exception as e:
-        print(f"❌ Ошибка при удалении ученика: {e}")
+        logger.error("Ошибка при удалении ученика: %s", e)
         return jsonify({'success': False, 'message': f'Ошибка при удалении ученика: {str(e)}'}), 500
 
 
-@app.route('/debug/files')
+@bp.route('/debug/files')
 def debug_files():
     """Отладочная страница для проверки файлов"""
     import os
@@ -236,7 +507,7 @@ def debug_files():
     return jsonify(result)
 
 
-@app.route('/debug/db')
+@bp.route('/debug/db')
 def debug_db():
     """Отладочная страница для проверки базы данных"""
     try:
@@ -247,16 +518,16 @@ def debug_db():
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = cursor.fetchall()
 
-        # Проверка пользователей
-        cursor.execute("SELECT * FROM users")
-        users = cursor.fetchall()
+        # Число пользователей по ролям (без самих записей: в них пароли)
+        cursor.execute("SELECT role, COUNT(*) AS count FROM users GROUP BY role")
+        users_by_role = {row['role']: row['count'] for row in cursor.fetchall()}
 
         connection.close()
 
         result = {
             'tables': [dict(table) for table in tables],
-            'users': [dict(user) for user in users],
-            'total_users': len(users)
+            'users_by_role': users_by_role,
+            'total_users': sum(users_by_role.values())
         }
 
         return jsonify(result)
@@ -265,20 +536,38 @@ def debug_db():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/tutor-cabinet')
+@bp.route('/metrics')
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@bp.route('/debug/sql')
+def debug_sql():
+    """Отладочная страница: статистика SQL-запросов по отпечаткам (при TUTOR_SQL_PROFILE=1)"""
+    if db.profiler is None:
+        return jsonify({'error': 'Профилирование SQL выключено (TUTOR_SQL_PROFILE=1)'}), 404
+    return jsonify(db.profiler.report(limit=request.args.get('limit', type=int)))
+
+
+@bp.route('/debug/llm-cache')
+def debug_llm_cache():
+    """Отладочная страница: статистика кэша сгенерированных тестов"""
+    return jsonify(get_cache().stats())
+
+
+@bp.route('/tutor-cabinet')
 def tutor_cabinet():
     if 'user_id' not in session or session['role'] != 'tutor':
         return "Доступ запрещен. Только для репетиторов.", 403
 
-    print(f"🔄 Рендеринг tutor_cabinet.html для пользователя {session.get('username')}")
-
     try:
         return render_template('tutor_cabinet.html')
     except Exception as e:
-        print(f"❌ Ошибка при рендеринге шаблона: {e}")
+        logger.error("Ошибка при рендеринге шаблона: %s", e)
         return f"Ошибка загрузки страницы: {e}", 500
 
-@app.route('/student-cabinet')
+@bp.route('/student-cabinet')
 def student_cabinet():
     """Кабинет ученика"""
     if 'user_id' not in session or session['role'] != 'student':
@@ -287,89 +576,151 @@ def student_cabinet():
     try:
         return render_template('student_cabinet.html')
     except Exception as e:
-        print(f"❌ Ошибка при рендеринге шаблона: {e}")
+        logger.error("Ошибка при рендеринге шаблона: %s", e)
         return f"Ошибка загрузки страницы: {e}", 500
 
-@app.route('/tests')
+@bp.route('/tests')
 #тесты
 def tests():
     return render_template('tests.html')
 
-@app.route('/tests/1')
+@bp.route('/tests/1')
 def test_1():
-    """Тест 1 - генерация на основе материала z5.txt"""
+    """Тест 1 - генерация на основе материала z5.txt (вопросы приходят потоком)"""
     if 'user_id' not in session:
         return "Доступ запрещен. Необходима авторизация.", 403
-    
-    try:
-        # Загружаем материал z5.txt
-        # Путь относительно директории, где находится app.py (tutor/)
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        material_path = os.path.join(base_dir, 'llm', 'materials', 'z5.txt')
-        
-        if not os.path.exists(material_path):
-            return f"❌ Файл материала не найден: {material_path}\nТекущая директория: {os.getcwd()}", 404
-        
-        with open(material_path, 'r', encoding='utf-8') as f:
-            material_text = f.read()
-        
-        # Генерируем тест на основе материала
-        print(f"📝 Генерация теста из материала z5.txt...")
-        generated_test = generate_test_from_text(material_text, material_name="z5")
-        
-        # Сохраняем в сессии для отображения
-        session['generated_test'] = generated_test
-        session['test_material'] = material_text
-        session['test_material_name'] = 'z5'
-        
-        return render_template('test_1.html', 
-                             test=generated_test, 
-                             material=material_text,
-                             material_name='z5')
-    
-    except Exception as e:
-        print(f"❌ Ошибка при генерации теста: {e}")
-        import traceback
-        traceback.print_exc()
-        return f"Ошибка при генерации теста: {str(e)}", 500
 
-@app.route('/tests/2')
+    return render_template('test_1.html',
+                           stream_url='/api/tests/stream?material=z5',
+                           material_name='z5')
+
+
+def _sse(event, data):
+    """Одно событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@bp.route('/api/events')
+def api_events():
+    """Лента изменений данных репетитора (Server-Sent Events) вместо периодического опроса"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+
+    tutor_id = _session_tutor_id()
+    events = None if session['role'] == 'tutor' else STUDENT_EVENTS
+    # Поток отдается вне контекста приложения — шина нужна сама по себе, а не через прокси
+    bus = event_bus._get_current_object()
+    subscription = bus.subscribe(tutor_id, events)
+
+    def stream():
+        # При переподключении браузер ждет 5 с; после него страница перечитывает данные сама
+        yield "retry: 5000\n\n"
+        while True:
+            message = subscription.get(timeout=15)
+            if message is None:
+                # Комментарий-пинг держит соединение через прокси и выявляет закрытые вкладки
+                yield ": ping\n\n"
+                continue
+            event, data = message
+            yield _sse(event, data)
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Подписка снимается при закрытии ответа, даже если поток так и не начал отдаваться
+    response.call_on_close(lambda: bus.unsubscribe(subscription))
+    return response
+
+
+@bp.route('/api/tests/stream')
+def api_stream_test():
+    """Потоковая генерация теста по материалу из llm/materials (Server-Sent Events)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+
+    material_name = secure_filename(request.args.get('material', 'z5'))
+    material_text = load_material(f"{material_name}.txt")
+    if material_text.startswith("❌"):
+        return jsonify({'error': material_text}), 404
+
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Слишком много генераций, попробуйте позже'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+
+    user_id = session['user_id']
+    logger.info("Потоковая генерация теста из материала %s.txt", material_name)
+
+    def events():
+        splitter = QuestionStreamSplitter()
+        index = 0
+        for kind, text in stream_test_from_text(material_text, material_name=material_name):
+            if kind == 'progress':
+                # Большой материал: части обрабатываются без токенов, передаем ход работы
+                yield _sse('progress', text)
+                continue
+            if kind == 'delta':
+                yield _sse('token', {'text': text})
+                questions = splitter.feed(text)
+            elif kind == 'done':
+                questions = splitter.finish()
+            else:
+                yield _sse('error', {'message': text})
+                return
+
+            for question in questions:
+                index += 1
+                yield _sse('question', {'index': index, 'text': question})
+
+            if kind == 'done':
+                # Итоговый текст сохраняем как завершенное задание для страницы результата
+                job_id = job_queue.record_finished(material_text, text, material_name=material_name,
+                                                   user_id=user_id)
+                yield _sse('done', {'job_id': job_id, 'redirect': f'/test-result?job={job_id}'})
+
+    slots = stream_slots._get_current_object()
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Место освобождается, когда сервер закрывает поток (в том числе при отключении клиента)
+    response.call_on_close(slots.release)
+    return response
+
+@bp.route('/tests/2')
 def test_2():
     return render_template('test_2.html')
 
-@app.route('/tests/3')
+@bp.route('/tests/3')
 def test_3():
     return render_template('test_3.html')
 
-@app.route('/timetable')
+@bp.route('/timetable')
 #расписание
 def timetable():
     return render_template('timetable.html')
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Главная страница с React приложением"""
     return render_template('index.html')
 
-@app.route('/cabinet')
+@bp.route('/cabinet')
 def cabinet():
     """Страница личного кабинета"""
     return render_template('cabinet.html')
-@app.route('/materials')
+@bp.route('/materials')
 def materials():
     """Страница учебных материалов"""
     if 'user_id' not in session or session['role'] != 'tutor':
         return "Доступ запрещен. Только для репетиторов.", 403
     return render_template('materials.html')
 
-@app.route('/requests')
+@bp.route('/requests')
 def requests():
     """Страница запросов на перенос"""
     if 'user_id' not in session or session['role'] != 'tutor':
         return "Доступ запрещен. Только для репетиторов.", 403
     return render_template('requests.html')
 
-@app.route('/reschedule')
+@bp.route('/reschedule')
 def reschedule():
     """Страница запросов на перенос"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -381,14 +732,14 @@ def reschedule():
     except FileNotFoundError:
         return "Страница запросов на перенос не найдена", 404
 
-@app.route('/add-student')
+@bp.route('/add-student')
 def add_student():
     """Страница добавления нового ученика"""
     if 'user_id' not in session or session['role'] != 'tutor':
         return "Доступ запрещен. Только для репетиторов.", 403
     return render_template('add_student.html')
 
-@app.route('/api/tutor/create-student', methods=['POST'])
+@bp.route('/api/tutor/create-student', methods=['POST'])
 def api_create_student():
     """API для создания нового ученика"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -396,14 +747,30 @@ def api_create_student():
 
     data = request.get_json()
 
-    print(f"📨 Получены данные для создания ученика: {data}")
-
     # Валидация данных
     required_fields = ['last_name', 'first_name', 'birth_date', 'exam_type', 'username', 'password', 'lesson_price', 'day_of_week', 'lesson_time']
     for field in required_fields:
         if not data.get(field):
             return jsonify({'success': False, 'message': f'Поле {field} обязательно'}), 400
 
+    # Занятие длится час, заканчивается до полуночи и не пересекается с другими учениками
+    day_ord = DAY_ORDS.get(str(data['day_of_week']).lower())
+    try:
+        lesson_start = parse_time(data['lesson_time'])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if day_ord is None:
+        return jsonify({'success': False, 'message': 'Некорректный день недели'}), 400
+    if lesson_start + LESSON_MINUTES > DAY_MINUTES:
+        return jsonify({'success': False, 'message': 'Занятие должно закончиться до полуночи'}), 400
+    conflicts = schedule_index.conflicts(session['user_id'], day_ord, lesson_start, lesson_start + LESSON_MINUTES)
+    if conflicts:
+        return jsonify({
+            'success': False,
+            'message': 'Это время уже занято другим занятием',
+            'conflicts': conflicts
+        }), 409
+
     try:
         # Формируем contact_info из даты рождения
         contact_info = f"Дата рождения: {data['birth_date']}"
@@ -423,68 +790,174 @@ def api_create_student():
         )
 
         if student_id:
-            print(f"✅ Ученик успешно создан с ID: {student_id}")
+            logger.info("Ученик создан: ID %s", student_id)
             return jsonify({
                 'success': True,
                 'message': 'Ученик успешно создан',
                 'student_id': student_id
             })
         else:
-            print("❌ Ошибка: не удалось создать ученика")
+            logger.warning("Не удалось создать ученика %r", data['username'])
             return jsonify(
                 {'success': False, 'message': 'Ошибка при создании ученика (возможно, логин уже занят)'}), 500
 
+    except ScheduleConflict as e:
+        # Время заняли после проверки по индексу (например, запрос в другом процессе)
+        return jsonify({'success': False, 'message': str(e), 'conflicts': e.conflicts}), 409
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
     except Exception as e:
-        print(f"❌ Ошибка при создании ученика: {e}")
+        logger.error("Ошибка при создании ученика: %s", e)
         return jsonify({'success': False, 'message': f'Внутренняя ошибка сервера: {str(e)}'}), 500
 
-@app.route('/api/tutor/students')
+@bp.route('/api/tutor/students')
 def api_get_students():
     """API для получения списка учеников репетитора"""
     if 'user_id' not in session or session['role'] != 'tutor':
         return jsonify({'error': 'Доступ запрещен'}), 403
 
-    try:
-        students = db.get_tutor_students(session['user_id'])
-        print(f"✅ Получено учеников: {len(students)}")
-        return jsonify({'success': True, 'students': students})
+    def build():
+        try:
+            students = db.get_tutor_students(session['user_id'])
+            return jsonify({'success': True, 'students': students})
 
-    except Exception as e:
-        print(f"❌ Ошибка при получении учеников: {e}")
-        return jsonify({'success': False, 'message': 'Ошибка при загрузке учеников'}), 500
+        except Exception as e:
+            logger.error("Ошибка при получении учеников: %s", e)
+            return jsonify({'success': False, 'message': 'Ошибка при загрузке учеников'}), 500
+
+    return _conditional_response(session['user_id'], DataVersions.STUDENTS, build)
+
+
+@bp.route('/api/tutor/students/<int:student_id>/progress', methods=['POST'])
+def api_record_progress(student_id):
+    """API для записи результата теста и/или оценки репетитора"""
+    if 'user_id' not in session or session['role'] != 'tutor':
+        return jsonify({'success': False, 'message': 'Доступ запрещен'}), 403
+
+    data = request.get_json() or {}
+    test_score = data.get('test_score')
+    feedback_score = data.get('tutor_feedback_score')
+
+    if test_score is None and feedback_score is None:
+        return jsonify({'success': False, 'message': 'Укажите test_score или tutor_feedback_score'}), 400
+    if test_score is not None:
+        try:
+            test_score = float(test_score)
+        except (TypeError, ValueError):
+            test_score = None
+        if test_score is None or not 0 <= test_score <= 100:
+            return jsonify({'success': False, 'message': 'test_score должен быть от 0 до 100'}), 400
+    if feedback_score is not None:
+        try:
+            feedback_score = int(feedback_score)
+        except (TypeError, ValueError):
+            feedback_score = None
+        if feedback_score not in range(1, 6):
+            return jsonify({'success': False, 'message': 'tutor_feedback_score должен быть от 1 до 5'}), 400
+
+    connection = db.get_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT created_by FROM users WHERE id = ? AND role = 'student'", (student_id,))
+    student = cursor.fetchone()
+    if not student or student['created_by'] != session['user_id']:
+        connection.close()
+        return jsonify({'success': False, 'message': 'Ученик не найден'}), 404
+
+    # По умолчанию — тема активного занятия ученика
+    topic_id = data.get('topic_id')
+    if topic_id is None:
+        cursor.execute("""
+            SELECT topic_id FROM schedule
+             WHERE student_id = ? AND status = 'active'
+             ORDER BY id LIMIT 1
+        """, (student_id,))
+        row = cursor.fetchone()
+        topic_id = row['topic_id'] if row else None
+        if topic_id is None:
+            connection.close()
+            return jsonify({'success': False, 'message': 'У ученика нет темы занятий'}), 400
+    else:
+        try:
+            topic_id = int(topic_id)
+        except (TypeError, ValueError):
+            connection.close()
+            return jsonify({'success': False, 'message': 'Некорректный topic_id'}), 400
+        # Тема должна принадлежать этому репетитору
+        cursor.execute("SELECT created_by FROM topics WHERE id = ?", (topic_id,))
+        topic = cursor.fetchone()
+        if not topic or topic['created_by'] != session['user_id']:
+            connection.close()
+            return jsonify({'success': False, 'message': 'Тема не найдена'}), 404
+    connection.close()
+
+    if not db.record_progress(student_id, topic_id, test_score=test_score, tutor_feedback_score=feedback_score):
+        return jsonify({'success': False, 'message': 'Ошибка записи прогресса'}), 500
+    event_bus.publish(session['user_id'], 'progress_updated', {'student_id': student_id})
+
+    return jsonify({'success': True, 'progress': db.calculate_student_progress(student_id)})
 # =====================================
 # API ДОХОДОВ
 # =====================================
 
-@app.route('/api/income-lessons', methods=['GET'])
+# Размер страницы истории доходов
+INCOME_PAGE_SIZE = 50
+INCOME_MAX_PAGE_SIZE = 200
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+def _income_cursor(lesson):
+    """Ключ продолжения выборки: дата и id последней записи страницы"""
+    return f"{lesson['date']}|{lesson['id']}"
+
+
+@bp.route('/api/income-lessons', methods=['GET'])
 def api_income_get():
+    """
+    Страница проведённых занятий: ?month=YYYY-MM&limit=50&cursor=<next_cursor прошлой страницы>.
+    next_cursor равен null, когда записей больше нет.
+    """
     if 'user_id' not in session or session['role'] != 'tutor':
         return jsonify({'error': 'not authorized'}), 403
 
     tutor_id = session['user_id']
-    lessons = db.get_income_lessons(tutor_id)
-
-    # Приводим ключи к формату, который ждёт фронтенд
-    normalized = []
-    for l in lessons:
-        normalized.append({
-            "id": l.get("id"),
-            "date": l.get("date"),           # уже нормализовано в db.get_income_lessons()
-            "student": l.get("student"),
-            "exam": l.get("exam"),
-            "price": l.get("price"),
-            "status": l.get("status"),
-            "created_at": l.get("created_at")
-        })
+    month = request.args.get('month')
+    if month and not MONTH_PATTERN.match(month):
+        return jsonify({'success': False, 'message': 'month должен быть в формате YYYY-MM'}), 400
+
+    limit = min(max(request.args.get('limit', INCOME_PAGE_SIZE, type=int), 1), INCOME_MAX_PAGE_SIZE)
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        date, _, lesson_id = cursor.rpartition('|')
+        if not date or not lesson_id.isdigit():
+            return jsonify({'success': False, 'message': 'Некорректный cursor'}), 400
+        after = (date, int(lesson_id))
+
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    lessons = db.get_income_lessons(tutor_id, limit=limit + 1, after=after, month=month)
+    has_more = len(lessons) > limit
+    lessons = lessons[:limit]
 
     return jsonify({
         "success": True,
-        "lessons": normalized
+        "lessons": lessons,
+        "next_cursor": _income_cursor(lessons[-1]) if has_more else None
     })
 
 
+@bp.route('/api/income-lessons/summary', methods=['GET'])
+def api_income_summary():
+    """Итоги доходов по месяцам/статусам и по экзаменам, посчитанные в базе"""
+    if 'user_id' not in session or session['role'] != 'tutor':
+        return jsonify({'error': 'not authorized'}), 403
+
+    summary = db.get_income_summary(session['user_id'])
+    return jsonify({"success": True, **summary})
 
-@app.route('/api/income-lessons', methods=['POST'])
+
+@bp.route('/api/income-lessons', methods=['POST'])
 def api_income_add():
     """Добавить новое проведённое занятие"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -503,17 +976,96 @@ def api_income_add():
             status=data.get('status', 'pending')
         )
 
-        print(f"✅ Доход: добавлен урок {lesson_id} для репетитора {tutor_id}")
+        logger.info("Доход: добавлен урок %s для репетитора %s", lesson_id, tutor_id, extra=SAMPLED)
         return jsonify({'success': True, 'lesson_id': lesson_id})
 
     except Exception as e:
         # чтоб не было HTML-500, а всегда JSON
-        print(f"❌ Ошибка в api_income_add: {e}")
+        logger.error("Ошибка в api_income_add: %s", e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
 
-@app.route('/api/income-lessons/<int:lesson_id>/status', methods=['POST'])
+# Сколько занятий принимается за один пакетный запрос
+INCOME_BATCH_LIMIT = 500
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def _parse_income_lesson(item):
+    """Проверка одного занятия из пакета; возвращает (словарь для БД, ошибка)"""
+    if not isinstance(item, dict):
+        return None, 'ожидается объект'
+    client_key = str(item.get('key') or '').strip()
+    if not client_key:
+        return None, 'нет key'
+    date = item.get('date') or ''
+    if not isinstance(date, str) or not DATE_PATTERN.match(date):
+        return None, 'date должен быть в формате YYYY-MM-DD'
+    status = item.get('status', 'pending')
+    if status not in ('pending', 'paid', 'overdue'):
+        return None, 'bad status'
+    try:
+        price = int(item.get('price') or 0)
+        schedule_id = int(item['schedule_id']) if item.get('schedule_id') is not None else None
+    except (TypeError, ValueError):
+        return None, 'price и schedule_id должны быть числами'
+    return {
+        'client_key': client_key,
+        'date': date,
+        'schedule_id': schedule_id,
+        'student': item.get('student') or '',
+        'exam': item.get('exam') or '',
+        'price': price,
+        'status': status
+    }, None
+
+
+@bp.route('/api/income-lessons/batch', methods=['POST'])
+def api_income_add_batch():
+    """
+    Добавить пачку проведённых занятий одним запросом: {"lessons": [{key, date, schedule_id, ...}]}.
+    Идемпотентно по key ('YYYY-MM-DD-<schedule_id>'): повторная отправка не создает дублей.
+    Некорректные занятия не мешают остальным: они возвращаются в errors с index и key.
+    """
+    if 'user_id' not in session or session['role'] != 'tutor':
+        return jsonify({'success': False, 'message': 'not authorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    items = data.get('lessons')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'Передайте непустой список lessons'}), 400
+    if len(items) > INCOME_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'Не больше {INCOME_BATCH_LIMIT} занятий за запрос'}), 413
+
+    lessons, errors = [], []
+    for index, item in enumerate(items):
+        lesson, error = _parse_income_lesson(item)
+        if error:
+            key = item.get('key') if isinstance(item, dict) else None
+            errors.append({'index': index, 'key': key, 'message': error})
+        else:
+            lessons.append(lesson)
+    if not lessons:
+        return jsonify({'success': False, 'message': 'Некорректные занятия', 'errors': errors}), 400
+
+    try:
+        inserted, ids = db.add_income_lessons_batch(session['user_id'], lessons)
+    except sqlite3.Error as e:
+        logger.error("Ошибка в api_income_add_batch: %s", e)
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+    logger.info("Доход: пакет из %s занятий, новых %s, репетитор %s", len(lessons), inserted, session['user_id'],
+                extra=SAMPLED)
+    return jsonify({
+        'success': True,
+        'inserted': inserted,
+        'duplicates': len(lessons) - inserted,
+        'lessons': ids,
+        'errors': errors
+    })
+
+
+@bp.route('/api/income-lessons/<int:lesson_id>/status', methods=['POST'])
 def api_income_status(lesson_id):
     if 'user_id' not in session or session['role'] != 'tutor':
         return jsonify({'error': 'not authorized'}), 403
@@ -528,7 +1080,7 @@ def api_income_status(lesson_id):
     return jsonify({'success': True})
 
 
-@app.route('/api/income-lessons/reset', methods=['POST'])
+@bp.route('/api/income-lessons/reset', methods=['POST'])
 def api_income_reset():
     if 'user_id' not in session or session['role'] != 'tutor':
         return jsonify({'error': 'not authorized'}), 403
@@ -536,44 +1088,33 @@ def api_income_reset():
     db.reset_income(session['user_id'])
     return jsonify({'success': True})
 
-@app.route('/income')
+@bp.route('/income')
 def income():
     """Страница доходов"""
     if 'user_id' not in session or session['role'] != 'tutor':
         return "Доступ запрещен. Только для репетиторов.", 403
     return render_template('income.html')
 
-@app.route('/App.js')
-def serve_app_js():
-    """Обслуживание App.js"""
-    return send_file('App.js', mimetype='application/javascript')
-
-@app.route('/index.js')
-def serve_index_js():
-    """Обслуживание index.js"""
-    return send_file('index.js', mimetype='application/javascript')
-
-@app.route('/styles.css')
-def serve_css():
-    """Обслуживание styles.css"""
-    return send_file('styles.css', mimetype='text/css')
-
-@app.route('/me.jpg')
-def serve_photo():
-    """Обслуживание фото"""
-    return send_file('me.jpg', mimetype='image/jpeg')
-
-@app.route('/Cabinet.js')
-def serve_cabinet_js():
-    """Обслуживание Cabinet.js"""
-    return send_file('Cabinet.js', mimetype='application/javascript')
-
-@app.route('/cabinet-index.js')
-def serve_cabinet_index_js():
-    """Обслуживание cabinet-index.js"""
-    return send_file('cabinet-index.js', mimetype='application/javascript')
-
-@app.route('/students')
+@bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Статический файл по адресу с хэшем содержимого (кэшируется браузером навсегда)"""
+    asset, current = static_assets.find(filename)
+    if asset is None:
+        return "Файл не найден", 404
+    # Устаревший хэш из закэшированной страницы: отдаем текущую версию, но без immutable
+    return static_assets.response(asset, request, immutable=current)
+
+
+def serve_static_file(name):
+    """Статический файл по старому адресу без хэша: с ETag и проверкой при каждой загрузке"""
+    return static_assets.response(static_assets.get(name, check_mtime=current_app.debug), request, immutable=False)
+
+
+for static_name in STATIC_FILES:
+    bp.add_url_rule(f'/{static_name}', f"static_{static_name.replace('.', '_')}", serve_static_file,
+                    defaults={'name': static_name})
+
+@bp.route('/students')
 def students():
     """Страница управления учениками"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -581,7 +1122,7 @@ def students():
     return render_template('students.html')
 
 
-@app.route('/student-tests')
+@bp.route('/student-tests')
 def student_tests():
     """Страница тестов с меню для учеников"""
     if 'user_id' not in session or session['role'] != 'student':
@@ -590,21 +1131,27 @@ def student_tests():
     return render_template('student_tests.html')
 
 
-@app.route('/test-result')
+def _job_visible(job):
+    """Задание видно только тому, кто его создал"""
+    return job is not None and (job['user_id'] is None or job['user_id'] == session.get('user_id'))
+
+
+@bp.route('/test-result')
 def test_result():
     """Страница с результатами генерации теста"""
-    generated_test = session.get('generated_test', '')
-    test_material = session.get('test_material', '')
+    job_id = request.args.get('job') or session.get('last_test_job')
+    job = job_queue.get(job_id, include_material=True) if job_id else None
 
-    if not generated_test:
+    if not _job_visible(job):
         return "Результаты не найдены. Пожалуйста, сгенерируйте тест сначала.", 404
 
-    return render_template('test_result.html', test=generated_test, material=test_material)
+    test = db.get_test(job['test_id']) if job['test_id'] else None
+    return render_template('test_result.html', job=job, test=test, material=job['material_text'])
 
 
-@app.route('/generate-test', methods=['POST'])
+@bp.route('/generate-test', methods=['POST'])
 def generate_test():
-    """Генерация теста из материала"""
+    """Постановка генерации теста из материала в очередь"""
     data = request.get_json()
     material = data.get("text", "")
     material_name = data.get("material_name", "z5")  # По умолчанию "z5"
@@ -612,16 +1159,56 @@ def generate_test():
     if not material:
         return jsonify({"test": "❌ Ошибка: Не указан материал для генерации теста"}), 400
 
-    result = generate_test_from_text(material, material_name=material_name)
+    try:
+        job_id = job_queue.submit(material, material_name=material_name, user_id=session.get('user_id'))
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    session['last_test_job'] = job_id
+    job = job_queue.get(job_id)
+
+    return jsonify({
+        "job_id": job_id,
+        "status": job['status'],
+        "status_url": f"/api/test-jobs/{job_id}",
+        "redirect": f"/test-result?job={job_id}"
+    }), 202
+
+
+@bp.route('/api/test-jobs/<job_id>')
+def api_test_job(job_id):
+    """Статус и результат задания генерации теста"""
+    job = job_queue.get(job_id)
+    if not _job_visible(job):
+        return jsonify({'error': 'Задание не найдено'}), 404
+
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'material_name': job['material_name'],
+        'test': job['result'],
+        'test_id': job['test_id'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    })
 
-    # Сохраняем результат в сессии для отображения на отдельной странице
-    session['generated_test'] = result
-    session['test_material'] = material
 
-    return jsonify({"test": result, "redirect": "/test-result"})
+@bp.route('/api/tests/<int:test_id>')
+def api_get_test(test_id):
+    """Сохраненный тест: вопросы и варианты ответа"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Не авторизован'}), 401
+
+    test = db.get_test(test_id)
+    if not test:
+        return jsonify({'error': 'Тест не найден'}), 404
 
+    test.pop('material_text', None)
+    return jsonify({'success': True, 'test': test})
 
-@app.route('/student-schedule')
+
+@bp.route('/student-schedule')
 def student_schedule():
     """Страница расписания для учеников"""
     if 'user_id' not in session or session['role'] != 'student':
@@ -630,7 +1217,7 @@ def student_schedule():
     return render_template('student_schedule.html')
 
 
-@app.route('/student-materials')
+@bp.route('/student-materials')
 def student_materials():
     """Страница материалов для учеников"""
     if 'user_id' not in session or session['role'] != 'student':
@@ -639,50 +1226,54 @@ def student_materials():
     return render_template('student_materials.html')
 
 
-@app.route('/api/materials')
+@bp.route('/api/materials')
 def api_get_materials():
     """API для получения учебных материалов"""
     if 'user_id' not in session:
         return jsonify({'error': 'Не авторизован'}), 401
 
-    try:
-        connection = db.get_connection()
-        cursor = connection.cursor()
+    def build():
+        try:
+            connection = db.get_connection()
+            cursor = connection.cursor()
 
-        if session['role'] == 'tutor':
-            # Репетитор видит все свои материалы
-            cursor.execute("""
-                SELECT * FROM materials 
-                WHERE tutor_id = ? 
-                ORDER BY created_at DESC
-            """, (session['user_id'],))
-        else:
-            # Ученик видит материалы своего репетитора
-            cursor.execute("""
-                SELECT m.* 
-                FROM materials m
-                JOIN users u ON m.tutor_id = u.created_by
-                WHERE u.id = ?
-                ORDER BY m.created_at DESC
-            """, (session['user_id'],))
-
-        materials = [dict(row) for row in cursor.fetchall()]
-        connection.close()
+            if session['role'] == 'tutor':
+                # Репетитор видит все свои материалы
+                cursor.execute("""
+                    SELECT * FROM materials 
+                    WHERE tutor_id = ? 
+                    ORDER BY created_at DESC
+                """, (session['user_id'],))
+            else:
+                # Ученик видит материалы своего репетитора
+                cursor.execute("""
+                    SELECT * FROM materials
+                    WHERE tutor_id = (SELECT created_by FROM users WHERE id = ?)
+                    ORDER BY created_at DESC
+                """, (session['user_id'],))
+
+            materials = [dict(row) for row in cursor.fetchall()]
+            connection.close()
 
-        return jsonify({
-            'success': True,
-            'materials': materials
-        })
+            return jsonify({
+                'success': True,
+                'materials': materials
+            })
 
-    except Exception as e:
-        print(f"❌ Ошибка получения материалов: {e}")
-        # Возвращаем тестовые данные если таблицы еще нет
-        return jsonify({
-            'success': True,
-            'materials': []
-        })
+        except Exception as e:
+            logger.error("Ошибка получения материалов: %s", e)
+            # Возвращаем тестовые данные если таблицы еще нет
+            response = jsonify({
+                'success': True,
+                'materials': []
+            })
+            # Пустой список из-за ошибки не должен закрепиться за ETag
+            response.cache_control.no_store = True
+            return response
+
+    return _conditional_response(_session_tutor_id(), DataVersions.MATERIALS, build)
 
-@app.route('/api/tutor/materials', methods=['POST'])
+@bp.route('/api/tutor/materials', methods=['POST'])
 def api_create_material():
     """API для создания учебного материала (только для репетитора)"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -711,6 +1302,7 @@ def api_create_material():
         material_id = cursor.lastrowid
         connection.commit()
         connection.close()
+        event_bus.publish(session['user_id'], 'material_uploaded', {'material_id': material_id})
 
         return jsonify({
             'success': True,
@@ -719,11 +1311,10 @@ def api_create_material():
         })
 
     except Exception as e:
-        print(f"❌ Ошибка создания материала: {e}")
+        logger.error("Ошибка создания материала: %s", e)
         return jsonify({'success': False, 'message': 'Ошибка создания материала'}), 500
 
 
-UPLOAD_FOLDER = 'uploads/materials'
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'txt', 'zip', 'rar'}
 
 
@@ -732,7 +1323,7 @@ def allowed_file(filename):
         filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@app.route('/api/tutor/upload-material', methods=['POST'])
+@bp.route('/api/tutor/upload-material', methods=['POST'])
 def api_upload_material():
     """API для загрузки учебного материала"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -753,8 +1344,8 @@ def api_upload_material():
             unique_filename = f"{uuid.uuid4().hex}_{filename}"
 
             # Создаем папку если не существует
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+            os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
 
             # Сохраняем файл
             file.save(file_path)
@@ -790,8 +1381,9 @@ def api_upload_material():
             material_id = cursor.lastrowid
             connection.commit()
             connection.close()
+            event_bus.publish(session['user_id'], 'material_uploaded', {'material_id': material_id})
 
-            print(f"✅ Материал загружен: {title} (ID: {material_id})")
+            logger.info("Материал загружен: %s (ID: %s)", title, material_id)
 
             return jsonify({
                 'success': True,
@@ -802,11 +1394,11 @@ def api_upload_material():
             return jsonify({'success': False, 'message': 'Недопустимый тип файла'}), 400
 
     except Exception as e:
-        print(f"❌ Ошибка загрузки материала: {e}")
+        logger.error("Ошибка загрузки материала: %s", e)
         return jsonify({'success': False, 'message': f'Ошибка загрузки: {str(e)}'}), 500
 
 
-@app.route('/api/materials/<int:material_id>/download')
+@bp.route('/api/materials/<int:material_id>/download')
 def download_material(material_id):
     """Скачивание материала"""
     try:
@@ -844,7 +1436,7 @@ def download_material(material_id):
             temp_content += f"Дата создания: {material_dict['created_at']}"
 
             temp_filename = f"material_{material_id}.txt"
-            temp_path = os.path.join(UPLOAD_FOLDER, temp_filename)
+            temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], temp_filename)
 
             with open(temp_path, 'w', encoding='utf-8') as f:
                 f.write(temp_content)
@@ -855,11 +1447,11 @@ def download_material(material_id):
                          download_name=f"{material_dict['title']}.{material_dict['file_type']}")
 
     except Exception as e:
-        print(f"❌ Ошибка скачивания материала: {e}")
+        logger.error("Ошибка скачивания материала: %s", e)
         return jsonify({'error': 'Ошибка скачивания'}), 500
 
 
-@app.route('/api/materials/<int:material_id>/preview')
+@bp.route('/api/materials/<int:material_id>/preview')
 def preview_material(material_id):
     """Просмотр материала"""
     try:
@@ -892,11 +1484,11 @@ def preview_material(material_id):
                              download_name=f"{material_dict['title']}.{material_dict['file_type']}")
 
     except Exception as e:
-        print(f"❌ Ошибка просмотра материала: {e}")
+        logger.error("Ошибка просмотра материала: %s", e)
         return jsonify({'error': 'Ошибка просмотра'}), 500
 
 
-@app.route('/api/tutor/materials/<int:material_id>', methods=['DELETE'])
+@bp.route('/api/tutor/materials/<int:material_id>', methods=['DELETE'])
 def delete_material(material_id):
     """Удаление материала (только для репетитора)"""
     if 'user_id' not in session or session['role'] != 'tutor':
@@ -924,8 +1516,9 @@ def delete_material(material_id):
         cursor.execute("DELETE FROM materials WHERE id = ?", (material_id,))
         connection.commit()
         connection.close()
+        event_bus.publish(session['user_id'], 'material_deleted', {'material_id': material_id})
 
-        print(f"✅ Материал удален: {material_dict['title']} (ID: {material_id})")
+        logger.info("Материал удален: %s (ID: %s)", material_dict['title'], material_id)
 
         return jsonify({
             'success': True,
@@ -933,11 +1526,11 @@ def delete_material(material_id):
         })
 
     except Exception as e:
-        print(f"❌ Ошибка удаления материала: {e}")
+        logger.error("Ошибка удаления материала: %s", e)
         return jsonify({'success': False, 'message': f'Ошибка удаления: {str(e)}'}), 500
 
 
-@app.route('/api/materials/<int:material_id>/download-stats', methods=['POST'])
+@bp.route('/api/materials/<int:material_id>/download-stats', methods=['POST'])
 def update_download_stats(material_id):
     """Обновление статистики скачиваний"""
     try:
@@ -946,6 +1539,7 @@ def update_download_stats(material_id):
 
         # Здесь можно добавить логику для отслеживания статистики скачиваний
         # Например, создать таблицу download_stats или обновлять поле в materials
+        # Список материалов от счетчика не зависит: ни события ленты, ни новой версии ETag
         cursor.execute("UPDATE materials SET download_count = COALESCE(download_count, 0) + 1 WHERE id = ?",
                        (material_id,))
 
@@ -955,14 +1549,16 @@ def update_download_stats(material_id):
         return jsonify({'success': True})
 
     except Exception as e:
-        print(f"❌ Ошибка обновления статистики: {e}")
+        logger.error("Ошибка обновления статистики: %s", e)
         return jsonify({'success': False}), 500
 
 
 
 if __name__ == '__main__':
+    # Сервер разработки; в продакшене — wsgi.py под многопроцессным WSGI-сервером
+    app = create_app(Config.from_env(debug=True, log_level='DEBUG'))
     print("Flask сервер запущен!")
     print("Откройте: http://localhost:5000")
     print("Тестовые данные:")
     print("Репетитор: логин 'tutor', пароль 'tutor'")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=app.debug, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+Бенчмарк списка учеников репетитора (Database.get_tutor_students).
+
+Показывает, что число SQL-запросов на один вызов не зависит от размера списка.
+Запуск из каталога tutor/:
+
+    python -m benchmarks.roster_queries
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import Database
+
+ROSTER_SIZES = (10, 50, 200, 1000)
+LESSONS_PER_STUDENT = 5
+REPEATS = 20
+
+
+def seed_roster(db, tutor_id, size):
+    """Заполнение базы учениками с расписанием, занятиями и прогрессом"""
+    with db.connection() as connection:
+        cursor = connection.cursor()
+        for i in range(size):
+            cursor.execute("""
+                INSERT INTO users (username, password_hash, role, first_name, last_name, exam_type, created_by)
+                VALUES (?, 'p', 'student', 'Ученик', ?, 'oge', ?)
+            """, (f'bench_{tutor_id}_{i}', str(i), tutor_id))
+            student_id = cursor.lastrowid
+            cursor.execute("INSERT INTO topics (title, created_by) VALUES ('Бенчмарк', ?)", (tutor_id,))
+            topic_id = cursor.lastrowid
+            cursor.execute("""
+                INSERT INTO schedule (student_id, tutor_id, topic_id, day_of_week, start_time, end_time)
+                VALUES (?, ?, ?, 'monday', '10:00', '11:00')
+            """, (student_id, tutor_id, topic_id))
+            schedule_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO lessons (schedule_id, topic_id, lesson_date) VALUES (?, ?, ?)",
+                [(schedule_id, topic_id, f'2025-01-{day + 1:02d}') for day in range(LESSONS_PER_STUDENT)]
+            )
+            cursor.execute("""
+                INSERT INTO student_progress (student_id, topic_id, test_score, overall_progress)
+                VALUES (?, ?, ?, ?)
+            """, (student_id, topic_id, i % 100, i % 100))
+
+
+def count_statements(db, func, *args):
+    """Число SQL-инструкций, выполненных во время вызова func"""
+    statements = []
+    with db.connection() as connection:
+        connection.set_trace_callback(statements.append)
+        try:
+            func(*args)
+        finally:
+            connection.set_trace_callback(None)
+    return len(statements)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(os.path.join(tmp_dir, 'bench.db'))
+        db.migrate()
+
+        print(f"{'учеников':>10} {'запросов':>10} {'мс/вызов':>10}")
+        for size in ROSTER_SIZES:
+            with db.connection() as connection:
+                tutor_id = connection.execute("""
+                    INSERT INTO users (username, password_hash, role, first_name, last_name)
+                    VALUES (?, 'p', 'tutor', 'Бенч', 'Репетитор')
+                """, (f'bench_tutor_{size}',)).lastrowid
+            seed_roster(db, tutor_id, size)
+
+            queries = count_statements(db, db.get_tutor_students, tutor_id)
+            started = time.perf_counter()
+            for _ in range(REPEATS):
+                students = db.get_tutor_students(tutor_id)
+            elapsed_ms = (time.perf_counter() - started) * 1000 / REPEATS
+
+            assert len(students) == size
+            print(f"{size:>10} {queries:>10} {elapsed_ms:>10.2f}")
+
+        db.close_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Optional
+
+ENV_PREFIX = 'TUTOR_'
+# Ключ подписи сессий для отладки и тестов; в остальных режимах нужен TUTOR_SECRET_KEY
+DEV_SECRET_KEY = 'tutoring-secret-key-2024'
+
+
+@dataclass
+class Config:
+    """
+    Настройки приложения для create_app().
+
+    Каждое поле можно задать переменной окружения TUTOR_<ИМЯ>: TUTOR_DB_PATH,
+    TUTOR_LM_STUDIO_URL, TUTOR_GENERATION_WORKERS и т.д.
+    """
+    db_path: str = 'database/tutoring.db'
+    upload_folder: str = 'uploads/materials'
+    # Обязателен вне режимов debug и testing
+    secret_key: Optional[str] = None
+    # Адрес LM Studio; None — адрес по умолчанию из llm_client
+    lm_studio_url: Optional[str] = None
+    # Соединений к LM Studio в пуле одного процесса
+    http_pool_size: int = 4
+    # Потоков фоновой генерации тестов и длина очереди в одном процессе;
+    # столько же допускается одновременных потоковых генераций (/api/tests/stream)
+    generation_workers: int = 2
+    generation_max_pending: int = 20
+    busy_timeout_ms: int = 5000
+    # Сколько секунд сессия живет в кэше процесса; при нескольких процессах выход
+    # в одном из них другие увидят не позже чем через это время
+    session_cache_ttl: int = 30
+    # Как часто процесс читает из журнала events события соседних процессов для ленты /api/events, с
+    event_poll_interval: float = 1.0
+    compress_level: int = 6
+    compress_min_size: int = 500
+    log_level: str = 'INFO'
+    # Из сообщений, помеченных как частые (extra=SAMPLED), в лог попадает одно из N
+    log_sample_every: int = 100
+    # Профилирование SQL: статистика по отпечаткам запросов и журнал медленных запросов
+    sql_profile: bool = False
+    sql_slow_ms: float = 100.0
+    debug: bool = False
+    testing: bool = False
+
+    @classmethod
+    def from_env(cls, environ=None, **defaults):
+        """Настройки из переменных окружения; defaults — значения, если переменная не задана"""
+        environ = os.environ if environ is None else environ
+        values = dict(defaults)
+        for field in fields(cls):
+            raw = environ.get(ENV_PREFIX + field.name.upper())
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = raw.strip().lower() in ('1', 'true', 'yes', 'on')
+            elif field.type in (int, float):
+                values[field.name] = field.type(raw)
+            else:
+                values[field.name] = raw
+        return cls(**values)
@@ -1,10 +1,100 @@
+import hashlib
+import logging
 import sqlite3
 import os
-from typing import Optional, Dict, Any
+import threading
+import time
+from datetime import timedelta
+from contextlib import contextmanager
+
+from services.schedule_index import DAY_MINUTES, DAY_ORDS, LESSON_MINUTES, DayIntervals, format_time, group_intervals, parse_time
+
+logger = logging.getLogger(__name__)
+
+
+def _month_bounds(month):
+    """'2025-11' -> ('2025-11-01', '2025-12-01') для выборки дат месяца по индексу"""
+    year, month_number = (int(part) for part in month.split('-'))
+    if month_number == 12:
+        year, month_number = year + 1, 0
+    return f"{month}-01", f"{year:04d}-{month_number + 1:02d}-01"
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, который сообщает соединению время каждого запроса"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.record_statement(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # Параметры executemany уже прочитаны — для EXPLAIN их не передаем
+            self.connection.record_statement(sql, None, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Соединение со счетчиками выполненных запросов и их суммарного времени.
+    Время — выполнение execute(); чтение строк через fetch* в него не входит.
+    Если задан profiler (database.profiler.QueryProfiler), каждый запрос передается ему.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = 0
+        self.statement_seconds = 0.0
+        self.profiler = None
+
+    def record_statement(self, sql, parameters, seconds):
+        self.statements += 1
+        self.statement_seconds += seconds
+        if self.profiler is not None:
+            self.profiler.record(self, sql, parameters, seconds)
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ScheduleConflict(Exception):
+    """Время занятия пересекается с другими активными занятиями репетитора"""
+
+    def __init__(self, conflicts):
+        super().__init__("Это время уже занято другим занятием")
+        self.conflicts = conflicts
+
+
+class PooledConnection:
+    """Обёртка над соединением потока: close() возвращает соединение в пул, а не закрывает его"""
+
+    def __init__(self, database, connection):
+        self._database = database
+        self._connection = connection
+
+    def close(self):
+        self._database.release_connection()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
 
 
 class Database:
-    def __init__(self, db_path='database/tutoring.db'):
+    # Сколько ждать снятия блокировки записи другим соединением, мс
+    BUSY_TIMEOUT_MS = 5000
+
+    def __init__(self, db_path='database/tutoring.db', busy_timeout_ms=BUSY_TIMEOUT_MS, event_bus=None, profiler=None):
         # Если путь относительный, делаем его абсолютным относительно текущего файла
         if not os.path.isabs(db_path):
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,382 +105,520 @@ class Database:
                 self.db_path = os.path.join(os.path.dirname(current_dir), db_path)
         else:
             self.db_path = db_path
-        print(f"📂 Путь к базе данных: {self.db_path}")
-
-    def get_connection(self):
-        try:
+        self.busy_timeout_ms = busy_timeout_ms
+        # Необязательная шина событий (services.events.EventBus) для ленты изменений
+        self.event_bus = event_bus
+        # Необязательный профилировщик запросов (database.profiler.QueryProfiler)
+        self.profiler = profiler
+        # Одно соединение на поток: открывается при первом обращении и переиспользуется
+        self._local = threading.local()
+        self._db_dir_ready = False
+        logger.info("Путь к базе данных: %s", self.db_path)
+
+    def _publish(self, tutor_id, event, data=None):
+        """Сообщить об изменении подписчикам репетитора, если шина подключена"""
+        if self.event_bus is not None:
+            self.event_bus.publish(tutor_id, event, data)
+
+    def _open_connection(self):
+        """Открытие нового соединения с настройками WAL"""
+        if not self._db_dir_ready:
             # Создаем директорию для базы данных, если её нет
             db_dir = os.path.dirname(self.db_path)
             if db_dir:
                 os.makedirs(db_dir, exist_ok=True)
-            connection = sqlite3.connect(self.db_path)
-            connection.row_factory = sqlite3.Row
-            return connection
+            self._db_dir_ready = True
+
+        connection = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000, factory=TimedConnection)
+        connection.profiler = self.profiler
+        connection.row_factory = sqlite3.Row
+        # WAL: читатели не блокируются писателем, NORMAL достаточно для WAL
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return connection
+
+    def _thread_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._open_connection()
+            self._local.connection = connection
+            self._local.depth = 0
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение текущего потока.
+        Внешний блок with фиксирует транзакцию при успехе и откатывает при ошибке,
+        вложенные блоки работают внутри транзакции внешнего.
+        """
+        connection = self._thread_connection()
+        self._local.depth += 1
+        try:
+            yield connection
+        except BaseException:
+            if self._local.depth == 1 and connection.in_transaction:
+                connection.rollback()
+            raise
+        else:
+            if self._local.depth == 1 and connection.in_transaction:
+                connection.commit()
+        finally:
+            self._local.depth -= 1
+
+    def statement_stats(self):
+        """(число запросов, их время в секундах) соединения текущего потока с момента открытия"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return 0, 0.0
+        return connection.statements, connection.statement_seconds
+
+    def get_connection(self):
+        """Соединение текущего потока для кода, который сам вызывает commit()/close()"""
+        try:
+            return PooledConnection(self, self._thread_connection())
         except sqlite3.Error as e:
-            print(f"❌ Ошибка подключения: {e}")
+            logger.error("Ошибка подключения: %s", e)
             return None
 
     def connect(self):
         return self.get_connection()
 
-    def create_tables(self):
-        """Создание таблиц из SQL скрипта"""
-        connection = self.get_connection()
-        if not connection:
-            print("❌ Не удалось подключиться к базе данных")
-            return
-
-        try:
-            # Определяем путь к schema.sql относительно текущего файла database.py
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            schema_path = os.path.join(current_dir, 'schema.sql')
-            
-            if not os.path.exists(schema_path):
-                print(f"❌ Файл schema.sql не найден!")
-                print(f"   Искали в: {schema_path}")
-                print(f"   Текущая директория файла: {current_dir}")
-                print(f"   Рабочая директория: {os.getcwd()}")
-                print(f"   Содержимое директории database: {os.listdir(current_dir) if os.path.exists(current_dir) else 'не существует'}")
-                return
-
-            print(f"📁 Чтение {schema_path}...")
-            with open(schema_path, 'r', encoding='utf-8') as f:
-                sql_script = f.read()
-                print(f"📄 Размер скрипта: {len(sql_script)} символов")
-
-            cursor = connection.cursor()
-            cursor.executescript(sql_script)
-            connection.commit()
-            print("✅ Таблицы созданы")
-
-            # Проверка, создалась ли таблица users
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-            table_exists = cursor.fetchone()
-            if table_exists:
-                print("✅ Таблица users существует")
-                # Проверка, создался ли пользователь tutor
-                cursor.execute("SELECT COUNT(*) as count FROM users WHERE username = 'tutor'")
-                result = cursor.fetchone()
-                print(f"👤 Пользователей 'tutor' в базе: {result['count']}")
-            else:
-                print("❌ Таблица users не создана!")
+    def release_connection(self):
+        """Вернуть соединение потока в пул: откатить незафиксированную транзакцию"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.depth == 0 and connection.in_transaction:
+            connection.rollback()
 
-        except Exception as e:
-            print(f"❌ Ошибка создания таблиц: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
+    def close_connection(self):
+        """Закрыть соединение текущего потока"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
             connection.close()
+            self._local.connection = None
+
+    def migrate(self):
+        """Применить недостающие миграции схемы (database/migrations.py)"""
+        from database.migrations import migrate
+        return migrate(self)
+
+    def get_data_version(self, tutor_id, scope):
+        """
+        Версия данных репетитора из data_versions (увеличивается триггерами).
+        Если данные еще не менялись — случайная эпоха базы, а не общий для всех баз 0.
+        """
+        with self.connection() as connection:
+            return connection.execute("""
+                SELECT COALESCE(
+                    (SELECT version FROM data_versions WHERE tutor_id = ? AND scope = ?),
+                    (SELECT version FROM data_versions WHERE tutor_id = 0 AND scope = 'epoch'),
+                    0)
+            """, (tutor_id, scope)).fetchone()[0]
+
+    def data_version(self):
+        """PRAGMA data_version соединения потока: меняется после фиксации записи другим соединением"""
+        return self._thread_connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def append_event(self, tutor_id, event, data, origin):
+        """Запись события ленты в журнал events; data — JSON"""
+        with self.connection() as connection:
+            connection.execute("""
+                INSERT INTO events (tutor_id, event, data, origin, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (tutor_id, event, data, origin, time.time()))
+
+    def get_events_after(self, last_id, limit=500):
+        """События журнала с id больше last_id по возрастанию id"""
+        with self.connection() as connection:
+            return connection.execute("""
+                SELECT id, tutor_id, event, data, origin
+                FROM events
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, limit)).fetchall()
+
+    def last_event_id(self):
+        with self.connection() as connection:
+            return connection.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def prune_events(self, before):
+        """Удаление событий старше before (время Unix); возвращает число удаленных"""
+        with self.connection() as connection:
+            return connection.execute("DELETE FROM events WHERE created_at < ?", (before,)).rowcount
 
     def authenticate_user(self, username: str, password: str):
         """Аутентификация пользователя"""
-        connection = self.get_connection()
-        if not connection:
-            return None
-
         try:
-            cursor = connection.cursor()
-            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-            user = cursor.fetchone()
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
+                user = cursor.fetchone()
 
             if not user:
-                print(f"❌ Пользователь '{username}' не найден")
+                logger.debug("Пользователь %r не найден", username)
                 return None
 
             user_dict = dict(user)
-            print(f"✅ Пользователь найден: {user_dict}")
-            print(f"🔑 Сравнение паролей: введен '{password}', в базе '{user_dict['password_hash']}'")
-
             # Простое сравнение паролей
             if user_dict['password_hash'] == password:
-                print("✅ Пароль верный!")
                 return user_dict
             else:
-                print("❌ Неверный пароль")
+                logger.debug("Неверный пароль пользователя %r", username)
                 return None
 
         except sqlite3.Error as e:
-            print(f"❌ Ошибка аутентификации: {e}")
+            logger.error("Ошибка аутентификации: %s", e)
             return None
-        finally:
-            connection.close()
 
     def create_student(self, username, password, first_name, last_name, tutor_id, contact_info, exam_type, lesson_price,
                        day_of_week, lesson_time):
-        """Создание нового ученика с расписанием"""
-        connection = self.get_connection()
-        if not connection:
-            return False
-
+        """
+        Создание нового ученика с расписанием.
+        Если время пересекается с другими занятиями репетитора, бросает ScheduleConflict;
+        если занятие не заканчивается до полуночи — ValueError.
+        """
+        # Занятие длится час и должно закончиться в тот же день
+        lesson_start = parse_time(lesson_time)
+        lesson_end = lesson_start + LESSON_MINUTES
+        if lesson_end > DAY_MINUTES:
+            raise ValueError("Занятие должно закончиться до полуночи")
         try:
-            cursor = connection.cursor()
-
-            # Проверяем, существует ли уже пользователь с таким логином
-            cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
-            if cursor.fetchone():
-                print(f"❌ Пользователь с логином '{username}' уже существует")
-                return False
-
-            # Создаем пользователя с exam_type
-            cursor.execute('''
-                INSERT INTO users (
-                    username, password_hash, role, first_name, last_name, 
-                    exam_type, lesson_price, contact_info, created_by, is_active
-                ) VALUES (?, ?, 'student', ?, ?, ?, ?, ?, ?, 1)
-            ''', (username, password, first_name, last_name, exam_type, lesson_price, contact_info, tutor_id))
-
-            student_id = cursor.lastrowid
-
-            # Создаем расписание для ученика
-            # Сначала нужно создать тему (topic) для занятий
-            cursor.execute('''
-                INSERT INTO topics (title, description, created_by)
-                VALUES (?, ?, ?)
-            ''', (f'Занятия с {first_name} {last_name}', f'Индивидуальные занятия по подготовке к {exam_type.upper()}',
-                  tutor_id))
-
-            topic_id = cursor.lastrowid
-
-            # Создаем расписание
-            start_time = lesson_time
-            # Вычисляем время окончания (занятие длится 1 час)
-            from datetime import datetime, timedelta
-            start_dt = datetime.strptime(start_time, '%H:%M')
-            end_dt = start_dt + timedelta(hours=1)
-            end_time = end_dt.strftime('%H:%M')
-
-            cursor.execute('''
-                INSERT INTO schedule (student_id, tutor_id, topic_id, day_of_week, start_time, end_time, status)
-                VALUES (?, ?, ?, ?, ?, ?, 'active')
-            ''', (student_id, tutor_id, topic_id, day_of_week, start_time, end_time))
-
-            connection.commit()
-
-            print(
-                f"✅ Ученик создан: {first_name} {last_name} (ID: {student_id}) с расписанием: {day_of_week} {start_time}-{end_time}")
+            with self.connection() as connection:
+                if not connection.in_transaction:
+                    # Блокировка записи до проверки пересечений: другой процесс не займет это же время
+                    connection.execute("BEGIN IMMEDIATE")
+                cursor = connection.cursor()
+
+                # Проверяем, существует ли уже пользователь с таким логином
+                cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
+                if cursor.fetchone():
+                    logger.info("Пользователь с логином %r уже существует", username)
+                    return False
+
+                # Создаем пользователя с exam_type
+                cursor.execute('''
+                    INSERT INTO users (
+                        username, password_hash, role, first_name, last_name, 
+                        exam_type, lesson_price, contact_info, created_by, is_active
+                    ) VALUES (?, ?, 'student', ?, ?, ?, ?, ?, ?, 1)
+                ''', (username, password, first_name, last_name, exam_type, lesson_price, contact_info, tutor_id))
+
+                student_id = cursor.lastrowid
+
+                # Создаем расписание для ученика
+                # Сначала нужно создать тему (topic) для занятий
+                cursor.execute('''
+                    INSERT INTO topics (title, description, created_by)
+                    VALUES (?, ?, ?)
+                ''', (f'Занятия с {first_name} {last_name}', f'Индивидуальные занятия по подготовке к {exam_type.upper()}',
+                      tutor_id))
+
+                topic_id = cursor.lastrowid
+
+                # Создаем расписание
+                start_time = format_time(lesson_start)
+                end_time = format_time(lesson_end)
+
+                conflicts = self._schedule_conflicts(cursor, tutor_id, day_of_week, lesson_start, lesson_end)
+                if conflicts:
+                    raise ScheduleConflict(conflicts)
+
+                cursor.execute('''
+                    INSERT INTO schedule (student_id, tutor_id, topic_id, day_of_week, start_time, end_time, status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'active')
+                ''', (student_id, tutor_id, topic_id, day_of_week, start_time, end_time))
+
+            logger.debug("Ученик создан: ID %s, расписание %s %s-%s", student_id, day_of_week, start_time, end_time)
+            self._publish(tutor_id, 'student_created', {'student_id': student_id})
+            self._publish(tutor_id, 'schedule_changed', {'student_id': student_id})
             return student_id
 
         except sqlite3.Error as e:
-            print(f"❌ Ошибка при создании ученика: {e}")
+            logger.error("Ошибка при создании ученика: %s", e)
             return False
-        finally:
-            connection.close()
 
-    def get_tutor_students(self, tutor_id: int):
-        """Получение всех учеников репетитора с информацией о расписании"""
-        connection = self.get_connection()
-        if not connection:
+    @staticmethod
+    def _schedule_conflicts(cursor, tutor_id, day_of_week, start, end):
+        """
+        id активных занятий репетитора, пересекающихся с [start, end) в минутах;
+        читается в транзакции записи. Предыдущий день нужен для занятий, записанных через полночь.
+        """
+        day_ord = DAY_ORDS.get(str(day_of_week).lower())
+        if day_ord is None:
             return []
+        previous_day = (day_ord - 2) % 7 + 1
+        rows = cursor.execute("""
+            SELECT id, day_ord, start_time, end_time
+            FROM schedule
+            WHERE tutor_id = ? AND status = 'active' AND day_ord IN (?, ?)
+        """, (tutor_id, day_ord, previous_day)).fetchall()
+        return DayIntervals(group_intervals(rows).get(day_ord, [])).conflicts(start, end)
 
+    def get_tutor_students(self, tutor_id: int):
+        """Получение всех учеников репетитора с расписанием, числом занятий и прогрессом одним запросом"""
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT 
-                    u.id, u.username, u.first_name, u.last_name, 
-                    u.exam_type, u.lesson_price, u.contact_info, u.created_at,
-                    s.day_of_week, s.start_time as lesson_time
-                FROM users u
-                LEFT JOIN schedule s ON u.id = s.student_id AND s.status = 'active'
-                WHERE u.created_by = ? AND u.role = 'student' AND u.is_active = 1
-                ORDER BY u.created_at DESC
-            """, (tutor_id,))
-
-            students = []
-            for row in cursor.fetchall():
-                student = dict(row)
-                # Добавляем вычисляемые поля для отображения
-                student['progress'] = self.calculate_student_progress(student['id'])
-                student['lesson_count'] = self.get_student_lesson_count(student['id'])
-                students.append(student)
-
-            print(f"📊 Найдено учеников: {len(students)}")
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT 
+                        u.id, u.username, u.first_name, u.last_name, 
+                        u.exam_type, u.lesson_price, u.contact_info, u.created_at,
+                        s.day_of_week, s.start_time as lesson_time,
+                        COALESCE(lc.lesson_count, 0) AS lesson_count,
+                        CAST(ROUND(COALESCE(sp.overall_progress, 0)) AS INTEGER) AS progress
+                    FROM users u
+                    LEFT JOIN schedule s ON u.id = s.student_id AND s.status = 'active'
+                    LEFT JOIN (
+                        SELECT sch.student_id, COUNT(*) AS lesson_count
+                        FROM schedule sch
+                        JOIN lessons l ON l.schedule_id = sch.id
+                        WHERE sch.student_id IN (SELECT id FROM users WHERE created_by = ?)
+                        GROUP BY sch.student_id
+                    ) lc ON lc.student_id = u.id
+                    LEFT JOIN student_progress_summary sp ON sp.student_id = u.id
+                    WHERE u.created_by = ? AND u.role = 'student' AND u.is_active = 1
+                    ORDER BY u.created_at DESC
+                """, (tutor_id, tutor_id))
+
+                students = [dict(row) for row in cursor.fetchall()]
+
             return students
 
         except sqlite3.Error as e:
-            print(f"❌ Ошибка получения учеников: {e}")
+            logger.error("Ошибка получения учеников: %s", e)
             return []
-        finally:
-            connection.close()
-
-    def update_schema(self):
-        """Обновление схемы базы данных - добавление exam_type"""
-        connection = self.get_connection()
-        if not connection:
-            return False
 
+    def get_student_schedule(self, student_id: int):
+        """Получение расписания ученика"""
         try:
-            cursor = connection.cursor()
-
-            # Проверяем существование колонки exam_type
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [column[1] for column in cursor.fetchall()]
-
-            # Добавляем exam_type если его нет
-            if 'exam_type' not in columns:
-                print("📝 Добавляем колонку exam_type в таблицу users...")
-                cursor.execute('ALTER TABLE users ADD COLUMN exam_type VARCHAR(10) CHECK (exam_type IN ("oge", "ege"))')
-                connection.commit()
-                print("✅ Колонка exam_type добавлена")
-
-            return True
-
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT s.id, s.day_of_week, s.start_time, s.end_time, s.lesson_link, s.status,
+                           t.title as topic_title, u.first_name as tutor_name
+                    FROM schedule s
+                    JOIN topics t ON s.topic_id = t.id
+                    JOIN users u ON s.tutor_id = u.id
+                    WHERE s.student_id = ? AND s.status = 'active'
+                    ORDER BY s.day_ord, s.start_time
+                """, (student_id,))
+                return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
-            print(f"❌ Ошибка обновления схемы: {e}")
-            return False
-        finally:
-            connection.close()
-
-    def ensure_tutor_user(self):
-        """Создание пользователя tutor, если его нет"""
-        connection = self.get_connection()
-        if not connection:
-            return False
+            logger.error("Ошибка получения расписания: %s", e)
+            return []
 
+    def get_tutor_schedule(self, tutor_id: int):
+        """Получение расписания репетитора"""
         try:
-            cursor = connection.cursor()
-            
-            # Проверяем, существует ли пользователь tutor
-            cursor.execute("SELECT id FROM users WHERE username = 'tutor'")
-            tutor = cursor.fetchone()
-            
-            if not tutor:
-                print("👤 Создаем пользователя tutor...")
+            with self.connection() as connection:
+                cursor = connection.cursor()
                 cursor.execute("""
-                    INSERT INTO users (username, password_hash, role, first_name, last_name, lesson_price, contact_info, is_active)
-                    VALUES ('tutor', 'tutor', 'tutor', 'Главный', 'Репетитор', 1500.00, 'tutor@example.com', 1)
-                """)
-                connection.commit()
-                print("✅ Пользователь tutor создан")
-                return True
-            else:
-                tutor_dict = dict(tutor)
-                print(f"✅ Пользователь tutor уже существует (ID: {tutor_dict['id']})")
-                # Обновляем пароль и статус на случай, если они были изменены
-                cursor.execute("""
-                    UPDATE users 
-                    SET password_hash = 'tutor', 
-                        is_active = 1,
-                        role = 'tutor'
-                    WHERE username = 'tutor'
-                """)
-                connection.commit()
-                print("✅ Данные пользователя tutor обновлены")
-                return True
-
+                    SELECT 
+                        s.id,
+                        s.day_of_week,
+                        s.start_time,
+                        s.end_time,
+                        s.lesson_link,
+                        s.status,
+                        t.title        AS topic_title,
+                        u.first_name   AS student_name,
+                        u.last_name    AS student_last_name,
+                        u.lesson_price AS lesson_price,
+                        u.exam_type    AS exam_type
+                    FROM schedule s
+                    JOIN topics t ON s.topic_id = t.id
+                    JOIN users  u ON s.student_id = u.id
+                    WHERE s.tutor_id = ? AND s.status = 'active'
+                    ORDER BY s.day_ord, s.start_time
+                """, (tutor_id,))
+                return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
-            print(f"❌ Ошибка создания пользователя tutor: {e}")
-            return False
-        finally:
-            connection.close()
-
-    def get_student_schedule(self, student_id: int):
-        """Получение расписания ученика"""
-        connection = self.get_connection()
-        if not connection:
+            logger.error("Ошибка получения расписания репетитора: %s", e)
             return []
 
+    def get_schedule_intervals(self, tutor_id: int):
+        """Активные слоты репетитора для индекса интервалов: id, day_ord, start_time, end_time"""
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT s.id, s.day_of_week, s.start_time, s.end_time, s.lesson_link, s.status,
-                       t.title as topic_title, u.first_name as tutor_name
-                FROM schedule s
-                JOIN topics t ON s.topic_id = t.id
-                JOIN users u ON s.tutor_id = u.id
-                WHERE s.student_id = ? AND s.status = 'active'
-                ORDER BY 
-                    CASE s.day_of_week
-                        WHEN 'monday' THEN 1
-                        WHEN 'tuesday' THEN 2
-                        WHEN 'wednesday' THEN 3
-                        WHEN 'thursday' THEN 4
-                        WHEN 'friday' THEN 5
-                        WHEN 'saturday' THEN 6
-                        WHEN 'sunday' THEN 7
-                    END,
-                    s.start_time
-            """, (student_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            with self.connection() as connection:
+                return [dict(row) for row in connection.execute("""
+                    SELECT id, day_ord, start_time, end_time
+                    FROM schedule
+                    WHERE tutor_id = ? AND status = 'active'
+                """, (tutor_id,))]
         except sqlite3.Error as e:
-            print(f"❌ Ошибка получения расписания: {e}")
+            logger.error("Ошибка получения слотов расписания: %s", e)
             return []
-        finally:
-            connection.close()
 
-    def get_tutor_schedule(self, tutor_id: int):
-        """Получение расписания репетитора"""
-        connection = self.get_connection()
-        if not connection:
-            return []
+    def get_schedule_occurrences(self, date_from, date_to, tutor_id=None, student_id=None):
+        """
+        Занятия из еженедельного расписания на конкретные даты [date_from, date_to] (datetime.date)
+        репетитора или ученика с отметкой о проведении: по журналу доходов (income_lessons)
+        и по таблице lessons.
+        """
+        days = [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+        day_ords = sorted({day.isoweekday() for day in days})
+        owner_column, owner_id = ('s.tutor_id', tutor_id) if tutor_id is not None else ('s.student_id', student_id)
+        first, last = date_from.isoformat(), date_to.isoformat()
 
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT 
-                    s.id,
-                    s.day_of_week,
-                    s.start_time,
-                    s.end_time,
-                    s.lesson_link,
-                    s.status,
-                    t.title        AS topic_title,
-                    u.first_name   AS student_name,
-                    u.last_name    AS student_last_name,
-                    u.lesson_price AS lesson_price,
-                    u.exam_type    AS exam_type
-                FROM schedule s
-                JOIN topics t ON s.topic_id = t.id
-                JOIN users  u ON s.student_id = u.id
-                WHERE s.tutor_id = ? AND s.status = 'active'
-                ORDER BY 
-                    CASE s.day_of_week
-                        WHEN 'monday'   THEN 1
-                        WHEN 'tuesday'  THEN 2
-                        WHEN 'wednesday'THEN 3
-                        WHEN 'thursday' THEN 4
-                        WHEN 'friday'   THEN 5
-                        WHEN 'saturday' THEN 6
-                        WHEN 'sunday'   THEN 7
-                    END,
-                    s.start_time
-            """, (tutor_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            with self.connection() as connection:
+                slots = [dict(row) for row in connection.execute(f"""
+                    SELECT
+                        s.id AS schedule_id, s.tutor_id, s.student_id, s.day_of_week, s.day_ord,
+                        s.start_time, s.end_time, s.lesson_link,
+                        t.title         AS topic_title,
+                        st.first_name   AS student_name,
+                        st.last_name    AS student_last_name,
+                        st.lesson_price AS lesson_price,
+                        st.exam_type    AS exam_type,
+                        tu.first_name   AS tutor_name
+                    FROM schedule s
+                    JOIN topics t  ON s.topic_id = t.id
+                    JOIN users  st ON s.student_id = st.id
+                    JOIN users  tu ON s.tutor_id = tu.id
+                    WHERE {owner_column} = ? AND s.status = 'active'
+                      AND s.day_ord IN ({','.join('?' * len(day_ords))})
+                    ORDER BY s.day_ord, s.start_time
+                """, (owner_id, *day_ords))]
+                if not slots:
+                    return []
+
+                schedule_ids = [slot['schedule_id'] for slot in slots]
+                tutor_ids = sorted({slot['tutor_id'] for slot in slots})
+                id_marks = ','.join('?' * len(schedule_ids))
+
+                done = {}
+                for row in connection.execute(f"""
+                    SELECT id, lesson_date, schedule_id, status
+                    FROM income_lessons
+                    WHERE tutor_id IN ({','.join('?' * len(tutor_ids))})
+                      AND lesson_date >= ? AND lesson_date <= ?
+                      AND schedule_id IN ({id_marks})
+                """, (*tutor_ids, first, last, *schedule_ids)):
+                    done[(row['lesson_date'], row['schedule_id'])] = {
+                        'income_id': row['id'], 'payment_status': row['status']
+                    }
+                for row in connection.execute(f"""
+                    SELECT id, lesson_date, schedule_id
+                    FROM lessons
+                    WHERE schedule_id IN ({id_marks}) AND lesson_date >= ? AND lesson_date <= ?
+                """, (*schedule_ids, first, last)):
+                    done.setdefault((row['lesson_date'], row['schedule_id']), {})['lesson_id'] = row['id']
         except sqlite3.Error as e:
-            print(f"❌ Ошибка получения расписания репетитора: {e}")
+            logger.error("Ошибка получения занятий по датам: %s", e)
             return []
-        finally:
-            connection.close()
+
+        by_day = {}
+        for slot in slots:
+            by_day.setdefault(slot['day_ord'], []).append(slot)
+
+        occurrences = []
+        for day in days:
+            date = day.isoformat()
+            for slot in by_day.get(day.isoweekday(), []):
+                completion = done.get((date, slot['schedule_id']))
+                occurrences.append({
+                    **slot,
+                    'date': date,
+                    'completed': completion is not None,
+                    'income_id': completion.get('income_id') if completion else None,
+                    'payment_status': completion.get('payment_status') if completion else None,
+                    'lesson_id': completion.get('lesson_id') if completion else None,
+                })
+        return occurrences
 
     def calculate_student_progress(self, student_id: int):
-        """Расчет прогресса ученика (заглушка)"""
-        # В реальном приложении здесь будет расчет прогресса на основе выполненных заданий
-        import random
-        return random.randint(50, 95)
+        """Прогресс ученика из сводной таблицы, которую поддерживают триггеры на student_progress"""
+        try:
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT overall_progress FROM student_progress_summary WHERE student_id = ?",
+                    (student_id,)
+                )
+                result = cursor.fetchone()
+                return int(round(result['overall_progress'])) if result else 0
 
-    def get_student_lesson_count(self, student_id: int):
-        """Получение количества занятий ученика"""
-        connection = self.get_connection()
-        if not connection:
+        except sqlite3.Error as e:
+            logger.error("Ошибка получения прогресса: %s", e)
             return 0
 
+    def rebuild_progress_summary(self):
+        """
+        Пересчитать итоговый прогресс по темам (70% тест, 30% оценка репетитора — как в триггерах)
+        и student_progress_summary по всем записям student_progress. Возвращает число учеников.
+        """
+        with self.connection() as conn:
+            # Триггер обновления срабатывает только на изменение оценок, поэтому здесь не вызывается
+            conn.execute("""
+                UPDATE student_progress
+                   SET overall_progress = CASE
+                           WHEN test_score IS NOT NULL AND tutor_feedback_score IS NOT NULL
+                               THEN ROUND(0.7 * test_score + 0.3 * tutor_feedback_score * 20, 2)
+                           WHEN test_score IS NOT NULL THEN ROUND(test_score, 2)
+                           WHEN tutor_feedback_score IS NOT NULL THEN tutor_feedback_score * 20
+                           ELSE COALESCE(overall_progress, 0)
+                       END
+            """)
+            conn.execute("DELETE FROM student_progress_summary")
+            conn.execute("""
+                INSERT INTO student_progress_summary (student_id, topics_count, progress_sum, overall_progress)
+                SELECT student_id, COUNT(*), SUM(overall_progress), ROUND(SUM(overall_progress) / COUNT(*), 2)
+                FROM student_progress
+                GROUP BY student_id
+            """)
+            return conn.execute("SELECT COUNT(*) FROM student_progress_summary").fetchone()[0]
+
+    def record_progress(self, student_id: int, topic_id: int, test_score=None, tutor_feedback_score=None):
+        """
+        Записать результат теста и/или оценку репетитора по теме.
+        Незаданная оценка сохраняет прежнее значение; итоговый прогресс
+        по теме и сводный прогресс ученика пересчитывают триггеры.
+        """
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) as count 
-                FROM lessons 
-                WHERE schedule_id IN (
-                    SELECT id FROM schedule WHERE student_id = ?
-                )
-            """, (student_id,))
+            with self.connection() as connection:
+                connection.execute("""
+                    INSERT INTO student_progress (student_id, topic_id, test_score, tutor_feedback_score)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(student_id, topic_id) DO UPDATE SET
+                        test_score = COALESCE(excluded.test_score, test_score),
+                        tutor_feedback_score = COALESCE(excluded.tutor_feedback_score, tutor_feedback_score)
+                """, (student_id, topic_id, test_score, tutor_feedback_score))
+            return True
 
-            result = cursor.fetchone()
-            return result['count'] if result else 0
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи прогресса: %s", e)
+            return False
+
+    def record_test_score(self, student_id: int, topic_id: int, score):
+        """Записать результат теста (0–100)"""
+        return self.record_progress(student_id, topic_id, test_score=score)
+
+    def record_tutor_feedback(self, student_id: int, topic_id: int, score: int):
+        """Записать оценку репетитора (1–5)"""
+        return self.record_progress(student_id, topic_id, tutor_feedback_score=score)
+
+    def get_student_lesson_count(self, student_id: int):
+        """Получение количества занятий ученика"""
+        try:
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT COUNT(*) as count 
+                    FROM lessons 
+                    WHERE schedule_id IN (
+                        SELECT id FROM schedule WHERE student_id = ?
+                    )
+                """, (student_id,))
+
+                result = cursor.fetchone()
+                return result['count'] if result else 0
 
         except sqlite3.Error as e:
-            print(f"❌ Ошибка получения количества занятий: {e}")
+            logger.error("Ошибка получения количества занятий: %s", e)
             return 0
-        finally:
-            connection.close()
 
     # ====== Блок работы с доходами (income_lessons) ======
 
@@ -398,27 +626,66 @@ class Database:
         """
         Добавить запись о проведённом занятии в income_lessons.
         """
-        conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO income_lessons (tutor_id, lesson_date, student_name, exam, price, status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (tutor_id, date, student, exam, price, status))
-        lesson_id = cur.lastrowid
-        conn.commit()
-        conn.close()
-        return lesson_id
-
-    def get_income_lessons(self, tutor_id):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO income_lessons (tutor_id, lesson_date, student_name, exam, price, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (tutor_id, date, student, exam, price, status))
+            return cur.lastrowid
+
+    def add_income_lessons_batch(self, tutor_id, lessons):
+        """
+        Добавить пачку проведённых занятий одной транзакцией.
+        lessons — словари с ключами client_key, date, schedule_id, student, exam, price, status.
+        Повторная отправка того же client_key игнорируется (уникальный индекс).
+        Возвращает (число добавленных, {client_key: id записи}).
         """
-        Получить все записи доходов данного репетитора.
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany("""
+                INSERT OR IGNORE INTO income_lessons
+                    (tutor_id, lesson_date, student_name, exam, price, status, schedule_id, client_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (tutor_id, l['date'], l['student'], l['exam'], l['price'], l['status'],
+                 l.get('schedule_id'), l['client_key'])
+                for l in lessons
+            ])
+            # rowcount считает только вставленные строки, без изменений триггеров
+            inserted = cur.rowcount
+
+            keys = [l['client_key'] for l in lessons]
+            ids = {}
+            # Порциями, чтобы не упереться в лимит параметров SQLite
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ','.join('?' * len(part))
+                for row in conn.execute(f"""
+                    SELECT id, client_key FROM income_lessons
+                    WHERE tutor_id = ? AND client_key IN ({placeholders})
+                """, (tutor_id, *part)):
+                    ids[row['client_key']] = row['id']
+            return inserted, ids
+
+    def get_income_lessons(self, tutor_id, limit=None, after=None, month=None):
+        """
+        Получить записи доходов данного репетитора, от новых к старым.
         Поля приводим к фронтенд-формату: date, student, exam, price, status.
+
+        Постранично: limit — размер страницы, after — ключ (lesson_date, id) последней
+        записи предыдущей страницы, month — 'YYYY-MM' для выборки одного месяца.
+        Выборка идет по индексу (tutor_id, lesson_date, id) без сортировки всей истории.
         """
-        conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
+        conditions = ["tutor_id = ?"]
+        params = [tutor_id]
+        if month:
+            conditions.append("lesson_date >= ? AND lesson_date < ?")
+            params.extend(_month_bounds(month))
+        if after:
+            conditions.append("(lesson_date, id) < (?, ?)")
+            params.extend(after)
+        query = f"""
             SELECT
                 id,
                 tutor_id,
@@ -429,34 +696,168 @@ class Database:
                 status,
                 created_at
             FROM income_lessons
-            WHERE tutor_id = ?
+            WHERE {' AND '.join(conditions)}
             ORDER BY lesson_date DESC, id DESC
-        """, (tutor_id,))
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
-        return rows
+        """
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self.connection() as conn:
+            return [dict(r) for r in conn.execute(query, params).fetchall()]
+
+    def get_income_summary(self, tutor_id):
+        """
+        Итоги доходов по месяцам и статусам и сумма оплаченных занятий по экзаменам.
+        Читаются из income_monthly, которую поддерживают триггеры на income_lessons.
+        """
+        with self.connection() as conn:
+            by_month = conn.execute("""
+                SELECT month_year AS month, status,
+                       SUM(lesson_count) AS count, SUM(total) AS total
+                FROM income_monthly
+                WHERE tutor_id = ?
+                GROUP BY month_year, status
+                ORDER BY month_year
+            """, (tutor_id,)).fetchall()
+            by_exam = conn.execute("""
+                SELECT exam, SUM(lesson_count) AS count, SUM(total) AS total
+                FROM income_monthly
+                WHERE tutor_id = ? AND status = 'paid'
+                GROUP BY exam
+                ORDER BY total DESC
+            """, (tutor_id,)).fetchall()
+            return {
+                'by_month': [dict(r) for r in by_month],
+                'by_exam': [dict(r) for r in by_exam],
+            }
 
     def update_income_status(self, lesson_id, tutor_id, new_status):
         """
         Обновить статус оплаты занятия.
         """
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE income_lessons
-               SET status = ?
-             WHERE id = ? AND tutor_id = ?
-        """, (new_status, lesson_id, tutor_id))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            conn.execute("""
+                UPDATE income_lessons
+                   SET status = ?
+                 WHERE id = ? AND tutor_id = ?
+            """, (new_status, lesson_id, tutor_id))
 
     def reset_income(self, tutor_id):
         """
         Полностью очистить доходы репетитора.
         """
-        conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM income_lessons WHERE tutor_id = ?", (tutor_id,))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            conn.execute("DELETE FROM income_lessons WHERE tutor_id = ?", (tutor_id,))
+
+    # Итоги, пересчитанные напрямую по income_lessons
+    _INCOME_ROLLUP_SOURCE = """
+        SELECT tutor_id, substr(lesson_date, 1, 7) AS month_year, status, exam,
+               COUNT(*) AS lesson_count, SUM(price) AS total
+        FROM income_lessons
+        {where}
+        GROUP BY tutor_id, month_year, status, exam
+    """
+
+    def rebuild_income_rollups(self, tutor_id=None):
+        """Пересчитать income_monthly по income_lessons (для всех или одного репетитора)"""
+        where, params = ("WHERE tutor_id = ?", (tutor_id,)) if tutor_id is not None else ("", ())
+        with self.connection() as conn:
+            conn.execute(f"DELETE FROM income_monthly {where}", params)
+            conn.execute(f"""
+                INSERT INTO income_monthly (tutor_id, month_year, status, exam, lesson_count, total)
+                {self._INCOME_ROLLUP_SOURCE.format(where=where)}
+            """, params)
+            return conn.execute(f"SELECT COUNT(*) FROM income_monthly {where}", params).fetchone()[0]
+
+    def check_income_rollups(self):
+        """
+        Сравнить income_monthly с пересчетом по income_lessons.
+        Возвращает список расхождений: (tutor_id, month_year, status, exam, ожидалось, сохранено).
+        """
+        with self.connection() as conn:
+            expected = {
+                (r['tutor_id'], r['month_year'], r['status'], r['exam']): (r['lesson_count'], r['total'])
+                for r in conn.execute(self._INCOME_ROLLUP_SOURCE.format(where=""))
+            }
+            stored = {
+                (r['tutor_id'], r['month_year'], r['status'], r['exam']): (r['lesson_count'], r['total'])
+                for r in conn.execute("SELECT * FROM income_monthly")
+            }
+        return [
+            (*key, expected.get(key), stored.get(key))
+            for key in sorted(expected.keys() | stored.keys())
+            if expected.get(key) != stored.get(key)
+        ]
+
+    # ====== Блок работы со сгенерированными тестами (tests) ======
+
+    def save_test(self, raw_text, questions, material_name=None, material_text=None, source_key=None):
+        """
+        Сохранить тест с вопросами и вариантами ответа.
+        questions — список словарей {'text', 'options': [(буква, текст)], 'correct'}.
+        Повторное сохранение того же текста возвращает id существующего теста.
+        """
+        content_hash = hashlib.sha256(raw_text.encode('utf-8')).hexdigest()
+        with self.connection() as conn:
+            row = conn.execute("SELECT id FROM tests WHERE content_hash = ?", (content_hash,)).fetchone()
+            if row:
+                return row['id']
+
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO tests (content_hash, source_key, material_name, material_text, raw_text, question_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (content_hash, source_key, material_name, material_text, raw_text, len(questions)))
+            test_id = cur.lastrowid
+
+            for position, question in enumerate(questions, start=1):
+                cur.execute("""
+                    INSERT INTO test_questions (test_id, position, text, correct_option)
+                    VALUES (?, ?, ?, ?)
+                """, (test_id, position, question['text'], question.get('correct')))
+                question_id = cur.lastrowid
+                cur.executemany(
+                    "INSERT INTO test_options (question_id, letter, text) VALUES (?, ?, ?)",
+                    [(question_id, letter, text) for letter, text in question['options']]
+                )
+            return test_id
+
+    def find_test_by_source(self, source_key):
+        """Последний сохраненный тест для ключа генерации"""
+        with self.connection() as conn:
+            row = conn.execute("""
+                SELECT id FROM tests WHERE source_key = ? ORDER BY id DESC LIMIT 1
+            """, (source_key,)).fetchone()
+            return row['id'] if row else None
+
+    def get_test(self, test_id):
+        """Тест с вопросами и вариантами ответа"""
+        with self.connection() as conn:
+            test = conn.execute("""
+                SELECT id, material_name, material_text, raw_text, question_count, created_at
+                FROM tests WHERE id = ?
+            """, (test_id,)).fetchone()
+            if not test:
+                return None
 
+            result = dict(test)
+            questions = {}
+            for row in conn.execute("""
+                SELECT q.id, q.position, q.text, q.correct_option, o.letter, o.text AS option_text
+                FROM test_questions q
+                LEFT JOIN test_options o ON o.question_id = q.id
+                WHERE q.test_id = ?
+                ORDER BY q.position, o.letter
+            """, (test_id,)):
+                question = questions.setdefault(row['id'], {
+                    'position': row['position'],
+                    'text': row['text'],
+                    'correct': row['correct_option'],
+                    'options': []
+                })
+                if row['letter']:
+                    question['options'].append({'letter': row['letter'], 'text': row['option_text']})
+
+            result['questions'] = list(questions.values())
+            return result
@@ -0,0 +1,52 @@
+"""
+Проверка и пересчет месячных итогов доходов (таблица income_monthly).
+
+Итоги поддерживаются триггерами на income_lessons; команда нужна, если данные
+менялись в обход триггеров или после восстановления из резервной копии.
+Запуск из каталога tutor/:
+
+    python -m database.income_rollups --check
+    python -m database.income_rollups --rebuild
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import Database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка и пересчет месячных итогов доходов")
+    parser.add_argument('--db', default='database/tutoring.db', help="путь к базе данных")
+    parser.add_argument('--rebuild', action='store_true', help="пересчитать итоги по income_lessons")
+    parser.add_argument('--check', action='store_true', help="только проверить (по умолчанию)")
+    parser.add_argument('--tutor', type=int, help="пересчитать итоги только одного репетитора")
+    args = parser.parse_args(argv)
+    # Предупреждения и ошибки сервисов — в консоль вместе с выводом команды
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+
+    db = Database(args.db)
+    db.migrate()
+
+    if args.rebuild:
+        rows = db.rebuild_income_rollups(args.tutor)
+        print(f"✅ Итоги пересчитаны, строк: {rows}")
+
+    mismatches = db.check_income_rollups()
+    if not mismatches:
+        print("✅ Итоги доходов совпадают с income_lessons")
+        return 0
+
+    print(f"❌ Расхождений: {len(mismatches)}")
+    for tutor_id, month_year, status, exam, expected, stored in mismatches:
+        print(f"   репетитор {tutor_id}, {month_year}, {status}, {exam}: "
+              f"ожидалось {expected}, в итогах {stored}")
+    print("   Исправить: python -m database.income_rollups --rebuild")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
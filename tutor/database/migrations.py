@@ -0,0 +1,252 @@
+"""
+Версионированные миграции схемы.
+
+Номер примененной миграции хранится в PRAGMA user_version. При запуске применяются
+только миграции с большим номером, все в одной транзакции; для актуальной базы
+запуск — одно чтение user_version.
+
+schema.sql — исходная схема (миграция 1). Новые изменения схемы добавляются
+в конец MIGRATIONS, а не в schema.sql.
+"""
+import logging
+import os
+import sqlite3
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+logger = logging.getLogger(__name__)
+
+
+def split_statements(script):
+    """Разбить SQL-скрипт на отдельные команды (триггеры с BEGIN ... END не разрываются)"""
+    statements = []
+    current = ''
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statement = current.strip()
+            if statement.rstrip(';').strip():
+                statements.append(statement)
+            current = ''
+    if current.strip():
+        statements.append(current.strip())
+    return statements
+
+
+def _columns(cursor, table):
+    return [column[1] for column in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _baseline(db, cursor):
+    """
+    Исходная схема: schema.sql и дополнения, которые раньше делал update_schema().
+    Рассчитана и на новую базу, и на базу, созданную до появления миграций.
+    """
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        script = f.read()
+    # executescript фиксирует транзакцию, поэтому команды выполняются по одной
+    for statement in split_statements(script):
+        cursor.execute(statement)
+
+    if 'exam_type' not in _columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN exam_type VARCHAR(10) CHECK (exam_type IN ("oge", "ege"))')
+
+    if 'test_id' not in _columns(cursor, 'test_jobs'):
+        cursor.execute('ALTER TABLE test_jobs ADD COLUMN test_id INTEGER REFERENCES tests(id) ON DELETE SET NULL')
+
+    if 'day_ord' not in _columns(cursor, 'schedule'):
+        cursor.execute('ALTER TABLE schedule ADD COLUMN day_ord INTEGER')
+        cursor.execute("""
+            UPDATE schedule
+               SET day_ord = CASE lower(day_of_week)
+                       WHEN 'monday'    THEN 1
+                       WHEN 'tuesday'   THEN 2
+                       WHEN 'wednesday' THEN 3
+                       WHEN 'thursday'  THEN 4
+                       WHEN 'friday'    THEN 5
+                       WHEN 'saturday'  THEN 6
+                       WHEN 'sunday'    THEN 7
+                   END
+        """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedule_tutor_day
+        ON schedule(tutor_id, status, day_ord, start_time)
+    """)
+
+    if 'client_key' not in _columns(cursor, 'income_lessons'):
+        cursor.execute('ALTER TABLE income_lessons ADD COLUMN schedule_id INTEGER')
+        cursor.execute('ALTER TABLE income_lessons ADD COLUMN client_key TEXT')
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_income_lessons_client_key
+        ON income_lessons(tutor_id, client_key)
+    """)
+
+    # Месячные итоги доходов появились позже записей — заполняем один раз
+    has_rollups = cursor.execute("SELECT 1 FROM income_monthly LIMIT 1").fetchone()
+    has_lessons = cursor.execute("SELECT 1 FROM income_lessons LIMIT 1").fetchone()
+    if has_lessons and not has_rollups:
+        db.rebuild_income_rollups()
+
+    # Пользователь tutor: в старых базах он мог быть отключен или с другой ролью
+    cursor.execute("""
+        INSERT OR IGNORE INTO users (username, password_hash, role, first_name, last_name, lesson_price, contact_info, is_active)
+        VALUES ('tutor', 'tutor', 'tutor', 'Главный', 'Репетитор', 1500.00, 'tutor@example.com', 1)
+    """)
+    cursor.execute("""
+        UPDATE users
+        SET password_hash = 'tutor',
+            is_active = 1,
+            role = 'tutor'
+        WHERE username = 'tutor'
+    """)
+
+
+def _test_jobs_worker_pid(db, cursor):
+    """pid процесса, выполняющего задание генерации"""
+    if 'worker_pid' not in _columns(cursor, 'test_jobs'):
+        cursor.execute('ALTER TABLE test_jobs ADD COLUMN worker_pid INTEGER')
+
+
+def _materials_tutor_created(db, cursor):
+    """Материалы репетитора по убыванию даты — по индексу, без сортировки"""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_materials_tutor_created
+        ON materials(tutor_id, created_at)
+    """)
+
+
+# Триггеры версий данных: (таблица, событие, выражение для id репетитора, области)
+VERSION_TRIGGERS = [
+    ('users', 'INSERT', 'NEW.created_by', ('students',)),
+    ('users', 'UPDATE', 'NEW.created_by', ('students',)),
+    ('users', 'DELETE', 'OLD.created_by', ('students',)),
+    # day_ord заполняется триггером после вставки — его изменение версию не трогает
+    ('schedule', 'INSERT', 'NEW.tutor_id', ('students', 'schedule')),
+    ('schedule', 'UPDATE OF student_id, tutor_id, day_of_week, start_time, end_time, status',
+     'NEW.tutor_id', ('students', 'schedule')),
+    ('schedule', 'DELETE', 'OLD.tutor_id', ('students', 'schedule')),
+    ('lessons', 'INSERT', '(SELECT tutor_id FROM schedule WHERE id = NEW.schedule_id)', ('students',)),
+    ('lessons', 'DELETE', '(SELECT tutor_id FROM schedule WHERE id = OLD.schedule_id)', ('students',)),
+    ('student_progress', 'INSERT', '(SELECT created_by FROM users WHERE id = NEW.student_id)', ('students',)),
+    ('student_progress', 'UPDATE', '(SELECT created_by FROM users WHERE id = NEW.student_id)', ('students',)),
+    ('materials', 'INSERT', 'NEW.tutor_id', ('materials',)),
+    ('materials', 'UPDATE', 'NEW.tutor_id', ('materials',)),
+    ('materials', 'DELETE', 'OLD.tutor_id', ('materials',)),
+]
+
+
+def _data_versions(db, cursor):
+    """
+    Версии данных репетиторов для ETag и индекса расписания. Увеличиваются триггерами
+    в той же транзакции, что и изменение, поэтому одинаковы во всех процессах сервера.
+    Начальная версия случайна: после пересоздания базы старые ETag не совпадут.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            tutor_id INTEGER NOT NULL,
+            scope TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (tutor_id, scope)
+        ) WITHOUT ROWID
+    """)
+    for table, event, tutor_expr, scopes in VERSION_TRIGGERS:
+        _create_version_trigger(cursor, table, event, tutor_expr, scopes)
+
+
+def _create_version_trigger(cursor, table, event, tutor_expr, scopes):
+    name = f"trg_{table}_{event.split()[0].lower()}_version"
+    bumps = ''.join(f"""
+    INSERT INTO data_versions (tutor_id, scope, version)
+    SELECT {tutor_expr}, '{scope}', abs(random() % 1000000000) WHERE {tutor_expr} IS NOT NULL
+    ON CONFLICT(tutor_id, scope) DO UPDATE SET version = version + 1;""" for scope in scopes)
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table}\nBEGIN{bumps}\nEND")
+
+
+def _events(db, cursor):
+    """Журнал событий ленты: процессы сервера читают публикации друг друга (services.events.EventLog)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tutor_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT,
+            origin TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at)")
+
+
+def _progress_summary_backfill(db, cursor):
+    """
+    Сводный прогресс для записей student_progress, сделанных до появления триггеров:
+    без строки в student_progress_summary ученик показывался с 0%, а триггер обновления
+    не находил строку и терял последующие оценки.
+    """
+    db.rebuild_progress_summary()
+
+
+def _materials_version_content_only(db, cursor):
+    """Скачивание (download_count) не меняет список материалов — версию и ETag не трогает"""
+    cursor.execute("DROP TRIGGER IF EXISTS trg_materials_update_version")
+    _create_version_trigger(
+        cursor, 'materials',
+        'UPDATE OF tutor_id, title, description, file_type, file_size, file_path, category, exam_type',
+        'NEW.tutor_id', ('materials',))
+
+
+def _data_versions_epoch(db, cursor):
+    """
+    Случайная эпоха базы (tutor_id = 0, scope = 'epoch') — версия данных, которые еще не менялись.
+    Без нее такие ETag были бы одинаковыми (…-0) и в пересозданной базе.
+    """
+    cursor.execute("""
+        INSERT OR IGNORE INTO data_versions (tutor_id, scope, version)
+        VALUES (0, 'epoch', abs(random() % 1000000000))
+    """)
+
+
+# (номер, описание, функция(db, cursor)); номера идут подряд и не меняются после выпуска
+MIGRATIONS = [
+    (1, 'Исходная схема', _baseline),
+    (2, 'Процесс задания генерации', _test_jobs_worker_pid),
+    (3, 'Индекс материалов по репетитору и дате', _materials_tutor_created),
+    (4, 'Версии данных репетиторов', _data_versions),
+    (5, 'Журнал событий ленты', _events),
+    (6, 'Сводный прогресс существующих учеников', _progress_summary_backfill),
+    (7, 'Версия материалов без учета скачиваний', _materials_version_content_only),
+    (8, 'Эпоха версий данных', _data_versions_epoch),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db):
+    """
+    Применить недостающие миграции. Возвращает список примененных номеров
+    (пустой, если база уже актуальна).
+    """
+    with db.connection() as connection:
+        if schema_version(connection) >= LATEST_VERSION:
+            return []
+
+        # Блокировка записи до повторной проверки: параллельный процесс мог уже обновить базу
+        connection.execute("BEGIN IMMEDIATE")
+        current = schema_version(connection)
+        cursor = connection.cursor()
+        applied = []
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info("Миграция %s: %s", version, description)
+            apply(db, cursor)
+            applied.append(version)
+        if applied:
+            # user_version меняется в той же транзакции и откатывается вместе с ней
+            cursor.execute(f"PRAGMA user_version = {int(applied[-1])}")
+            logger.info("Схема базы данных обновлена до версии %s", applied[-1])
+        return applied
@@ -0,0 +1,138 @@
+"""
+Профилирование SQL-запросов Database.
+
+Включается настройкой TUTOR_SQL_PROFILE=1 (Config.sql_profile). Запросы группируются
+по отпечатку — тексту с литералами, замененными на ?, — и для каждого считаются число
+вызовов, суммарное время и p95. Запросы дольше порога пишутся в лог; в режиме отладки
+для каждого нового отпечатка выполняется EXPLAIN QUERY PLAN и полный просмотр таблицы
+(SCAN без индекса) отмечается предупреждением.
+"""
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+# В полном просмотре таблицы нет USING INDEX; SCAN CONSTANT ROW и подзапросы не в счет
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW|SUBQUERY|\()(\S+)(?:(?! USING ).)*$')
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+
+def fingerprint(sql):
+    """Нормализованный текст запроса: без комментариев, литералов и лишних пробелов"""
+    text = _COMMENT.sub(' ', sql)
+    text = _STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(?, ...)', text)
+    return _SPACES.sub(' ', text).strip().rstrip(';')
+
+
+def full_scans(plan_rows):
+    """Таблицы, которые план просматривает целиком"""
+    tables = []
+    for row in plan_rows:
+        match = _FULL_SCAN.match(row[3])
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+class _Stats:
+    __slots__ = ('count', 'total', 'max', 'recent')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def p95(self):
+        ordered = sorted(self.recent)
+        return ordered[max(math.ceil(len(ordered) * 0.95) - 1, 0)] if ordered else 0.0
+
+
+class QueryProfiler:
+    """
+    Статистика запросов по отпечаткам. Подключается к Database(profiler=...);
+    соединения вызывают record() после каждого execute().
+
+    p95 считается по последним window вызовам отпечатка.
+    """
+
+    def __init__(self, slow_ms=100.0, explain=False, window=500):
+        self.slow_seconds = slow_ms / 1000
+        self.explain = explain
+        self.window = window
+        self._stats = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def record(self, connection, sql, parameters, seconds):
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _Stats(self.window)
+            stats.add(seconds)
+            need_plan = self.explain and key not in self._plans
+            if need_plan:
+                self._plans[key] = None
+
+        if seconds >= self.slow_seconds:
+            logger.warning("Медленный запрос %.1f мс: %s", seconds * 1000, key)
+        if need_plan:
+            self._explain(connection, key, sql, parameters)
+
+    def _explain(self, connection, key, sql, parameters):
+        if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return
+        try:
+            # Обычный курсор: план не должен снова попасть в профилировщик
+            rows = sqlite3.Cursor(connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error as e:
+            logger.debug("EXPLAIN QUERY PLAN не выполнен: %s", e)
+            return
+        plan = [row[3] for row in rows]
+        with self._lock:
+            self._plans[key] = plan
+        scans = full_scans(rows)
+        if scans:
+            logger.warning("Полный просмотр таблицы %s: %s | план: %s", ', '.join(scans), key, '; '.join(plan))
+
+    def report(self, limit=None):
+        """Отпечатки по убыванию суммарного времени"""
+        with self._lock:
+            rows = [
+                {
+                    'query': key,
+                    'count': stats.count,
+                    'total_ms': round(stats.total * 1000, 3),
+                    'avg_ms': round(stats.total * 1000 / stats.count, 3),
+                    'p95_ms': round(stats.p95() * 1000, 3),
+                    'max_ms': round(stats.max * 1000, 3),
+                    'plan': self._plans.get(key),
+                    'full_scan': full_scans([(0, 0, 0, step) for step in self._plans.get(key) or []]),
+                }
+                for key, stats in self._stats.items()
+            ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
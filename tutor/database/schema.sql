@@ -37,11 +37,45 @@ CREATE TABLE IF NOT EXISTS schedule (
     lesson_link TEXT,
     status VARCHAR(20) DEFAULT 'active' CHECK (status IN ('active', 'cancelled', 'completed')),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    day_ord INTEGER,                    -- номер дня недели (1 — понедельник), заполняется триггером
     FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (tutor_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
 );
 
+-- Номер дня недели хранится в day_ord, чтобы сортировка и выборка по дням шли по индексу
+CREATE TRIGGER IF NOT EXISTS trg_schedule_day_ord_insert
+AFTER INSERT ON schedule
+BEGIN
+    UPDATE schedule
+       SET day_ord = CASE lower(NEW.day_of_week)
+               WHEN 'monday'    THEN 1
+               WHEN 'tuesday'   THEN 2
+               WHEN 'wednesday' THEN 3
+               WHEN 'thursday'  THEN 4
+               WHEN 'friday'    THEN 5
+               WHEN 'saturday'  THEN 6
+               WHEN 'sunday'    THEN 7
+           END
+     WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedule_day_ord_update
+AFTER UPDATE OF day_of_week ON schedule
+BEGIN
+    UPDATE schedule
+       SET day_ord = CASE lower(NEW.day_of_week)
+               WHEN 'monday'    THEN 1
+               WHEN 'tuesday'   THEN 2
+               WHEN 'wednesday' THEN 3
+               WHEN 'thursday'  THEN 4
+               WHEN 'friday'    THEN 5
+               WHEN 'saturday'  THEN 6
+               WHEN 'sunday'    THEN 7
+           END
+     WHERE id = NEW.id;
+END;
+
 -- Таблица проведенных уроков
 CREATE TABLE IF NOT EXISTS lessons (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -72,6 +106,78 @@ CREATE TABLE IF NOT EXISTS student_progress (
     UNIQUE(student_id, topic_id)
 );
 
+-- Сводный прогресс ученика по всем темам.
+-- Поддерживается триггерами на student_progress, чтение — один поиск по ключу
+CREATE TABLE IF NOT EXISTS student_progress_summary (
+    student_id INTEGER PRIMARY KEY,
+    topics_count INTEGER NOT NULL DEFAULT 0,
+    progress_sum DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    overall_progress DECIMAL(5,2) NOT NULL DEFAULT 0.00,
+    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Итоговый прогресс по теме: 70% — результат теста (0–100), 30% — оценка репетитора (1–5 → 20–100).
+-- Если есть только одна из оценок, берется она.
+CREATE TRIGGER IF NOT EXISTS trg_student_progress_insert
+AFTER INSERT ON student_progress
+BEGIN
+    UPDATE student_progress
+       SET overall_progress = CASE
+               WHEN NEW.test_score IS NOT NULL AND NEW.tutor_feedback_score IS NOT NULL
+                   THEN ROUND(0.7 * NEW.test_score + 0.3 * NEW.tutor_feedback_score * 20, 2)
+               WHEN NEW.test_score IS NOT NULL THEN ROUND(NEW.test_score, 2)
+               WHEN NEW.tutor_feedback_score IS NOT NULL THEN NEW.tutor_feedback_score * 20
+               ELSE COALESCE(NEW.overall_progress, 0)
+           END
+     WHERE id = NEW.id;
+
+    INSERT INTO student_progress_summary (student_id, topics_count, progress_sum, overall_progress)
+    SELECT NEW.student_id, 1, overall_progress, overall_progress
+      FROM student_progress WHERE id = NEW.id
+    ON CONFLICT(student_id) DO UPDATE SET
+        topics_count = topics_count + 1,
+        progress_sum = progress_sum + excluded.progress_sum,
+        overall_progress = ROUND((progress_sum + excluded.progress_sum) / (topics_count + 1), 2),
+        last_updated = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_student_progress_update
+AFTER UPDATE OF test_score, tutor_feedback_score ON student_progress
+BEGIN
+    UPDATE student_progress
+       SET overall_progress = CASE
+               WHEN NEW.test_score IS NOT NULL AND NEW.tutor_feedback_score IS NOT NULL
+                   THEN ROUND(0.7 * NEW.test_score + 0.3 * NEW.tutor_feedback_score * 20, 2)
+               WHEN NEW.test_score IS NOT NULL THEN ROUND(NEW.test_score, 2)
+               WHEN NEW.tutor_feedback_score IS NOT NULL THEN NEW.tutor_feedback_score * 20
+               ELSE 0
+           END,
+           last_updated = CURRENT_TIMESTAMP
+     WHERE id = NEW.id;
+
+    UPDATE student_progress_summary
+       SET progress_sum = progress_sum - OLD.overall_progress
+                          + (SELECT overall_progress FROM student_progress WHERE id = NEW.id),
+           overall_progress = ROUND((progress_sum - OLD.overall_progress
+                          + (SELECT overall_progress FROM student_progress WHERE id = NEW.id)) / topics_count, 2),
+           last_updated = CURRENT_TIMESTAMP
+     WHERE student_id = NEW.student_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_student_progress_delete
+AFTER DELETE ON student_progress
+BEGIN
+    UPDATE student_progress_summary
+       SET topics_count = topics_count - 1,
+           progress_sum = progress_sum - OLD.overall_progress,
+           overall_progress = CASE WHEN topics_count > 1
+               THEN ROUND((progress_sum - OLD.overall_progress) / (topics_count - 1), 2)
+               ELSE 0 END,
+           last_updated = CURRENT_TIMESTAMP
+     WHERE student_id = OLD.student_id;
+END;
+
 -- Таблица запросов на перенос
 CREATE TABLE IF NOT EXISTS rescheduling_requests (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -142,5 +248,134 @@ CREATE TABLE IF NOT EXISTS income_lessons (
     exam TEXT NOT NULL,                 -- 'ОГЭ' / 'ЕГЭ' или 'oge'/'ege'
     price INTEGER NOT NULL,
     status TEXT NOT NULL CHECK (status IN ('pending', 'paid', 'overdue')),
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    schedule_id INTEGER,                -- слот расписания, по которому проведено занятие
+    client_key TEXT                     -- ключ клиента '2025-11-24-<schedule_id>'; уникален у репетитора
+);
+-- Постраничная выборка по ключу (lesson_date, id) в пределах репетитора
+CREATE INDEX IF NOT EXISTS idx_income_lessons_tutor_date ON income_lessons(tutor_id, lesson_date, id);
+
+-- Месячные итоги доходов по репетитору, статусу и экзамену.
+-- Поддерживаются триггерами на income_lessons; сводка доходов читает несколько строк вместо всей истории.
+-- (Таблица income привязана к lessons и ученикам, а не к репетитору, и не подходит для income_lessons.)
+CREATE TABLE IF NOT EXISTS income_monthly (
+    tutor_id INTEGER NOT NULL,
+    month_year VARCHAR(7) NOT NULL,     -- '2025-11'
+    status TEXT NOT NULL,
+    exam TEXT NOT NULL,
+    lesson_count INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tutor_id, month_year, status, exam)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_income_lessons_insert
+AFTER INSERT ON income_lessons
+BEGIN
+    INSERT INTO income_monthly (tutor_id, month_year, status, exam, lesson_count, total)
+    VALUES (NEW.tutor_id, substr(NEW.lesson_date, 1, 7), NEW.status, NEW.exam, 1, NEW.price)
+    ON CONFLICT (tutor_id, month_year, status, exam) DO UPDATE
+       SET lesson_count = lesson_count + 1,
+           total = total + excluded.total;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_income_lessons_update
+AFTER UPDATE OF tutor_id, lesson_date, exam, price, status ON income_lessons
+BEGIN
+    UPDATE income_monthly
+       SET lesson_count = lesson_count - 1,
+           total = total - OLD.price
+     WHERE tutor_id = OLD.tutor_id AND month_year = substr(OLD.lesson_date, 1, 7)
+       AND status = OLD.status AND exam = OLD.exam;
+    DELETE FROM income_monthly
+     WHERE tutor_id = OLD.tutor_id AND month_year = substr(OLD.lesson_date, 1, 7)
+       AND status = OLD.status AND exam = OLD.exam AND lesson_count <= 0;
+
+    INSERT INTO income_monthly (tutor_id, month_year, status, exam, lesson_count, total)
+    VALUES (NEW.tutor_id, substr(NEW.lesson_date, 1, 7), NEW.status, NEW.exam, 1, NEW.price)
+    ON CONFLICT (tutor_id, month_year, status, exam) DO UPDATE
+       SET lesson_count = lesson_count + 1,
+           total = total + excluded.total;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_income_lessons_delete
+AFTER DELETE ON income_lessons
+BEGIN
+    UPDATE income_monthly
+       SET lesson_count = lesson_count - 1,
+           total = total - OLD.price
+     WHERE tutor_id = OLD.tutor_id AND month_year = substr(OLD.lesson_date, 1, 7)
+       AND status = OLD.status AND exam = OLD.exam;
+    DELETE FROM income_monthly
+     WHERE tutor_id = OLD.tutor_id AND month_year = substr(OLD.lesson_date, 1, 7)
+       AND status = OLD.status AND exam = OLD.exam AND lesson_count <= 0;
+END;
+
+
+-- Кэш сгенерированных LLM тестов (ключ — sha256 промпта, модели и параметров)
+CREATE TABLE IF NOT EXISTS llm_test_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    material_name VARCHAR(255),
+    model VARCHAR(100) NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,           -- unix time
+    last_access REAL NOT NULL,          -- unix time
+    hit_count INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_test_cache_last_access ON llm_test_cache(last_access);
+
+-- Задания фоновой генерации тестов
+CREATE TABLE IF NOT EXISTS test_jobs (
+    id CHAR(32) PRIMARY KEY,
+    user_id INTEGER,
+    material_name VARCHAR(255),
+    material_text TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    result TEXT,
+    error TEXT,
+    test_id INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE SET NULL
+);
+CREATE INDEX IF NOT EXISTS idx_test_jobs_status ON test_jobs(status);
+
+-- Сгенерированные тесты в структурированном виде: хранятся один раз и переиспользуются
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_hash CHAR(64) NOT NULL UNIQUE,  -- sha256 текста ответа модели
+    source_key CHAR(64),                    -- ключ кэша генерации (материал + промпт + модель)
+    material_name VARCHAR(255),
+    material_text TEXT,
+    raw_text TEXT NOT NULL,
+    question_count INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_tests_source_key ON tests(source_key);
+
+CREATE TABLE IF NOT EXISTS test_questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    test_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    correct_option CHAR(1),
+    FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE CASCADE,
+    UNIQUE(test_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS test_options (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question_id INTEGER NOT NULL,
+    letter CHAR(1) NOT NULL,
+    text TEXT NOT NULL,
+    FOREIGN KEY (question_id) REFERENCES test_questions(id) ON DELETE CASCADE,
+    UNIQUE(question_id, letter)
+);
+
+-- Серверные сессии: в cookie хранится только подписанный id
+CREATE TABLE IF NOT EXISTS sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL            -- unix time
 );
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
@@ -0,0 +1,7 @@
+# Настройки gunicorn для wsgi.py; параметры командной строки имеют приоритет
+bind = '0.0.0.0:8000'
+# Лента /api/events и потоковая генерация держат соединение — нужен потоковый воркер
+worker_class = 'gthread'
+workers = 4
+# Одновременных соединений на процесс, включая открытые ленты
+threads = 8
@@ -0,0 +1,143 @@
+import logging
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+from llm.full_prompt import build_prompt
+from llm.test_format import split_questions, parse_question, LEADING_NUMBER
+
+logger = logging.getLogger(__name__)
+
+# Грубая оценка для кириллицы: около трех символов на токен
+CHARS_PER_TOKEN = 3
+# Материал больше этого порога генерируется по частям
+MAX_SINGLE_PROMPT_TOKENS = 2000
+# Бюджет материала в одном промпте части
+CHUNK_TOKENS = 1500
+CHUNK_CONCURRENCY = 3
+
+MIN_QUESTIONS = 5
+MAX_QUESTIONS = 7
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def needs_chunking(material_text: str) -> bool:
+    return estimate_tokens(material_text) > MAX_SINGLE_PROMPT_TOKENS
+
+
+def _hard_split(text: str, max_chars: int) -> List[str]:
+    """Разбиение слишком длинного абзаца по словам"""
+    pieces, current = [], ''
+    for word in text.split(' '):
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_material(material_text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Разбить материал на части не больше max_tokens.
+    Границы выбираются по пустым строкам (разделы), затем по строкам, затем по словам.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    units = []
+    for section in re.split(r'\n\s*\n', material_text):
+        section = section.strip()
+        if not section:
+            continue
+        if len(section) <= max_chars:
+            units.append(section)
+            continue
+        for line in section.split('\n'):
+            line = line.strip()
+            if line:
+                units.extend([line] if len(line) <= max_chars else _hard_split(line, max_chars))
+
+    chunks, current = [], ''
+    for unit in units:
+        if current and len(current) + 2 + len(unit) > max_chars:
+            chunks.append(current)
+            current = unit
+        else:
+            current = f"{current}\n\n{unit}" if current else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _question_fingerprint(block: str) -> str:
+    """Нормализованная формулировка вопроса без номера и вариантов — для поиска дублей"""
+    question = parse_question(block)
+    stem = question.text if question else LEADING_NUMBER.sub('', block, count=1)
+    return ' '.join(re.findall(r'\w+', stem.lower()))
+
+
+def merge_questions(per_chunk: List[List[str]], max_questions: int = MAX_QUESTIONS) -> List[str]:
+    """
+    Свести вопросы частей в один тест: убрать дубли и брать вопросы
+    по очереди из каждой части, чтобы тест покрывал весь материал.
+    """
+    seen = set()
+    queues = []
+    for blocks in per_chunk:
+        unique = []
+        for block in blocks:
+            fingerprint = _question_fingerprint(block)
+            if fingerprint and fingerprint not in seen:
+                seen.add(fingerprint)
+                unique.append(block)
+        queues.append(unique)
+
+    selected = []
+    while len(selected) < max_questions and any(queues):
+        for queue in queues:
+            if queue and len(selected) < max_questions:
+                selected.append(queue.pop(0))
+    return selected
+
+
+def renumber(blocks: List[str]) -> str:
+    return '\n\n'.join(
+        f"{i}. {LEADING_NUMBER.sub('', block, count=1)}" for i, block in enumerate(blocks, start=1)
+    )
+
+
+def generate_chunked(material_text: str, complete, concurrency: int = CHUNK_CONCURRENCY, on_progress=None) -> str:
+    """
+    Генерация теста по большому материалу: вопросы по каждой части параллельно (map),
+    затем объединение с удалением дублей в итоговые 5–7 вопросов (reduce).
+    complete(prompt) -> текст ответа модели или сообщение об ошибке с «❌».
+    on_progress(готово, всего) вызывается до начала и после каждой обработанной части.
+    """
+    chunks = split_material(material_text)
+    per_chunk_count = max(2, math.ceil(MAX_QUESTIONS / len(chunks)))
+    prompts = [build_prompt(chunk, question_count=str(per_chunk_count)) for chunk in chunks]
+
+    results = [None] * len(prompts)
+    if on_progress:
+        on_progress(0, len(prompts))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(prompts)))) as executor:
+        futures = {executor.submit(complete, prompt): i for i, prompt in enumerate(prompts)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, len(prompts))
+
+    errors = [result for result in results if result.startswith("❌")]
+    per_chunk = [split_questions(result) for result in results if not result.startswith("❌")]
+    questions = merge_questions(per_chunk)
+
+    if not questions:
+        return errors[0] if errors else "❌ Ошибка: модель не вернула ни одного вопроса."
+    if len(questions) < MIN_QUESTIONS and errors:
+        logger.warning("Часть материала не обработана (%s из %s): %s", len(errors), len(results), errors[0])
+    return renumber(questions)
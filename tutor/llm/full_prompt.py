@@ -1,7 +1,7 @@
-def build_prompt(material_text: str) -> str:
+def build_prompt(material_text: str, question_count: str = "5–7") -> str:
     return f"""
 Ты — генератор образовательных тестов. 
-Создай 5–7 тестовых вопросов по материалу ниже.
+Создай {question_count} тестовых вопросов по материалу ниже.
 
 Требования к тестам:
 - Каждый вопрос должен быть САМОСТОЯТЕЛЬНЫМ.
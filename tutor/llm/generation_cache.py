@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCache:
+    """
+    Кэш сгенерированных тестов с адресацией по содержимому.
+
+    Ключ — sha256 от промпта (материал + шаблон build_prompt), модели и параметров генерации.
+    Первый уровень — ограниченный LRU в памяти процесса, второй — таблица llm_test_cache
+    в SQLite с удалением по TTL и по размеру.
+    """
+
+    def __init__(self, db=None, max_memory_entries=64, max_disk_entries=500, ttl_seconds=7 * 24 * 3600):
+        self.db = db
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: float, **params) -> str:
+        """Ключ кэша: хэш промпта, модели, температуры и прочих параметров запроса"""
+        payload = json.dumps(
+            {'prompt': prompt, 'model': model, 'temperature': temperature, 'params': params},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key, content, created_at):
+        with self._lock:
+            self._memory[key] = (content, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Готовый тест по ключу или None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return entry[0]
+                del self._memory[key]
+
+        if self.db is not None:
+            try:
+                with self.db.connection() as connection:
+                    row = connection.execute(
+                        "SELECT content, created_at FROM llm_test_cache WHERE cache_key = ?", (key,)
+                    ).fetchone()
+                    if row and now - row['created_at'] < self.ttl_seconds:
+                        connection.execute("""
+                            UPDATE llm_test_cache
+                               SET last_access = ?, hit_count = hit_count + 1
+                             WHERE cache_key = ?
+                        """, (now, key))
+                        self._remember(key, row['content'], row['created_at'])
+                        self._count('disk_hits')
+                        return row['content']
+                    if row:
+                        connection.execute("DELETE FROM llm_test_cache WHERE cache_key = ?", (key,))
+            except sqlite3.Error as e:
+                logger.error("Ошибка чтения кэша тестов: %s", e)
+
+        self._count('misses')
+        return None
+
+    def put(self, key: str, content: str, material_name: Optional[str] = None, model: str = ''):
+        """Сохранить тест в обоих уровнях кэша"""
+        now = time.time()
+        self._remember(key, content, now)
+        self._count('stores')
+
+        if self.db is None:
+            return
+
+        try:
+            with self.db.connection() as connection:
+                connection.execute("""
+                    INSERT OR REPLACE INTO llm_test_cache
+                        (cache_key, material_name, model, content, created_at, last_access, hit_count)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)
+                """, (key, material_name, model, content, now, now))
+                self._evict(connection, now)
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи кэша тестов: %s", e)
+
+    def _evict(self, connection, now):
+        """Удаление устаревших записей и самых давно использованных сверх лимита"""
+        expired = connection.execute(
+            "DELETE FROM llm_test_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        overflow = connection.execute("""
+            DELETE FROM llm_test_cache
+             WHERE cache_key IN (
+                SELECT cache_key FROM llm_test_cache
+                 ORDER BY last_access DESC
+                 LIMIT -1 OFFSET ?
+             )
+        """, (self.max_disk_entries,)).rowcount
+        if expired or overflow:
+            with self._lock:
+                self._counters['evictions'] += expired + overflow
+
+    def contains(self, key: str) -> bool:
+        """Есть ли неустаревшая запись; счетчики попаданий не меняются"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                return True
+        if self.db is None:
+            return False
+        try:
+            with self.db.connection() as connection:
+                row = connection.execute(
+                    "SELECT created_at FROM llm_test_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+            return row is not None and now - row['created_at'] < self.ttl_seconds
+        except sqlite3.Error:
+            return False
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._memory.clear()
+        if self.db is not None:
+            with self.db.connection() as connection:
+                connection.execute("DELETE FROM llm_test_cache")
+
+    def stats(self) -> dict:
+        """Счетчики попаданий/промахов и размеры уровней"""
+        with self._lock:
+            result = dict(self._counters)
+            result['memory_entries'] = len(self._memory)
+        lookups = result['memory_hits'] + result['disk_hits'] + result['misses']
+        result['hit_rate'] = round((result['memory_hits'] + result['disk_hits']) / lookups, 3) if lookups else 0.0
+        if self.db is not None:
+            try:
+                with self.db.connection() as connection:
+                    result['disk_entries'] = connection.execute(
+                        "SELECT COUNT(*) FROM llm_test_cache"
+                    ).fetchone()[0]
+            except sqlite3.Error:
+                result['disk_entries'] = None
+        return result
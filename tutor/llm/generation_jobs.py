@@ -0,0 +1,180 @@
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from llm.llm_client import generate_test_from_text, cache_key_for, get_cache
+from llm.test_format import parse_test
+
+logger = logging.getLogger(__name__)
+
+
+def _process_alive(pid):
+    """Работает ли процесс сервера с этим pid (кроме текущего: у него прерванных заданий быть не может)"""
+    if not pid or pid == os.getpid():
+        return False
+    if os.name != 'posix':
+        # os.kill(pid, 0) на Windows завершает процесс; там сервер работает одним процессом
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueueFull(Exception):
+    """Очередь генерации переполнена"""
+
+
+class GenerationJobQueue:
+    """
+    Фоновая генерация тестов.
+
+    Задания выполняются ограниченным пулом потоков, состояние хранится в таблице test_jobs,
+    поэтому результат доступен по id задания и после перезагрузки страницы.
+    """
+
+    def __init__(self, db, max_workers=2, max_pending=20, generate=generate_test_from_text):
+        self.db = db
+        self.max_pending = max_pending
+        self._generate = generate
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='test-gen')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def recover(self):
+        """
+        Задания, прерванные перезапуском сервера, помечаются как неудачные.
+        Задания других работающих процессов сервера не трогаются.
+        """
+        try:
+            with self.db.connection() as connection:
+                rows = connection.execute("""
+                    SELECT id, worker_pid FROM test_jobs WHERE status IN ('queued', 'running')
+                """).fetchall()
+                orphaned = [(row['id'],) for row in rows if not _process_alive(row['worker_pid'])]
+                connection.executemany("""
+                    UPDATE test_jobs
+                       SET status = 'failed', error = 'Генерация прервана перезапуском сервера',
+                           updated_at = CURRENT_TIMESTAMP
+                     WHERE id = ? AND status IN ('queued', 'running')
+                """, orphaned)
+        except sqlite3.Error as e:
+            logger.error("Ошибка восстановления заданий генерации: %s", e)
+
+    def submit(self, material_text: str, material_name: Optional[str] = None, user_id: Optional[int] = None) -> str:
+        """Поставить генерацию в очередь, вернуть id задания"""
+        job_id = uuid.uuid4().hex
+
+        # Тест по этому материалу уже сохранен или есть в кэше — задание сразу завершено, пул не занимаем
+        key = cache_key_for(material_text)
+        test_id = self.db.find_test_by_source(key)
+        if test_id is not None:
+            self._insert(job_id, user_id, material_name, None, 'done', test_id=test_id)
+            return job_id
+
+        cache = get_cache()
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            self._insert(job_id, user_id, material_name, material_text, 'queued')
+            self._complete(job_id, material_text, material_name, cached)
+            return job_id
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull("Слишком много заданий генерации, попробуйте позже")
+            self._pending += 1
+
+        try:
+            self._insert(job_id, user_id, material_name, material_text, 'queued')
+            self._executor.submit(self._run, job_id, material_text, material_name)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return job_id
+
+    def record_finished(self, material_text: str, result: str, material_name: Optional[str] = None,
+                        user_id: Optional[int] = None) -> str:
+        """Сохранить результат, полученный вне очереди (потоковая генерация), как завершенное задание"""
+        job_id = uuid.uuid4().hex
+        self._insert(job_id, user_id, material_name, material_text, 'queued')
+        self._complete(job_id, material_text, material_name, result)
+        return job_id
+
+    def _insert(self, job_id, user_id, material_name, material_text, status, test_id=None):
+        with self.db.connection() as connection:
+            connection.execute("""
+                INSERT INTO test_jobs (id, user_id, material_name, material_text, status, test_id, worker_pid)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (job_id, user_id, material_name, material_text, status, test_id, os.getpid()))
+
+    def _complete(self, job_id, material_text, material_name, result):
+        """
+        Разобрать ответ модели и сохранить тест в таблицы tests/test_questions/test_options.
+        Задание ссылается на тест; текст, который не удалось разобрать, остается в задании как есть.
+        """
+        questions = parse_test(result)
+        if not questions:
+            self._set_status(job_id, 'done', result=result)
+            return
+
+        with self.db.connection() as connection:
+            test_id = self.db.save_test(result, [q.as_dict() for q in questions], material_name=material_name,
+                                        material_text=material_text, source_key=cache_key_for(material_text))
+            connection.execute("""
+                UPDATE test_jobs
+                   SET status = 'done', test_id = ?, result = NULL, material_text = NULL, error = NULL,
+                       updated_at = CURRENT_TIMESTAMP
+                 WHERE id = ?
+            """, (test_id, job_id))
+
+    def _set_status(self, job_id, status, result=None, error=None):
+        with self.db.connection() as connection:
+            connection.execute("""
+                UPDATE test_jobs
+                   SET status = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                 WHERE id = ?
+            """, (status, result, error, job_id))
+
+    def _run(self, job_id, material_text, material_name):
+        try:
+            self._set_status(job_id, 'running')
+            result = self._generate(material_text, material_name=material_name)
+            if result.startswith("❌"):
+                self._set_status(job_id, 'failed', error=result)
+            else:
+                self._complete(job_id, material_text, material_name, result)
+        except Exception as e:
+            logger.error("Ошибка задания генерации %s: %s", job_id, e)
+            try:
+                self._set_status(job_id, 'failed', error=f"❌ Неожиданная ошибка: {e}")
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id: str, include_material=False) -> Optional[dict]:
+        """Состояние задания или None; текст теста берется из сохраненного теста"""
+        columns = """j.id, j.user_id, j.material_name, j.status, j.error, j.test_id, j.created_at, j.updated_at,
+                     COALESCE(j.result, t.raw_text) AS result"""
+        if include_material:
+            columns += ", COALESCE(j.material_text, t.material_text) AS material_text"
+        with self.db.connection() as connection:
+            row = connection.execute(f"""
+                SELECT {columns}
+                FROM test_jobs j
+                LEFT JOIN tests t ON t.id = j.test_id
+                WHERE j.id = ?
+            """, (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -1,76 +1,397 @@
+import json
 import os
+import queue
+import threading
+import time
+from dataclasses import replace
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError, Timeout, RequestException
-from full_prompt import build_prompt
+from llm.chunking import needs_chunking, generate_chunked
+from llm.full_prompt import build_prompt
+from llm.generation_cache import GenerationCache
+from llm.resilience import RetryPolicy, CircuitBreaker, parse_retry_after
+from services.metrics import REGISTRY, LLM_BUCKETS
 
 LMSTUDIO_URL = "http://127.0.0.1:12345/v1/chat/completions"
 LMSTUDIO_MODEL = "google/gemma-3-4b"
+MATERIALS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "materials")
 MATERIAL_FILE = "z5.txt"
 
+SYSTEM_PROMPT = "Ты — генератор тестов. Ты создаешь вопросы строго по требованиям пользователя."
+TEMPERATURE = 0.1
+MAX_TOKENS = 4000
+
+# Соединение устанавливается быстро или не устанавливается вовсе; ответ модели может идти минутами
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 240
+HTTP_POOL_SIZE = 4
+
+# Кэш готовых тестов; подключается приложением через configure_cache()
+_cache = None
+
+# Общая HTTP-сессия с пулом keep-alive соединений, политика повторов и размыкатель цепи
+_session = None
+_session_lock = threading.Lock()
+_retry_policy = RetryPolicy()
+_circuit_breaker = CircuitBreaker()
+
+# Метрики обращений к LM Studio; mode — completion или stream
+LLM_LATENCY = REGISTRY.histogram(
+    'tutor_llm_request_seconds', 'Время запроса к LM Studio (для stream — до начала ответа)',
+    ('mode', 'outcome'), buckets=LLM_BUCKETS)
+LLM_RETRIES = REGISTRY.counter('tutor_llm_retries_total', 'Повторы запросов к LM Studio', ('mode',))
+LLM_REJECTED = REGISTRY.counter(
+    'tutor_llm_circuit_open_total', 'Запросы, отклоненные разомкнутым размыкателем цепи', ('mode',))
+
+
+def configure_cache(cache: GenerationCache):
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    return _cache
+
+
+def configure_http(retry_policy: RetryPolicy = None, circuit_breaker: CircuitBreaker = None, pool_size: int = None,
+                   url: str = None):
+    """Настройка повторов, размыкателя цепи, размера пула соединений и адреса LM Studio"""
+    global _retry_policy, _circuit_breaker, _session, HTTP_POOL_SIZE, LMSTUDIO_URL
+    if url is not None:
+        LMSTUDIO_URL = url
+    if retry_policy is not None:
+        _retry_policy = retry_policy
+    if circuit_breaker is not None:
+        _circuit_breaker = circuit_breaker
+    if pool_size is not None:
+        with _session_lock:
+            HTTP_POOL_SIZE = pool_size
+            _session = None
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    return _circuit_breaker
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
 
-def load_material() -> str:
-    if not os.path.exists(MATERIAL_FILE):
-        return f"❌ Файл {MATERIAL_FILE} не найден!"
 
-    with open(MATERIAL_FILE, "r", encoding="utf-8") as f:
+def _circuit_open_error() -> str:
+    return f"❌ LM Studio недоступен, повторите попытку через {int(_circuit_breaker.retry_in()) + 1} с."
+
+
+def load_material(material_file: str = MATERIAL_FILE) -> str:
+    material_path = os.path.join(MATERIALS_DIR, material_file)
+    if not os.path.exists(material_path):
+        return f"❌ Файл {material_file} не найден!"
+
+    with open(material_path, "r", encoding="utf-8") as f:
         return f.read()
 
 
-def generate_test_from_text(max_retries=2):
-    material_text = load_material()
-    if material_text.startswith("❌"):
-        return material_text
-    prompt = build_prompt(material_text)
+def cache_key_for(material_text: str) -> str:
+    """Ключ кэша для материала с текущими промптом, моделью и параметрами"""
+    return GenerationCache.make_key(
+        build_prompt(material_text), LMSTUDIO_MODEL, TEMPERATURE,
+        system=SYSTEM_PROMPT, max_tokens=MAX_TOKENS
+    )
+
+
+def generate_test_from_text(material_text: str = None, material_name: str = None, max_retries=None, use_cache=True):
+    if material_text is None:
+        material_text = load_material()
+        if material_text.startswith("❌"):
+            return material_text
+
+    key = cache_key_for(material_text) if use_cache and _cache is not None else None
+    if key:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+
+    policy = _retry_policy if max_retries is None else replace(_retry_policy, max_retries=max_retries)
+    result = _generate(material_text, policy)
+
+    # Ошибки не кэшируем, чтобы следующая попытка снова обратилась к модели
+    if key and not result.startswith("❌"):
+        _cache.put(key, result, material_name=material_name, model=LMSTUDIO_MODEL)
+    return result
+
+
+def _generate(material_text: str, policy: RetryPolicy, on_progress=None) -> str:
+    """Один промпт для обычного материала, параллельная генерация по частям — для большого"""
+    if needs_chunking(material_text):
+        return generate_chunked(material_text, lambda prompt: request_completion(prompt, policy),
+                                on_progress=on_progress)
+    return request_completion(build_prompt(material_text), policy)
+
+
+def stream_test_from_text(material_text: str, material_name: str = None, use_cache=True):
+    """
+    Потоковая генерация теста.
+    Генератор событий: ('delta', фрагмент) по мере поступления токенов,
+    затем ('done', полный текст) или ('error', сообщение).
+    Большой материал генерируется по частям без токенов: вместо них идут
+    ('progress', {'done': готово частей, 'total': всего частей}).
+    """
+    key = cache_key_for(material_text) if use_cache and _cache is not None else None
+    if key:
+        cached = _cache.get(key)
+        if cached is not None:
+            yield 'delta', cached
+            yield 'done', cached
+            return
+
+    if needs_chunking(material_text):
+        # Большой материал: части генерируются параллельно в отдельном потоке, а поток ответа
+        # получает ход обработки частей; результат отдается после объединения
+        progress = queue.Queue()
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = _generate(material_text, _retry_policy,
+                                              on_progress=lambda done, total: progress.put((done, total)))
+            finally:
+                progress.put(None)
 
+        threading.Thread(target=run, name='test-gen-stream', daemon=True).start()
+        for done, total in iter(progress.get, None):
+            yield 'progress', {'done': done, 'total': total}
+
+        result = outcome.get('result', "❌ Ошибка: генерация по частям прервана.")
+        if result.startswith("❌"):
+            yield 'error', result
+            return
+        if key:
+            _cache.put(key, result, material_name=material_name, model=LMSTUDIO_MODEL)
+        yield 'delta', result
+        yield 'done', result
+        return
+
+    payload = _build_payload(build_prompt(material_text), stream=True)
+    response, error = _open_stream(payload)
+    if response is None:
+        yield 'error', error
+        return
+
+    parts = []
+    try:
+        with response:
+            # Построчно, байтами: кодировка text/event-stream не всегда указана в заголовках
+            for raw_line in response.iter_lines():
+                line = raw_line.decode('utf-8').strip()
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                # Служебные фрагменты (usage, keep-alive) приходят с пустым choices
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    yield 'delta', delta
+
+    except ConnectionError:
+        _circuit_breaker.record_failure()
+        yield 'error', "❌ Ошибка подключения: LM Studio не отвечает."
+        return
+    except Timeout:
+        _circuit_breaker.record_failure()
+        yield 'error', "❌ Таймаут: модель слишком долго формирует ответ."
+        return
+    except RequestException as e:
+        _circuit_breaker.record_failure()
+        yield 'error', f"❌ Ошибка HTTP: {str(e)}"
+        return
+    except ValueError as e:
+        _circuit_breaker.record_failure()
+        yield 'error', f"❌ Некорректный фрагмент ответа модели: {str(e)}"
+        return
+
+    content = ''.join(parts).strip()
+    if not content:
+        yield 'error', "❌ Ошибка: пустой ответ от модели."
+        return
+
+    if key:
+        _cache.put(key, content, material_name=material_name, model=LMSTUDIO_MODEL)
+    yield 'done', content
+
+
+def _post(mode: str, payload: dict, **kwargs) -> requests.Response:
+    """POST к LM Studio с записью времени и результата в метрики"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        response = _get_session().post(LMSTUDIO_URL, json=payload, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+        outcome = str(response.status_code)
+        return response
+    except Timeout:
+        outcome = 'timeout'
+        raise
+    except ConnectionError:
+        outcome = 'connection_error'
+        raise
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - started, mode, outcome)
+
+
+def _open_stream(payload: dict, policy: RetryPolicy = None):
+    """
+    Открыть потоковый ответ с повторами до получения первых байтов.
+    Успешный ответ отмечается в автомате отключения сразу после получения заголовков.
+    Возвращает (response, None) или (None, сообщение об ошибке).
+    """
+    policy = policy or _retry_policy
+    error = "❌ Ошибка: не удалось получить ответ от модели."
+
+    for attempt in range(policy.max_retries + 1):
+        if not _circuit_breaker.allow():
+            LLM_REJECTED.inc('stream')
+            return None, _circuit_open_error()
+
+        retry_after = None
+        try:
+            response = _post('stream', payload, stream=True)
+        except ConnectionError:
+            _circuit_breaker.record_failure()
+            error = "❌ Ошибка подключения: LM Studio не отвечает."
+        except Timeout:
+            _circuit_breaker.record_failure()
+            error = "❌ Таймаут: модель слишком долго формирует ответ."
+        except RequestException as e:
+            _circuit_breaker.record_failure()
+            return None, f"❌ Ошибка HTTP: {str(e)}"
+        else:
+            if response.status_code in policy.retry_statuses:
+                _circuit_breaker.record_failure()
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                error = _status_error(response.status_code)
+                response.close()
+            else:
+                error = _status_error(response.status_code)
+                if error is None and response.ok:
+                    # Пробный запрос считается успешным по заголовкам: если клиент закроет
+                    # поток на середине, автомат не останется в ожидании результата пробы
+                    _circuit_breaker.record_success()
+                    return response, None
+                if response.status_code >= 500:
+                    _circuit_breaker.record_failure()
+                else:
+                    _circuit_breaker.record_success()
+                response.close()
+                return None, error or f"❌ Ошибка HTTP: {response.status_code}"
+
+        if attempt < policy.max_retries:
+            LLM_RETRIES.inc('stream')
+            time.sleep(policy.delay(attempt, retry_after))
+
+    return None, error
+
+
+def _build_payload(prompt: str, stream=False) -> dict:
     payload = {
         "model": LMSTUDIO_MODEL,
         "messages": [
-            {"role": "system",
-             "content": "Ты — генератор тестов. Ты создаешь вопросы строго по требованиям пользователя."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
-        "temperature": 0.1,
-        "max_tokens": 4000
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS
     }
+    if stream:
+        payload["stream"] = True
+    return payload
 
-    for attempt in range(max_retries + 1):
-        try:
-            response = requests.post(LMSTUDIO_URL, json=payload, timeout=240)
 
-            if response.status_code == 503:
-                if attempt < max_retries:
-                    continue
-                return "❌ LM Studio ответил 503 (модель не готова или перегружена)."
+def _status_error(status_code: int):
+    """Сообщение об ошибке для кода ответа LM Studio или None"""
+    if status_code == 404:
+        return "❌ Модель не найдена. Проверь название модели в LM Studio."
+    if status_code == 500:
+        return "❌ Внутренняя ошибка LM Studio (500). Перезапусти модель."
+    if status_code == 503:
+        return "❌ LM Studio ответил 503 (модель не готова или перегружена)."
+    if status_code in (429, 502, 504):
+        return f"❌ LM Studio перегружен или недоступен ({status_code})."
+    return None
 
-            if response.status_code == 404:
-                return "❌ Модель не найдена. Проверь название модели в LM Studio."
 
-            if response.status_code == 500:
-                return "❌ Внутренняя ошибка LM Studio (500). Перезапусти модель."
+def request_completion(prompt: str, policy: RetryPolicy = None) -> str:
+    policy = policy or _retry_policy
+    payload = _build_payload(prompt)
+    error = "❌ Ошибка: не удалось получить ответ от модели."
 
-            response.raise_for_status()
+    for attempt in range(policy.max_retries + 1):
+        # Пока LM Studio недоступен, не ждем таймаутов, а сразу отвечаем ошибкой
+        if not _circuit_breaker.allow():
+            LLM_REJECTED.inc('completion')
+            return _circuit_open_error()
+
+        retry_after = None
+        try:
+            response = _post('completion', payload)
 
-            data = response.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            if not content:
-                return "❌ Ошибка: пустой ответ от модели."
+            if response.status_code in policy.retry_statuses:
+                _circuit_breaker.record_failure()
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                error = _status_error(response.status_code)
+            else:
+                error = _status_error(response.status_code)
+                if error:
+                    # 5xx — сбой LM Studio; 4xx — сервер жив, проблема в запросе
+                    if response.status_code >= 500:
+                        _circuit_breaker.record_failure()
+                    else:
+                        _circuit_breaker.record_success()
+                    return error
 
-            return content.strip()
+                response.raise_for_status()
+
+                data = response.json()
+                _circuit_breaker.record_success()
+                choices = data.get("choices") or []
+                content = (choices[0].get("message") or {}).get("content", "") if choices else ""
+                if not content:
+                    return "❌ Ошибка: пустой ответ от модели."
+
+                return content.strip()
 
         except ConnectionError:
-            if attempt < max_retries:
-                continue
-            return "❌ Ошибка подключения: LM Studio не отвечает."
+            _circuit_breaker.record_failure()
+            error = "❌ Ошибка подключения: LM Studio не отвечает."
 
         except Timeout:
-            if attempt < max_retries:
-                continue
-            return "❌ Таймаут: модель слишком долго формирует ответ."
+            _circuit_breaker.record_failure()
+            error = "❌ Таймаут: модель слишком долго формирует ответ."
 
         except RequestException as e:
+            _circuit_breaker.record_failure()
             return f"❌ Ошибка HTTP: {str(e)}"
 
         except Exception as e:
+            _circuit_breaker.record_failure()
             return f"❌ Неожиданная ошибка: {str(e)}"
 
-    return "❌ Ошибка: не удалось получить ответ от модели."
+        if attempt < policy.max_retries:
+            LLM_RETRIES.inc('completion')
+            time.sleep(policy.delay(attempt, retry_after))
+
+    return error
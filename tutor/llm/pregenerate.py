@@ -0,0 +1,104 @@
+"""
+Пакетная предварительная генерация тестов для всех материалов каталога.
+
+Готовые тесты попадают в кэш (таблица llm_test_cache), откуда их сразу отдают
+/tests/1, /generate-test и потоковая генерация. Запуск из каталога tutor/:
+
+    python -m llm.pregenerate --concurrency 2
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import Database
+from llm import llm_client
+from llm.generation_cache import GenerationCache
+from llm.test_format import split_questions
+
+
+def find_materials(materials_dir):
+    """Текстовые материалы каталога: список (имя без расширения, путь)"""
+    materials = []
+    for file_name in sorted(os.listdir(materials_dir)):
+        if file_name.endswith('.txt'):
+            materials.append((os.path.splitext(file_name)[0], os.path.join(materials_dir, file_name)))
+    return materials
+
+
+def generate_one(material_name, material_text):
+    """Генерация теста для одного материала: (имя, результат, длительность в секундах)"""
+    started = time.perf_counter()
+    result = llm_client.generate_test_from_text(material_text, material_name=material_name)
+    return material_name, result, time.perf_counter() - started
+
+
+def pregenerate(materials_dir, concurrency=2, force=False):
+    """Сгенерировать недостающие тесты; возвращает число ошибок"""
+    cache = llm_client.get_cache()
+    todo = []
+
+    for material_name, path in find_materials(materials_dir):
+        with open(path, 'r', encoding='utf-8') as f:
+            material_text = f.read()
+
+        if not material_text.strip():
+            print(f"⏭️  {material_name}: пустой файл, пропускаем")
+            continue
+        if not force and cache.contains(llm_client.cache_key_for(material_text)):
+            print(f"⏭️  {material_name}: тест в кэше актуален, пропускаем")
+            continue
+        todo.append((material_name, material_text))
+
+    if not todo:
+        print("✅ Все тесты уже сгенерированы")
+        return 0
+
+    print(f"📝 Генерация тестов: {len(todo)} материалов, параллельно: {concurrency}")
+    failures = 0
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(generate_one, name, text) for name, text in todo]
+        for future in as_completed(futures):
+            material_name, result, elapsed = future.result()
+            if result.startswith("❌"):
+                failures += 1
+                print(f"❌ {material_name}: {elapsed:.1f} с — {result}")
+            else:
+                print(f"✅ {material_name}: {elapsed:.1f} с, вопросов: {len(split_questions(result))}")
+
+    total = time.perf_counter() - started
+    generated = len(todo) - failures
+    print(f"📊 Готово: {generated} из {len(todo)} за {total:.1f} с "
+          f"({generated / total * 60:.2f} материалов/мин)")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Предварительная генерация тестов по материалам")
+    parser.add_argument('--materials', default=llm_client.MATERIALS_DIR,
+                        help="каталог с материалами .txt (по умолчанию llm/materials)")
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help="сколько материалов генерировать одновременно")
+    parser.add_argument('--db', default='database/tutoring.db', help="путь к базе данных")
+    parser.add_argument('--force', action='store_true', help="генерировать заново даже при актуальном кэше")
+    args = parser.parse_args(argv)
+    # Предупреждения и ошибки сервисов — в консоль вместе с выводом команды
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+
+    db = Database(args.db)
+    db.migrate()
+    llm_client.configure_cache(GenerationCache(db))
+    llm_client.configure_http(pool_size=max(args.concurrency, llm_client.HTTP_POOL_SIZE))
+
+    failures = pregenerate(args.materials, concurrency=args.concurrency, force=args.force)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
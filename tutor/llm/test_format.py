@@ -0,0 +1,145 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# Начало вопроса в формате build_prompt: "1. Текст вопроса" в начале строки
+QUESTION_START = re.compile(r'^[ \t]*\d+[.)][ \t]+', re.MULTILINE)
+ANSWER_LINE = re.compile(r'Правильный\s+ответ\s*:', re.IGNORECASE)
+
+
+def split_questions(text: str) -> List[str]:
+    """
+    Разбить ответ модели на блоки вопросов (вопрос + варианты + правильный ответ).
+    Нумерованные строки внутри вопроса (шаги алгоритма) не начинают новый вопрос,
+    пока у текущего нет строки «Правильный ответ».
+    """
+    starts = []
+    for match in QUESTION_START.finditer(text):
+        if not starts or ANSWER_LINE.search(text, starts[-1], match.start()):
+            starts.append(match.start())
+
+    blocks = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        block = text[start:end].strip()
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+class QuestionStreamSplitter:
+    """
+    Выделение готовых вопросов из потока токенов.
+    Вопрос считается законченным, когда начинается следующий или поток завершен.
+    Просматриваются только новые полные строки, а в буфере хранится только незавершенный
+    вопрос, поэтому разбор всего ответа линеен по длине.
+    """
+
+    def __init__(self):
+        self._parts = []
+        # Текст, начиная с незавершенного вопроса (или с непросмотренной строки)
+        self._buffer = ''
+        # Строки до этой позиции уже просмотрены
+        self._scanned = 0
+        # Начало незавершенного вопроса
+        self._current = None
+
+    def _scan(self, end: int) -> List[str]:
+        ready = []
+        for match in QUESTION_START.finditer(self._buffer, self._scanned, end):
+            start = match.start()
+            # Правила split_questions: новый вопрос — только после строки «Правильный ответ»
+            if self._current is not None and not ANSWER_LINE.search(self._buffer, self._current, start):
+                continue
+            if self._current is not None:
+                block = self._buffer[self._current:start].strip()
+                if block:
+                    ready.append(block)
+            self._current = start
+        self._scanned = end
+        # Готовые вопросы и текст до первого вопроса больше не нужны
+        drop = self._scanned if self._current is None else self._current
+        if drop:
+            self._buffer = self._buffer[drop:]
+            self._scanned -= drop
+            if self._current is not None:
+                self._current = 0
+        return ready
+
+    def feed(self, chunk: str) -> List[str]:
+        """Добавить фрагмент текста, вернуть вопросы, которые завершились"""
+        self._parts.append(chunk)
+        self._buffer += chunk
+        # Последняя строка может быть недописана — смотрим только до последнего перевода строки
+        return self._scan(self._buffer.rfind('\n', self._scanned) + 1 or self._scanned)
+
+    def finish(self) -> List[str]:
+        """Поток завершен: вернуть оставшиеся вопросы"""
+        ready = self._scan(len(self._buffer))
+        if self._current is not None:
+            block = self._buffer[self._current:].strip()
+            if block:
+                ready.append(block)
+            self._current = None
+        return ready
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._parts)
+
+
+OPTION_LINE = re.compile(r'^[ \t]*([A-DА-Г])[).][ \t]*(.*)$')
+ANSWER_VALUE = re.compile(r'Правильный\s+ответ\s*:\s*\**\s*([A-DА-Г])', re.IGNORECASE)
+LEADING_NUMBER = re.compile(r'^[ \t]*\d+[.)][ \t]*')
+# Модель иногда отвечает кириллическими буквами вариантов
+CYRILLIC_LETTERS = {'А': 'A', 'Б': 'B', 'В': 'C', 'Г': 'D'}
+
+
+@dataclass
+class ParsedQuestion:
+    text: str
+    options: List[Tuple[str, str]] = field(default_factory=list)
+    correct: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {'text': self.text, 'options': self.options, 'correct': self.correct}
+
+
+def _letter(value: str) -> str:
+    value = value.upper()
+    return CYRILLIC_LETTERS.get(value, value)
+
+
+def parse_question(block: str) -> Optional[ParsedQuestion]:
+    """Разбор одного блока: текст вопроса, варианты A–D, правильный ответ"""
+    text_lines, options, correct = [], [], None
+
+    for line in block.split('\n'):
+        answer = ANSWER_VALUE.search(line)
+        if answer:
+            correct = _letter(answer.group(1))
+            continue
+        option = OPTION_LINE.match(line)
+        if option and correct is None:
+            options.append([_letter(option.group(1)), option.group(2).strip()])
+        elif options and correct is None:
+            # Продолжение варианта на следующей строке
+            if line.strip():
+                options[-1][1] = f"{options[-1][1]} {line.strip()}"
+        elif not options:
+            text_lines.append(line)
+
+    text = LEADING_NUMBER.sub('', '\n'.join(text_lines).strip(), count=1).strip()
+    if not text or len(options) < 2:
+        return None
+    return ParsedQuestion(text=text, options=[(letter, value) for letter, value in options], correct=correct)
+
+
+def parse_test(text: str) -> List[ParsedQuestion]:
+    """Разбор ответа модели в формате build_prompt; блоки без вариантов ответа отбрасываются"""
+    questions = []
+    for block in split_questions(text):
+        question = parse_question(block)
+        if question is not None:
+            questions.append(question)
+    return questions
@@ -1,5 +1,9 @@
+import logging
+
 from database.database import Database
 
+logger = logging.getLogger(__name__)
+
 class User:
     def __init__(self, **kwargs):
         self.id = kwargs.get('id')
@@ -33,23 +37,20 @@ class AuthService:
                 required_fields = ['id', 'username', 'password_hash', 'role', 'first_name', 'last_name']
                 for field in required_fields:
                     if field not in user_data:
-                        print(f"❌ Отсутствует обязательное поле: {field}")
+                        logger.error("Отсутствует обязательное поле: %s", field)
                         return False, f"Отсутствует поле {field} в данных пользователя", None
 
                 user = User(**user_data)
                 if user.verify_password(password):
                     self.current_user = user
-                    print(f"✅ Успешный вход: {user.role} {user.first_name}")
                     return True, "Успешный вход", user
                 else:
-                    print("❌ Неверный пароль")
                     return False, "Неверный пароль", None
             else:
-                print("❌ Пользователь не найден")
                 return False, "Пользователь не найден", None
 
         except Exception as e:
-            print(f"❌ Ошибка при входе: {e}")
+            logger.error("Ошибка при входе: %s", e)
             return False, f"Ошибка при входе: {str(e)}", None
 
     def logout(self):
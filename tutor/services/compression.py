@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+DEFAULT_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/javascript',
+    'application/json',
+)
+
+
+class ResponseCompressor:
+    """
+    Сжатие ответов gzip после обработки запроса.
+
+    Настройки берутся из app.config: COMPRESS_LEVEL, COMPRESS_MIN_SIZE, COMPRESS_MIMETYPES,
+    COMPRESS_CACHE_SIZE и COMPRESS_CACHE_MIMETYPES. Потоковые ответы (SSE), файлы
+    (direct_passthrough) и уже сжатые ответы не трогаются. Сжатые тела HTML кэшируются
+    по хэшу содержимого: неизменные страницы сжимаются один раз.
+    """
+
+    def __init__(self, app=None):
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 64)
+        app.config.setdefault('COMPRESS_CACHE_MIMETYPES', ('text/html',))
+        self.app = app
+        app.after_request(self.after_request)
+
+    def _should_compress(self, response):
+        config = self.app.config
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in config['COMPRESS_MIMETYPES']:
+            return False
+        if 'gzip' not in request.accept_encodings:
+            return False
+        return response.content_length is None or response.content_length >= config['COMPRESS_MIN_SIZE']
+
+    def _compress(self, body, cacheable):
+        level = self.app.config['COMPRESS_LEVEL']
+        if not cacheable or not self.app.config['COMPRESS_CACHE_SIZE']:
+            return gzip.compress(body, compresslevel=level, mtime=0)
+
+        key = (hashlib.sha256(body).digest(), level)
+        with self._lock:
+            compressed = self._cache.get(key)
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return compressed
+
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = compressed
+            while len(self._cache) > self.app.config['COMPRESS_CACHE_SIZE']:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def after_request(self, response):
+        if not self._should_compress(response):
+            return response
+
+        body = response.get_data()
+        if len(body) < self.app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        cacheable = response.mimetype in self.app.config['COMPRESS_CACHE_MIMETYPES']
+        compressed = self._compress(body, cacheable)
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # Сильный ETag относится к конкретным байтам — у сжатого варианта он свой
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-gz")
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
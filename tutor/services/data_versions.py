@@ -0,0 +1,22 @@
+class DataVersions:
+    """
+    Версии данных по репетиторам — основа ETag для опрашиваемых API.
+
+    Версии хранятся в таблице data_versions и увеличиваются триггерами в транзакции
+    изменения (миграция 4), поэтому все процессы сервера видят одну и ту же версию.
+    Пока данные не менялись, версия — случайная эпоха базы (миграция 8), поэтому ETag,
+    сохраненные клиентами до пересоздания базы, не совпадут.
+    """
+
+    STUDENTS = 'students'
+    MATERIALS = 'materials'
+    SCHEDULE = 'schedule'
+
+    def __init__(self, db):
+        self.db = db
+
+    def version(self, tutor_id, scope):
+        return self.db.get_data_version(tutor_id, scope)
+
+    def etag(self, tutor_id, scope):
+        return f"{scope}-{tutor_id}-{self.version(tutor_id, scope)}"
@@ -0,0 +1,163 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Очередь событий одного подключения к ленте изменений"""
+
+    def __init__(self, tutor_id, events=None, max_pending=100):
+        self.tutor_id = tutor_id
+        self.events = set(events) if events else None
+        self.queue = queue.Queue(maxsize=max_pending)
+
+    def wants(self, event):
+        return self.events is None or event in self.events
+
+    def get(self, timeout):
+        """Следующее событие (event, data) или None, если за timeout секунд ничего не пришло"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    Публикация изменений внутри процесса по репетиторам.
+
+    Подписчики — открытые SSE-подключения; слушатели вызываются синхронно при публикации.
+    Соседним процессам публикации передает EventLog.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscriptions = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, tutor_id, events=None):
+        subscription = Subscription(tutor_id, events, self.max_pending)
+        with self._lock:
+            self._subscriptions.setdefault(tutor_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.tutor_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.tutor_id]
+
+    def add_listener(self, callback):
+        """callback(tutor_id, event, data) вызывается при каждой публикации"""
+        self._listeners.append(callback)
+
+    def publish(self, tutor_id, event, data=None):
+        for callback in self._listeners:
+            callback(tutor_id, event, data)
+        self.deliver(tutor_id, event, data)
+
+    def deliver(self, tutor_id, event, data=None):
+        """Передать событие подписчикам процесса без вызова слушателей"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(tutor_id, ()))
+        for subscription in subscriptions:
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait((event, data or {}))
+            except queue.Full:
+                # Страница все равно перезагружает список целиком — лишние события можно отбросить
+                pass
+
+    def subscriber_count(self, tutor_id=None):
+        with self._lock:
+            if tutor_id is not None:
+                return len(self._subscriptions.get(tutor_id, ()))
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+class EventLog:
+    """
+    Журнал событий в таблице events для нескольких процессов сервера.
+
+    Публикации процесса записываются в журнал (слушатель EventBus), а фоновый поток
+    раз в poll_interval секунд читает записи других процессов и передает их подписчикам
+    своей шины. Пока база не менялась, опрос — одно чтение PRAGMA data_version.
+    События старше retention секунд удаляются.
+    """
+
+    def __init__(self, db, bus, poll_interval=1.0, retention=300):
+        self.db = db
+        self.bus = bus
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = uuid.uuid4().hex
+        self._last_id = None
+        self._data_version = None
+        self._pruned_at = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        bus.add_listener(self.append)
+
+    def append(self, tutor_id, event, data=None):
+        try:
+            self.db.append_event(tutor_id, event, json.dumps(data or {}, ensure_ascii=False), self.origin)
+        except sqlite3.Error as e:
+            # Подписчики этого процесса событие уже получили; соседние перечитают данные при переподключении
+            logger.error("Ошибка записи события %s в журнал: %s", event, e)
+
+    def poll(self):
+        """Передать подписчикам новые события других процессов; возвращает их число"""
+        with self._lock:
+            return self._poll()
+
+    def _poll(self):
+        if self._last_id is None:
+            # Журнал до запуска процесса не воспроизводится
+            self._last_id = self.db.last_event_id()
+        version = self.db.data_version()
+        if version == self._data_version:
+            return 0
+        self._data_version = version
+
+        delivered = 0
+        rows = self.db.get_events_after(self._last_id)
+        while rows:
+            for row in rows:
+                self._last_id = row['id']
+                if row['origin'] != self.origin:
+                    self.bus.deliver(row['tutor_id'], row['event'], json.loads(row['data'] or '{}'))
+                    delivered += 1
+            rows = self.db.get_events_after(self._last_id)
+
+        now = time.time()
+        if now - self._pruned_at > self.retention:
+            self._pruned_at = now
+            self.db.prune_events(now - self.retention)
+        return delivered
+
+    def start(self):
+        """Фоновый поток опроса журнала"""
+        if self._thread is not None:
+            return
+        self._last_id = self.db.last_event_id()
+
+        def run():
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self.poll()
+                except sqlite3.Error as e:
+                    logger.error("Ошибка чтения журнала событий: %s", e)
+
+        self._thread = threading.Thread(target=run, name='event-log', daemon=True)
+        self._thread.start()
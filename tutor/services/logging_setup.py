@@ -0,0 +1,80 @@
+import atexit
+import itertools
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+# Пометка частых сообщений: logger.info("...", extra=SAMPLED) — в лог попадает одно из N
+SAMPLED = {'sampled': True}
+
+_listener = None
+_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает одно из every сообщений, помеченных extra=SAMPLED (отдельный счетчик
+    на каждое место вызова). Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, every=1):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._counters = {}
+
+    def filter(self, record):
+        if self.every == 1 or not getattr(record, 'sampled', False) or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        # next() у itertools.count атомарен под GIL — блокировка не нужна
+        return next(counter) % self.every == 0
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь как есть: форматирование сообщения и вывод выполняет
+    поток QueueListener, а не поток запроса.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(level='INFO', sample_every=1, stream=None):
+    """
+    Корневой логгер пишет через очередь: в потоке запроса запись только ставится
+    в очередь, форматирование и вывод — в фоновом потоке. Повторный вызов меняет уровень
+    и частоту выборки.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    with _lock:
+        if _listener is not None:
+            for handler in root.handlers:
+                for log_filter in handler.filters:
+                    if isinstance(log_filter, SamplingFilter):
+                        log_filter.every = max(1, int(sample_every))
+            return _listener
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        records = queue.SimpleQueue()
+        handler = _RecordQueueHandler(records)
+        handler.addFilter(SamplingFilter(sample_every))
+        root.handlers = [handler]
+
+        _listener = QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        # Дописать оставшиеся в очереди записи при завершении процесса
+        atexit.register(_listener.stop)
+        return _listener
@@ -0,0 +1,237 @@
+import bisect
+import threading
+import time
+
+from flask import g, request
+
+# Границы корзин гистограмм длительности, с
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 240.0)
+# Границы корзин числа SQL-запросов на HTTP-запрос
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        return tuple(str(value) for value in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}" for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        # Индекс первой корзины, в которую попадает значение (le — включительно)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def count(self, *labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[1] if state else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = self.header()
+        for key, (counts, total, amount) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _labels_text(self.labelnames, key, [('le', _number(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(amount)}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Повторное создание (например, второй create_app) возвращает ту же метрику
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Общий реестр процесса: метрики HTTP, SQL и LM Studio
+REGISTRY = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Метрики HTTP-запросов по endpoint: длительность, коды ответа, запросы в обработке,
+    а также число и время SQL-запросов, выполненных за запрос (Database.statement_stats()).
+
+    Длительность считается до формирования ответа; у потоковых ответов (SSE) — до начала потока.
+    Запрос считается в обработке, пока сервер не закроет ответ, то есть для потоков — до их конца.
+    """
+
+    def __init__(self, app=None, db=None, registry=REGISTRY):
+        self.db = db
+        self.requests = registry.counter(
+            'tutor_http_requests_total', 'HTTP-запросы по endpoint, методу и коду ответа',
+            ('endpoint', 'method', 'status'))
+        self.latency = registry.histogram(
+            'tutor_http_request_duration_seconds', 'Длительность обработки HTTP-запроса',
+            ('endpoint', 'method'))
+        self.in_flight = registry.gauge(
+            'tutor_http_requests_in_flight', 'HTTP-запросы в обработке', ('endpoint',))
+        self.sql_statements = registry.histogram(
+            'tutor_http_request_sql_statements', 'Число SQL-запросов за HTTP-запрос',
+            ('endpoint',), buckets=STATEMENT_BUCKETS)
+        self.sql_seconds = registry.histogram(
+            'tutor_http_request_sql_seconds', 'Время SQL-запросов за HTTP-запрос', ('endpoint',))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    @staticmethod
+    def _endpoint():
+        # Шаблон маршрута, а не адрес: /api/tests/<int:test_id>, а не /api/tests/17
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    def before_request(self):
+        endpoint = self._endpoint()
+        g._metrics = {
+            'endpoint': endpoint,
+            'started': time.perf_counter(),
+            'sql': self.db.statement_stats() if self.db is not None else (0, 0.0),
+            'recorded': False,
+            'closing': False,
+        }
+        self.in_flight.inc(endpoint)
+
+    def _record(self, state, status):
+        state['recorded'] = True
+        endpoint = state['endpoint']
+        self.latency.observe(time.perf_counter() - state['started'], endpoint, request.method)
+        self.requests.inc(endpoint, request.method, status)
+        if self.db is not None:
+            statements, seconds = self.db.statement_stats()
+            self.sql_statements.observe(max(statements - state['sql'][0], 0), endpoint)
+            self.sql_seconds.observe(max(seconds - state['sql'][1], 0.0), endpoint)
+
+    def after_request(self, response):
+        state = g.get('_metrics')
+        if state is not None and not state['recorded']:
+            self._record(state, response.status_code)
+        if state is not None and not state['closing']:
+            # Тело потокового ответа отдается уже после teardown_request
+            state['closing'] = True
+            endpoint = state['endpoint']
+            response.call_on_close(lambda: self.in_flight.dec(endpoint))
+        return response
+
+    def teardown_request(self, exception=None):
+        state = g.get('_metrics')
+        if state is None:
+            return
+        if not state['recorded']:
+            # Необработанное исключение: after_request не вызывался
+            self._record(state, 500)
+        if not state['closing']:
+            self.in_flight.dec(state['endpoint'])
+        g._metrics = None
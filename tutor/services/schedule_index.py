@@ -0,0 +1,159 @@
+import bisect
+import threading
+
+from services.data_versions import DataVersions
+
+# Номер дня недели, как в колонке schedule.day_ord
+DAY_ORDS = {
+    'monday': 1, 'tuesday': 2, 'wednesday': 3, 'thursday': 4,
+    'friday': 5, 'saturday': 6, 'sunday': 7,
+}
+
+
+DAY_MINUTES = 24 * 60
+# Длительность занятия, мин
+LESSON_MINUTES = 60
+
+
+def parse_time(value, end=False):
+    """
+    '09:30' или '09:30:00' -> минуты от начала суток.
+    '24:00' допускается только как конец интервала (end=True).
+    """
+    parts = str(value).strip().split(':')
+    if len(parts) not in (2, 3) or not all(part.isdigit() for part in parts):
+        raise ValueError(f"Некорректное время: {value}")
+    hours, minutes = int(parts[0]), int(parts[1])
+    limit = DAY_MINUTES if end else DAY_MINUTES - 1
+    if minutes > 59 or hours * 60 + minutes > limit:
+        raise ValueError(f"Некорректное время: {value}")
+    return hours * 60 + minutes
+
+
+def format_time(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def group_intervals(rows):
+    """
+    Строки расписания (id, day_ord, start_time, end_time) -> {day_ord: [(начало, конец, id)]}.
+    Занятие, записанное через полночь (конец раньше начала, так сохранялись старые записи),
+    делится на две части: до 24:00 своего дня и от 00:00 следующего.
+    """
+    grouped = {}
+    for row in rows:
+        try:
+            start = parse_time(row['start_time'])
+            end = parse_time(row['end_time'], end=True)
+        except ValueError:
+            continue
+        day_ord = row['day_ord']
+        if end > start:
+            grouped.setdefault(day_ord, []).append((start, end, row['id']))
+            continue
+        grouped.setdefault(day_ord, []).append((start, DAY_MINUTES, row['id']))
+        if end > 0:
+            grouped.setdefault(day_ord % 7 + 1, []).append((0, end, row['id']))
+    return grouped
+
+
+class DayIntervals:
+    """
+    Занятия одного дня, отсортированные по началу, с префиксным максимумом концов.
+    Пересечение с [start, end) ищется бинарным поиском: занятия, начавшиеся до end,
+    пересекаются, только если максимальный конец среди них больше start.
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.ids = [schedule_id for _, _, schedule_id in intervals]
+        self.max_end = []
+        furthest = -1
+        for end in self.ends:
+            furthest = max(furthest, end)
+            self.max_end.append(furthest)
+
+    def conflicts(self, start, end, exclude=None):
+        """id занятий, пересекающихся с [start, end); exclude — id, который не учитывается"""
+        found = []
+        i = bisect.bisect_left(self.starts, end) - 1
+        # Идем назад только пока среди оставшихся слева есть занятие, заканчивающееся после start
+        while i >= 0 and self.max_end[i] > start:
+            if self.ends[i] > start and self.ids[i] != exclude:
+                found.append(self.ids[i])
+            i -= 1
+        found.reverse()
+        return found
+
+    def free_slots(self, window_start, window_end, duration, exclude=None):
+        """Свободные промежутки не короче duration внутри [window_start, window_end): [(начало, конец)]"""
+        slots = []
+        first = bisect.bisect_left(self.starts, window_start)
+        cursor = window_start
+        # Занятия, начавшиеся раньше окна, могут заходить в него
+        for i in range(first - 1, -1, -1):
+            if self.max_end[i] <= cursor:
+                break
+            if self.ids[i] != exclude:
+                cursor = max(cursor, self.ends[i])
+
+        for i in range(first, len(self.starts)):
+            if self.starts[i] >= window_end:
+                break
+            if self.ids[i] == exclude:
+                continue
+            if self.starts[i] - cursor >= duration:
+                slots.append((cursor, self.starts[i]))
+            cursor = max(cursor, self.ends[i])
+
+        if window_end - cursor >= duration:
+            slots.append((cursor, window_end))
+        return slots
+
+
+class ScheduleIntervalIndex:
+    """
+    Индекс активных занятий по репетиторам и дням недели для проверки пересечений
+    и поиска свободного времени. Строится из таблицы schedule при первом обращении
+    к репетитору и перестраивается, когда меняется версия его расписания в data_versions —
+    в том числе после записи из другого процесса.
+    """
+
+    def __init__(self, db, versions=None):
+        self.db = db
+        self.versions = versions or DataVersions(db)
+        self._by_tutor = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, tutor_id=None):
+        with self._lock:
+            if tutor_id is None:
+                self._by_tutor.clear()
+            else:
+                self._by_tutor.pop(tutor_id, None)
+
+    def _days(self, tutor_id):
+        # Версия читается до строк: запись между ними даст лишнюю перестройку, а не устаревший индекс
+        version = self.versions.version(tutor_id, DataVersions.SCHEDULE)
+        with self._lock:
+            cached = self._by_tutor.get(tutor_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        grouped = group_intervals(self.db.get_schedule_intervals(tutor_id))
+        days = {day_ord: DayIntervals(intervals) for day_ord, intervals in grouped.items()}
+
+        with self._lock:
+            self._by_tutor[tutor_id] = (version, days)
+        return days
+
+    def day(self, tutor_id, day_ord):
+        return self._days(tutor_id).get(day_ord) or DayIntervals([])
+
+    def conflicts(self, tutor_id, day_ord, start, end, exclude_schedule_id=None):
+        return self.day(tutor_id, day_ord).conflicts(start, end, exclude_schedule_id)
+
+    def free_slots(self, tutor_id, day_ord, window_start, window_end, duration, exclude_schedule_id=None):
+        return self.day(tutor_id, day_ord).free_slots(window_start, window_end, duration, exclude_schedule_id)
@@ -0,0 +1,201 @@
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Сессия, данные которой хранятся на сервере; в cookie — только подписанный id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class SqliteSessionInterface(SessionInterface):
+    """
+    Хранилище сессий в таблице sessions с кэшем в памяти.
+
+    Кэш держит недавно прочитанные сессии не дольше cache_ttl секунд, чтобы при нескольких
+    процессах изменения из соседнего процесса были видны быстро. Запись в базу происходит
+    только при изменении сессии (и при продлении срока), поэтому запросы статики ее не трогают.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, db, lifetime_seconds=7 * 24 * 3600, cache_size=1024, cache_ttl=30, sweep_interval=600):
+        self.db = db
+        self.lifetime_seconds = lifetime_seconds
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.sweep_interval = sweep_interval
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='tutor-server-session')
+
+    def _cache_get(self, sid):
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None:
+                return None
+            data, expires_at, cached_at = entry
+            if expires_at <= now or now - cached_at > self.cache_ttl:
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+            return data, expires_at
+
+    def _cache_put(self, sid, data, expires_at):
+        with self._lock:
+            self._cache[sid] = (data, expires_at, time.time())
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def _load(self, sid):
+        cached = self._cache_get(sid)
+        if cached is not None:
+            return cached
+
+        try:
+            with self.db.connection() as connection:
+                row = connection.execute(
+                    "SELECT data, expires_at FROM sessions WHERE id = ?", (sid,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Ошибка чтения сессии: %s", e)
+            return None
+
+        if not row or row['expires_at'] <= time.time():
+            return None
+        data = self.serializer.loads(row['data'])
+        self._cache_put(sid, data, row['expires_at'])
+        return data, row['expires_at']
+
+    def open_session(self, app, request):
+        signed_sid = request.cookies.get(self.get_cookie_name(app))
+        if signed_sid:
+            try:
+                sid = self._signer(app).unsign(signed_sid).decode('utf-8')
+            except BadSignature:
+                sid = None
+            if sid:
+                loaded = self._load(sid)
+                if loaded is not None:
+                    data, expires_at = loaded
+                    session = ServerSideSession(dict(data), sid=sid)
+                    session.expires_at = expires_at
+                    return session
+
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # Сессия очищена (выход) — удаляем запись и cookie
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        # Продлеваем срок без изменений данных, только когда прошла половина срока жизни
+        stale = getattr(session, 'expires_at', 0) - now < self.lifetime_seconds / 2
+        if not session.modified and not stale:
+            return
+
+        expires_at = now + self.lifetime_seconds
+        data = dict(session)
+        try:
+            with self.db.connection() as connection:
+                connection.execute("""
+                    INSERT OR REPLACE INTO sessions (id, data, expires_at)
+                    VALUES (?, ?, ?)
+                """, (session.sid, self.serializer.dumps(data), expires_at))
+        except sqlite3.Error as e:
+            logger.error("Ошибка сохранения сессии: %s", e)
+            return
+        self._cache_put(session.sid, data, expires_at)
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            expires=expires_at,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def regenerate(self, session):
+        """
+        Новый id для сессии (при входе): прежняя запись удаляется, данные очищаются.
+        Id, известный до входа, после него недействителен — защита от фиксации сессии.
+        """
+        if not session.new:
+            self._delete(session.sid)
+        session.clear()
+        session.sid = secrets.token_urlsafe(32)
+        session.new = True
+        session.modified = True
+
+    def _delete(self, sid):
+        self._cache_drop(sid)
+        try:
+            with self.db.connection() as connection:
+                connection.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        except sqlite3.Error as e:
+            logger.error("Ошибка удаления сессии: %s", e)
+
+    def sweep(self):
+        """Удаление просроченных сессий; возвращает число удаленных записей"""
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, entry in self._cache.items() if entry[1] <= now]:
+                del self._cache[sid]
+        with self.db.connection() as connection:
+            return connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
+    def start_sweeper(self):
+        """Фоновый поток, периодически удаляющий просроченные сессии"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    removed = self.sweep()
+                    if removed:
+                        logger.info("Удалено просроченных сессий: %s", removed)
+                except sqlite3.Error as e:
+                    logger.error("Ошибка очистки сессий: %s", e)
+
+        self._sweeper = threading.Thread(target=run, name='session-sweeper', daemon=True)
+        self._sweeper.start()
@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from flask import Response
+
+# Сжимать имеет смысл только текстовые файлы; jpg уже сжат
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Неизменяемые файлы по адресу с хэшем кэшируются браузером на год
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+
+@dataclass
+class Asset:
+    name: str
+    path: str
+    mimetype: str
+    digest: str
+    mtime: float
+    data: bytes
+    gzipped: Optional[bytes] = None
+
+    @property
+    def fingerprinted_name(self):
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+
+class StaticAssets:
+    """
+    Статические файлы с хэшем содержимого в адресе: /assets/styles.1a2b3c4d5e6f.css.
+
+    Хэши и gzip-варианты считаются один раз при запуске; по адресу с хэшем файл отдается
+    с Cache-Control: immutable, старые адреса без хэша — с ETag и обязательной проверкой.
+    """
+
+    def __init__(self, root, names, url_prefix='/assets', gzip_level=9, min_gzip_size=512):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.gzip_level = gzip_level
+        self.min_gzip_size = min_gzip_size
+        self._assets = {}
+        self._by_fingerprint = {}
+        self._lock = threading.Lock()
+        for name in names:
+            self._load(name)
+
+    def _load(self, name):
+        path = os.path.join(self.root, name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if mimetype == 'text/javascript':
+            mimetype = 'application/javascript'
+
+        asset = Asset(
+            name=name,
+            path=path,
+            mimetype=mimetype,
+            digest=hashlib.sha256(data).hexdigest()[:12],
+            mtime=os.path.getmtime(path),
+            data=data,
+        )
+        if mimetype.startswith(COMPRESSIBLE_TYPES) and len(data) >= self.min_gzip_size:
+            # mtime=0: одинаковое содержимое дает одинаковые байты gzip
+            compressed = gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+            if len(compressed) < len(data):
+                asset.gzipped = compressed
+
+        with self._lock:
+            old = self._assets.get(name)
+            if old is not None:
+                self._by_fingerprint.pop(old.fingerprinted_name, None)
+            self._assets[name] = asset
+            self._by_fingerprint[asset.fingerprinted_name] = asset
+        return asset
+
+    def get(self, name, check_mtime=False):
+        """Описание файла; check_mtime=True перечитывает измененный файл (режим отладки)"""
+        asset = self._assets[name]
+        if check_mtime and os.path.getmtime(asset.path) != asset.mtime:
+            asset = self._load(name)
+        return asset
+
+    def url(self, name, check_mtime=False):
+        return f"{self.url_prefix}/{self.get(name, check_mtime).fingerprinted_name}"
+
+    def find(self, fingerprinted_name):
+        """(файл, адрес актуален) по имени с хэшем; для устаревшего хэша — текущая версия файла"""
+        asset = self._by_fingerprint.get(fingerprinted_name)
+        if asset is not None:
+            return asset, True
+        stem, ext = os.path.splitext(fingerprinted_name)
+        name = f"{stem.rsplit('.', 1)[0]}{ext}"
+        return self._assets.get(name), False
+
+    def response(self, asset, request, immutable):
+        """Ответ с файлом: gzip, если клиент его принимает; 304 по ETag для адресов без хэша"""
+        use_gzip = asset.gzipped is not None and 'gzip' in request.accept_encodings
+        # У сжатого и несжатого варианта разные байты — и разные ETag
+        etag = f"{asset.digest}-gz" if use_gzip else asset.digest
+        if not immutable and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.gzipped if use_gzip else asset.data, mimetype=asset.mimetype)
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE if immutable else 'no-cache'
+        if asset.gzipped is not None:
+            response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения импортируются из каталога tutor/, как при запуске app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с отдельной временной базой"""
+    return create_app(Config(
+        db_path=str(tmp_path / 'tutoring.db'),
+        upload_folder=str(tmp_path / 'uploads'),
+        testing=True,
+        # Журнал событий тесты опрашивают сами
+        event_poll_interval=3600,
+    ))
+
+
+@pytest.fixture
+def tutor_client(app):
+    """Клиент, вошедший под репетитором по умолчанию"""
+    client = app.test_client()
+    response = client.post('/api/login', json={'username': 'tutor', 'password': 'tutor'})
+    assert response.status_code == 200
+    return client
@@ -0,0 +1,56 @@
+from app import create_app
+from config import Config
+
+STUDENT = {
+    'last_name': 'Иванов', 'first_name': 'Иван', 'birth_date': '2010-01-01', 'exam_type': 'oge',
+    'username': 'ivanov', 'password': 'p', 'lesson_price': 1500,
+    'day_of_week': 'monday', 'lesson_time': '10:00',
+}
+
+
+def _second_process(app):
+    """Второе приложение на той же базе — как соседний процесс сервера"""
+    return create_app(Config(db_path=app.extensions['tutor']['db'].db_path,
+                             upload_folder=app.config['UPLOAD_FOLDER'], testing=True))
+
+
+def _login(app):
+    client = app.test_client()
+    assert client.post('/api/login', json={'username': 'tutor', 'password': 'tutor'}).status_code == 200
+    return client
+
+
+def test_etag_changes_after_write_in_other_process(app, tutor_client):
+    other = _login(_second_process(app))
+
+    etag = tutor_client.get('/api/tutor/students').headers['ETag']
+    assert tutor_client.get('/api/tutor/students', headers={'If-None-Match': etag}).status_code == 304
+
+    assert other.post('/api/tutor/create-student', json=STUDENT).status_code == 200
+
+    response = tutor_client.get('/api/tutor/students', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [student['username'] for student in response.get_json()['students']] == ['ivanov']
+
+
+def test_schedule_index_sees_other_process_bookings(app, tutor_client):
+    other = _login(_second_process(app))
+    candidate = {'candidates': [{'day_of_week': 'monday', 'start_time': '10:30'}]}
+
+    # Индекс этого процесса построен до записи в соседнем
+    assert tutor_client.post('/api/tutor/schedule/check', json=candidate).get_json()['results'][0]['ok']
+    assert other.post('/api/tutor/create-student', json=STUDENT).status_code == 200
+
+    result = tutor_client.post('/api/tutor/schedule/check', json=candidate).get_json()['results'][0]
+    assert not result['ok'] and len(result['conflicts']) == 1
+
+
+def test_unchanged_data_gets_per_database_epoch(app, tmp_path):
+    db = app.extensions['tutor']['db']
+    other = create_app(Config(db_path=str(tmp_path / 'recreated.db'), upload_folder=str(tmp_path), testing=True))
+    other_db = other.extensions['tutor']['db']
+
+    version = db.get_data_version(1, 'students')
+    assert version != 0
+    assert version == db.get_data_version(1, 'materials')
+    assert version != other_db.get_data_version(1, 'students')
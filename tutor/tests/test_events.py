@@ -0,0 +1,44 @@
+from app import create_app
+from config import Config
+
+
+def test_closing_event_stream_unsubscribes(app, tutor_client):
+    bus = app.extensions['tutor']['event_bus']
+
+    response = tutor_client.get('/api/events', buffered=False)
+    assert response.status_code == 200
+    assert next(iter(response.response)) == b"retry: 5000\n\n"
+    assert bus.subscriber_count() == 1
+
+    response.close()
+    assert bus.subscriber_count() == 0
+
+
+def test_unread_event_stream_unsubscribes_on_close(app, tutor_client):
+    bus = app.extensions['tutor']['event_bus']
+
+    response = tutor_client.get('/api/events', buffered=False)
+    assert bus.subscriber_count() == 1
+
+    # Клиент отключился до первого события: генератор потока так и не запускался
+    response.close()
+    assert bus.subscriber_count() == 0
+
+
+def test_events_from_other_process_reach_subscribers(app, tutor_client):
+    other = create_app(Config(db_path=app.extensions['tutor']['db'].db_path,
+                              upload_folder=app.config['UPLOAD_FOLDER'], testing=True))
+    bus = app.extensions['tutor']['event_bus']
+    log = app.extensions['tutor']['event_log']
+    log.poll()
+    subscription = bus.subscribe(1)
+
+    other.extensions['tutor']['event_bus'].publish(1, 'material_deleted', {'material_id': 7})
+    assert log.poll() == 1
+    assert subscription.get(timeout=0) == ('material_deleted', {'material_id': 7})
+
+    # Свои публикации из журнала повторно не доставляются
+    bus.publish(1, 'material_uploaded', {'material_id': 8})
+    assert log.poll() == 0
+    assert subscription.get(timeout=0) == ('material_uploaded', {'material_id': 8})
+    assert subscription.get(timeout=0) is None
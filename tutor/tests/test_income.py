@@ -0,0 +1,21 @@
+def test_batch_inserts_valid_lessons_and_reports_bad_ones(tutor_client):
+    lessons = [
+        {'key': '2026-01-05-1', 'date': '2026-01-05', 'schedule_id': 1, 'price': 1500},
+        {'key': 'bad-date', 'date': 20260105},
+        {'key': '2026-01-12-1', 'date': '2026-01-12', 'schedule_id': 1, 'price': 1500, 'status': 'lost'},
+    ]
+    response = tutor_client.post('/api/income-lessons/batch', json={'lessons': lessons})
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['inserted'] == 1 and list(data['lessons']) == ['2026-01-05-1']
+    assert [(error['index'], error['key']) for error in data['errors']] == [(1, 'bad-date'), (2, '2026-01-12-1')]
+
+    # Повтор той же пачки: корректное занятие — повтор, некорректные снова в errors
+    data = tutor_client.post('/api/income-lessons/batch', json={'lessons': lessons}).get_json()
+    assert data['inserted'] == 0 and data['duplicates'] == 1 and len(data['errors']) == 2
+
+
+def test_batch_of_only_bad_lessons_is_rejected(tutor_client):
+    response = tutor_client.post('/api/income-lessons/batch', json={'lessons': [{'key': 'x', 'date': None}]})
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [{'index': 0, 'key': 'x', 'message': 'date должен быть в формате YYYY-MM-DD'}]
@@ -0,0 +1,56 @@
+from llm import llm_client
+
+
+class FakeStream:
+    """Потоковый ответ LM Studio: строки SSE по заданным фрагментам"""
+    status_code = 200
+    ok = True
+    headers = {}
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+def test_stream_skips_chunks_without_choices(monkeypatch):
+    lines = [
+        b'data: {"choices": [{"delta": {"content": "1. Sum"}}]}',
+        b'data: {"choices": [], "usage": {"total_tokens": 5}}',
+        b'data: {"choices": [{"delta": {}}]}',
+        b'data: {"choices": [{"delta": {"content": "?"}}]}',
+        b'data: [DONE]',
+    ]
+    monkeypatch.setattr(llm_client, '_post', lambda *args, **kwargs: FakeStream(lines))
+
+    events = list(llm_client.stream_test_from_text('Короткий материал', use_cache=False))
+    assert events == [('delta', '1. Sum'), ('delta', '?'), ('done', '1. Sum?')]
+
+
+def test_chunked_stream_reports_progress_per_chunk(monkeypatch):
+    answer = "1. Вопрос {n}?\nA) да\nB) нет\nПравильный ответ: A"
+    calls = []
+
+    def complete(prompt, policy):
+        calls.append(prompt)
+        return answer.format(n=len(calls))
+
+    monkeypatch.setattr(llm_client, 'request_completion', complete)
+    material = '\n\n'.join(f'Абзац {i}. ' + 'Текст материала. ' * 60 for i in range(20))
+
+    events = list(llm_client.stream_test_from_text(material, use_cache=False))
+    progress = [data for kind, data in events if kind == 'progress']
+    total = len(calls)
+    assert total > 1
+    assert progress == [{'done': done, 'total': total} for done in range(total + 1)]
+    assert events[-1][0] == 'done'
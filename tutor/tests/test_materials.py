@@ -0,0 +1,16 @@
+def test_download_stats_keep_materials_etag_and_feed_quiet(app, tutor_client):
+    db = app.extensions['tutor']['db']
+    with db.connection() as connection:
+        material_id = connection.execute("""
+            INSERT INTO materials (tutor_id, title, file_type, file_path) VALUES (1, 'Конспект', 'pdf', 'a.pdf')
+        """).lastrowid
+    etag = tutor_client.get('/api/materials').headers['ETag']
+    subscription = app.extensions['tutor']['event_bus'].subscribe(1)
+
+    assert tutor_client.post(f'/api/materials/{material_id}/download-stats').status_code == 200
+    assert tutor_client.get('/api/materials', headers={'If-None-Match': etag}).status_code == 304
+    assert subscription.get(timeout=0) is None
+
+    with db.connection() as connection:
+        connection.execute("UPDATE materials SET title = 'Новый конспект' WHERE id = ?", (material_id,))
+    assert tutor_client.get('/api/materials', headers={'If-None-Match': etag}).status_code == 200
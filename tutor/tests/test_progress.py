@@ -0,0 +1,23 @@
+def test_migration_backfills_progress_summary(app):
+    db = app.extensions['tutor']['db']
+    student_id = db.create_student('ivanov', 'p', 'Иван', 'Иванов', 1, 'c', 'oge', 1500, 'monday', '10:00')
+    with db.connection() as connection:
+        topic_id = connection.execute("SELECT id FROM topics").fetchone()[0]
+        other_topic = connection.execute(
+            "INSERT INTO topics (title, created_by) VALUES ('Вторая', 1)").lastrowid
+        # База до триггеров: оценки есть, итогов по темам и сводной строки нет
+        connection.execute("DROP TRIGGER trg_student_progress_insert")
+        connection.executemany("""
+            INSERT INTO student_progress (student_id, topic_id, test_score, tutor_feedback_score, overall_progress)
+            VALUES (?, ?, ?, ?, 0)
+        """, [(student_id, topic_id, 80, 5), (student_id, other_topic, 50, None)])
+        connection.execute("PRAGMA user_version = 5")
+    assert db.calculate_student_progress(student_id) == 0
+
+    assert 6 in db.migrate()
+    # (0.7 * 80 + 0.3 * 100 = 86, 50) -> 68
+    assert db.calculate_student_progress(student_id) == 68
+
+    # Обновление оценки теперь попадает в сводку
+    db.record_progress(student_id, other_topic, test_score=90)
+    assert db.calculate_student_progress(student_id) == 88
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from database.database import Database, ScheduleConflict
+
+
+def _create(db, username, lesson_time):
+    return db.create_student(username, 'p', 'Иван', 'Иванов', 1, 'c', 'oge', 1500, 'monday', lesson_time)
+
+
+def test_create_student_rejects_overlap_inside_transaction(app):
+    db = app.extensions['tutor']['db']
+    first = _create(db, 'first', '10:00')
+
+    with pytest.raises(ScheduleConflict) as error:
+        _create(db, 'second', '10:30')
+    assert error.value.conflicts == [db.get_tutor_schedule(1)[0]['id']]
+
+    # Откат всей транзакции: ни ученика, ни темы от неудачной попытки
+    with db.connection() as connection:
+        assert connection.execute("SELECT COUNT(*) FROM users WHERE username = 'second'").fetchone()[0] == 0
+        assert connection.execute("SELECT COUNT(*) FROM topics").fetchone()[0] == 1
+
+    assert first and _create(db, 'third', '11:00')
+
+
+def test_create_student_route_reports_conflict(app, tutor_client):
+    student = {
+        'last_name': 'Иванов', 'first_name': 'Иван', 'birth_date': '2010-01-01', 'exam_type': 'oge',
+        'username': 'ivanov', 'password': 'p', 'lesson_price': 1500,
+        'day_of_week': 'monday', 'lesson_time': '10:00',
+    }
+    assert tutor_client.post('/api/tutor/create-student', json=student).status_code == 200
+
+    response = tutor_client.post('/api/tutor/create-student', json=dict(student, username='petrov', lesson_time='10:45'))
+    assert response.status_code == 409
+    assert len(response.get_json()['conflicts']) == 1
+
+
+def test_concurrent_overlapping_bookings_keep_one(app):
+    db_path = app.extensions['tutor']['db'].db_path
+    barrier = threading.Barrier(4)
+    results = []
+
+    def book(i):
+        # Свое соединение у каждого потока — как у запросов в разных процессах
+        db = Database(db_path)
+        barrier.wait()
+        try:
+            results.append(_create(db, f'student{i}', '10:00'))
+        except ScheduleConflict:
+            results.append('conflict')
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count('conflict') == 3
+    assert len(app.extensions['tutor']['db'].get_tutor_schedule(1)) == 1
+
+
+def test_lessons_must_end_before_midnight(app, tutor_client):
+    db = app.extensions['tutor']['db']
+    student = {
+        'last_name': 'Иванов', 'first_name': 'Иван', 'birth_date': '2010-01-01', 'exam_type': 'oge',
+        'username': 'late', 'password': 'p', 'lesson_price': 1500, 'day_of_week': 'monday',
+    }
+    for lesson_time in ('23:30', '23:01', '24:00'):
+        response = tutor_client.post('/api/tutor/create-student', json=dict(student, lesson_time=lesson_time))
+        assert response.status_code == 400, lesson_time
+    with pytest.raises(ValueError):
+        _create(db, 'late', '23:30')
+
+    response = tutor_client.post('/api/tutor/create-student', json=dict(student, lesson_time='23:00'))
+    assert response.status_code == 200
+    assert db.get_tutor_schedule(1)[0]['end_time'] == '24:00'
+    assert tutor_client.post('/api/tutor/create-student',
+                             json=dict(student, username='earlier', lesson_time='22:30')).status_code == 409
+
+
+def test_lessons_stored_across_midnight_still_conflict(app):
+    db = app.extensions['tutor']['db']
+    _create(db, 'first', '10:00')
+    # Так сохранялось занятие в 23:30 до проверки полуночи: конец раньше начала
+    with db.connection() as connection:
+        connection.execute("UPDATE schedule SET start_time = '23:30', end_time = '00:30'")
+
+    with pytest.raises(ScheduleConflict):
+        _create(db, 'same-evening', '22:45')
+    with pytest.raises(ScheduleConflict):
+        db.create_student('next-morning', 'p', 'Иван', 'Иванов', 1, 'c', 'oge', 1500, 'tuesday', '00:00')
+    assert _create(db, 'before', '22:30')
+
+    index = app.extensions['tutor']['schedule_index']
+    assert index.conflicts(1, 1, 23 * 60 + 45, 24 * 60)
+    assert index.conflicts(1, 2, 0, 60)
+    assert not index.conflicts(1, 2, 30, 90)
+
+
+def test_schedule_check_reports_errors_per_candidate(tutor_client):
+    candidates = [
+        {'day_of_week': 'monday', 'start_time': '11:00', 'end_time': '10:00'},
+        {'day_of_week': 'monday', 'start_time': '10:00', 'exclude_schedule_id': 'abc'},
+        {'day_of_week': 'monday', 'start_time': '23:30'},
+        {'day_of_week': 'monday', 'start_time': '23:00', 'end_time': '24:00'},
+        {'day_of_week': 'noday', 'start_time': '10:00'},
+    ]
+    response = tutor_client.post('/api/tutor/schedule/check', json={'candidates': candidates})
+    assert response.status_code == 200
+    assert [result['ok'] for result in response.get_json()['results']] == [False, False, False, True, False]
+    assert all('error' in result for result in response.get_json()['results'] if not result['ok'])
@@ -1,7 +1,6 @@
 // timetable.js — динамическое расписание + журнал уроков
 
 let currentDate = new Date();
-const DOW = ['monday','tuesday','wednesday','thursday','friday','saturday','sunday'];
 const RU_DOW = ['Понедельник','Вторник','Среда','Четверг','Пятница','Суббота','Воскресенье'];
 
 const STORAGE_KEY = 'tutor_lessons_history_v1';
@@ -18,11 +17,6 @@ function fmtDateTitle(d){
   return `${dow}, ${dd} ${month} ${year} г.`;
 }
 
-function toDowName(d){
-  const js = d.getDay();
-  return DOW[(js + 6) % 7];
-}
-
 function isoDate(d){
   const y = d.getFullYear();
   const m = pad(d.getMonth()+1);
@@ -50,6 +44,38 @@ function saveLessonsToStorage(list){
   }
 }
 
+// ---------- занятия по датам ----------
+
+// Занятия загружаются сразу на неделю (понедельник–воскресенье) и берутся из кэша,
+// пока навигация по дням не выйдет за пределы загруженной недели.
+let occurrenceWeek = { from: null, to: null, byDate: {} };
+
+function weekBounds(d){
+  const monday = new Date(d);
+  monday.setDate(d.getDate() - (d.getDay() + 6) % 7);
+  const sunday = new Date(monday);
+  sunday.setDate(monday.getDate() + 6);
+  return { from: isoDate(monday), to: isoDate(sunday) };
+}
+
+async function loadOccurrencesForDate(dateStr){
+  if (occurrenceWeek.from && occurrenceWeek.from <= dateStr && dateStr <= occurrenceWeek.to) {
+    return occurrenceWeek.byDate[dateStr] || [];
+  }
+
+  const { from, to } = weekBounds(currentDate);
+  const res = await fetch(`/api/schedule/occurrences?from=${from}&to=${to}`, {credentials:'same-origin'});
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const data = await res.json();
+
+  const byDate = {};
+  (data.occurrences || []).forEach(o => {
+    (byDate[o.date] = byDate[o.date] || []).push(o);
+  });
+  occurrenceWeek = { from: data.from, to: data.to, byDate };
+  return byDate[dateStr] || [];
+}
+
 // ---------- расписание на день ----------
 
 async function loadScheduleForCurrentDay(){
@@ -63,15 +89,8 @@ async function loadScheduleForCurrentDay(){
   body.innerHTML = `<tr><td colspan="3" style="padding:16px;">Загрузка…</td></tr>`;
 
   try {
-    const res = await fetch('/api/schedule', {credentials:'same-origin'});
-    if (!res.ok) throw new Error(`HTTP ${res.status}`);
-    const data = await res.json();
-    const all = data.schedule || [];
-
-    const dow = toDowName(currentDate);
-    const items = all
-      .filter(s => (s.day_of_week || '').toLowerCase() === dow)
-      .sort((a,b) => (a.start_time > b.start_time ? 1 : -1));
+    // сервер уже отдает занятия дня, отсортированные по времени
+    const items = await loadOccurrencesForDate(isoDate(currentDate));
 
     if (items.length === 0) {
       body.innerHTML = `<tr><td colspan="3" style="padding:16px;">Нет занятий на выбранный день</td></tr>`;
@@ -110,7 +129,8 @@ async function loadScheduleForCurrentDay(){
               <div class="lesson-actions">
                 <button
                   class="btn-small btn-start lesson-state-btn"
-                  data-schedule-id="${s.id}"
+                  data-schedule-id="${s.schedule_id}"
+                  data-completed="${s.completed ? '1' : ''}"
                   data-student="${fullName}"
                   data-exam="${examType}"
                   data-price="${price}"
@@ -142,8 +162,8 @@ function attachLessonButtons(dateStr){
     const key = `${dateStr}-${scheduleId}`;
     const record = lessons.find(l => l.key === key);
 
-    // если урок уже проведен — сразу показываем "Проведен"
-    if (record) {
+    // если урок уже проведен (в журнале или по данным сервера) — сразу показываем "Проведен"
+    if (record || btn.dataset.completed) {
       setButtonDone(btn);
     } else {
       btn.dataset.state = 'idle';
@@ -199,39 +219,108 @@ function saveFinishedLessonFromButton(btn) {
         exam: btn.dataset.exam || "",
         price: Number(btn.dataset.price || 0),
         time: btn.dataset.time || "",
-        status: "pending"
+        status: "pending",
+        synced: false
     };
 
     lessons.push(lessonObj);
     saveLessonsToStorage(lessons);
 
-    // ---- отправка в БД ----
-    fetch("/api/income-lessons", {
+    // ---- отправка в БД (вместе с накопленными без сети уроками) ----
+    syncLessonBacklog();
+}
+
+// ---------- синхронизация журнала с БД ----------
+
+// Уроки с synced === false уходят порциями не больше SYNC_BATCH_SIZE; сервер игнорирует уже
+// записанные ключи, поэтому повтор после потерянного ответа не создает дублей.
+// Записи старого формата (без поля synced) уже отправлялись по одной — их не трогаем.
+// Урок, который сервер отклонил как некорректный, помечается rejected и больше не отправляется.
+const SYNC_BATCH_SIZE = 500; // INCOME_BATCH_LIMIT на сервере
+
+let syncInFlight = null;
+let syncAgain = false;
+
+// Отправка одной порции; true — можно отправлять следующую
+function sendLessonSlice(slice) {
+    return fetch("/api/income-lessons/batch", {
         method: "POST",
         headers: {
             "Content-Type": "application/json"
         },
         body: JSON.stringify({
-            date: lessonObj.date,
-            student: lessonObj.student,
-            exam: lessonObj.exam,
-            price: lessonObj.price,
-            status: "pending"
+            lessons: slice.map(l => ({
+                key: l.key,
+                date: l.date,
+                schedule_id: l.schedule_id,
+                student: l.student,
+                exam: l.exam,
+                price: l.price,
+                status: l.status || "pending"
+            }))
         })
     })
         .then(r => r.json())
         .then(data => {
-            if (data.success) {
-                console.log("💾 Урок добавлен в БД:", data.lesson_id);
-            } else {
+            const rejected = {};
+            (data.errors || []).forEach(e => {
+                if (e.key) rejected[e.key] = e.message;
+            });
+            if (!data.success && Object.keys(rejected).length === 0) {
                 console.error("❌ Ошибка записи в БД:", data.message);
+                return false;
             }
-        })
+            // Отмечаем подтвержденные и отклоненные сервером ключи (журнал мог измениться за время запроса)
+            const confirmed = data.lessons || {};
+            const lessons = loadLessonsFromStorage();
+            lessons.forEach(l => {
+                if (l.key in confirmed) l.synced = true;
+                else if (l.key in rejected) l.rejected = rejected[l.key];
+            });
+            saveLessonsToStorage(lessons);
+            if (Object.keys(rejected).length) {
+                console.warn("⚠️ Сервер отклонил уроки:", rejected);
+            }
+            if (data.success) {
+                console.log(`💾 Уроки синхронизированы с БД: новых ${data.inserted}, повторов ${data.duplicates}`);
+            }
+            return true;
+        });
+}
+
+function syncLessonBacklog() {
+    if (syncInFlight) {
+        // Урок завершили во время отправки — дошлем его сразу после текущего запроса
+        syncAgain = true;
+        return syncInFlight;
+    }
+
+    const pending = loadLessonsFromStorage().filter(l => l.synced === false && !l.rejected);
+    if (pending.length === 0) return Promise.resolve();
+
+    const slices = [];
+    for (let i = 0; i < pending.length; i += SYNC_BATCH_SIZE) {
+        slices.push(pending.slice(i, i + SYNC_BATCH_SIZE));
+    }
+
+    // Порции идут по очереди; сбой сервера останавливает отправку до следующей попытки
+    syncInFlight = slices
+        .reduce((chain, slice) => chain.then(ok => ok ? sendLessonSlice(slice) : false), Promise.resolve(true))
         .catch(err => {
-            console.error("❌ Ошибка сети:", err);
+            console.error("❌ Ошибка сети, уроки будут отправлены позже:", err);
+        })
+        .finally(() => {
+            syncInFlight = null;
+            if (syncAgain) {
+                syncAgain = false;
+                syncLessonBacklog();
+            }
         });
+    return syncInFlight;
 }
 
+window.addEventListener('online', syncLessonBacklog);
+
 
 
 // ---------- навигация по дням ----------
@@ -250,7 +339,10 @@ window.nextDay = function(){
 document.addEventListener('DOMContentLoaded', () => {
   fetch('/api/check-auth')
     .then(r => r.json())
-    .then(j => j.authenticated ? loadScheduleForCurrentDay()
-                                : window.location.assign('/cabinet'))
+    .then(j => {
+      if (!j.authenticated) return window.location.assign('/cabinet');
+      loadScheduleForCurrentDay();
+      syncLessonBacklog();
+    })
     .catch(() => loadScheduleForCurrentDay());
 });
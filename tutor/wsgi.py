@@ -0,0 +1,28 @@
+"""
+Точка входа для WSGI-сервера с несколькими процессами. Настройки gunicorn —
+в gunicorn.conf.py рядом, он подхватывается автоматически:
+
+    gunicorn wsgi:app
+
+что равносильно
+
+    gunicorn -k gthread -w 4 --threads 8 -b 0.0.0.0:8000 wsgi:app
+
+Воркер должен быть потоковым (-k gthread): лента /api/events и потоковая генерация
+/api/tests/stream держат соединение открытым, и синхронный воркер (по умолчанию)
+был бы занят ими целиком. --threads ограничивает число одновременных соединений
+процесса, включая открытые ленты.
+
+Настройки приложения — переменные окружения TUTOR_* (см. config.py); TUTOR_SECRET_KEY
+обязателен. Каждый процесс создает приложение сам, поэтому --preload не нужен:
+соединения SQLite и фоновые потоки не переживают fork. Миграции процессы выполняют
+по очереди под файловой блокировкой.
+
+Общее для процессов состояние хранится в базе: версии данных для ETag, расписание для
+проверки пересечений и журнал событий ленты. Свои у каждого процесса только кэш сессий
+(не дольше TUTOR_SESSION_CACHE_TTL секунд) и метрики /metrics.
+"""
+from app import create_app
+from config import Config
+
+app = create_app(Config.from_env())